@@ -13,9 +13,9 @@ Created on Thu Mar 26 17:07:35 2015
 """
 
 #!/usr/bin/python
-import gdal, ogr, osr, numpy
 import csv
 import pandas
+import LSDPlottingTools as LSDP
 #from shapely.wkb import loads
 #from shapely.ops import cascaded_union
 
@@ -33,81 +33,6 @@ paramch = 'seism'
 DataDirectory ="/exports/csce/datastore/geos/users/mharel/Topo_Data/general/New_zone_ref/zone"+str(zonenb)+"/"
 print DataDirectory
 
-def proc():
-                
-        # Each process needs its own pointer.
-        shape = ogr.Open(input_zone_polygon)
-        lyr = shape.GetLayer()
-        raster = gdal.Open(input_value_raster)
-        xmin, xmax, ymin, ymax = lyr.GetExtent()
-        #print "Extent : ", lyr.GetExtent()
-#        # Get extent of feat
-#        geom = feat.GetGeometryRef()
-#        if (geom.GetGeometryName() == 'MULTIPOLYGON'):
-#            count = 0
-#            pointsX = []; pointsY = []
-#            for polygon in geom:
-#                geomInner = geom.GetGeometryRef(count)    
-#                ring = geomInner.GetGeometryRef(0)
-#                numpoints = ring.GetPointCount()
-#                for p in range(numpoints):
-#                        lon, lat, z = ring.GetPoint(p)
-#                        pointsX.append(lon)
-#                        pointsY.append(lat)    
-#                count += 1
-#        elif (geom.GetGeometryName() == 'POLYGON'):
-#            ring = geom.GetGeometryRef(0)
-#            numpoints = ring.GetPointCount()
-#            pointsX = []; pointsY = []
-#            for p in range(numpoints):
-#                    lon, lat, z = ring.GetPoint(p)
-#                    pointsX.append(lon)
-#                    pointsY.append(lat)
-#        else:
-#            sys.exit()
-#    
-#        xmin = min(pointsX)
-#        xmax = max(pointsX)
-#        ymin = min(pointsY)
-#        ymax = max(pointsY)
-        
-#        print geom.GetGeometryName()
-        # Specify offset and rows and columns to read
-        xoff = int((xmin - xOrigin)/pixelWidth)
-        yoff = int((yOrigin - ymax)/pixelWidth)
-        xcount = int((xmax - xmin)/pixelWidth)+1
-        ycount = int((ymax - ymin)/pixelWidth)+1
-                
-        # Create memory target raster
-        target_ds = gdal.GetDriverByName('MEM').Create('', xcount, ycount, gdal.GDT_Byte)
-        target_ds.SetGeoTransform((
-            xmin, pixelWidth, 0,
-            ymax, 0, pixelHeight,
-        ))
-        # Create for target raster the same projection as for the value raster
-        raster_srs = osr.SpatialReference()
-        raster_srs.ImportFromWkt(raster.GetProjectionRef())
-        target_ds.SetProjection(raster_srs.ExportToWkt())
-    
-        # Rasterize zone polygon to raster
-        gdal.RasterizeLayer(target_ds, [1], lyr, burn_values=[1])
-        # Read raster as arrays
-        banddataraster = raster.GetRasterBand(1)
-        # error here        
-        dataraster = banddataraster.ReadAsArray(xoff, yoff, xcount, ycount).astype(numpy.float)
-        bandmask = target_ds.GetRasterBand(1)
-        datamask = bandmask.ReadAsArray(0, 0, xcount, ycount).astype(numpy.float)
-
-        # Mask zone of raster
-        zoneraster = numpy.ma.masked_array(dataraster,  numpy.logical_not(datamask))
-
-        # Calculate statistics of zonal raster
-        value = numpy.mean(zoneraster)
-
-        print value
-        return value
-
-
 resu = []  # Empty list to store the results 
 # Extract junction numbers for this zone
 #data = pandas.read_csv('/home/mharel/LSDVisu_work/compil-data-MAH.csv')
@@ -127,30 +52,15 @@ for junct in datazon['Junction']:
 
     # Vector dataset(zones)
     input_zone_polygon = DataDirectory+"shape_"+str(junction)+".shp"
-     
-    # Open data
-    rast = gdal.Open(input_value_raster)
-    print rast.RasterXSize, rast.RasterYSize
-    shp = ogr.Open(input_zone_polygon)
 
-    if shp is None:
-        raise IOError('Could not open file ' + str(input_zone_polygon))
-
-    # Get raster georeference info
-    transform = rast.GetGeoTransform()
-    xOrigin = transform[0]
-    yOrigin = transform[3]
-    pixelWidth = transform[1]
-    pixelHeight = transform[5]
-             
-    # Start the processes
-    layer = shp.GetLayer()
-    featList = range(layer.GetFeatureCount())
-    #print "Number of features = " +str(featList)
-               
-    #pool = Pool(processes=24)   
-    #value = pool.map(proc,0,8)
-    value = proc()
+    # Average the raster over the basin. Only the window of the raster covering the basin is read.
+    zone_stats = LSDP.ZonalStatisticsFromPolygons(input_zone_polygon, input_value_raster, value_names = [paramch], statistics = ["mean"], n_processes = 1)
+    if len(zone_stats) == 0:
+        # the shapefile has no polygon for this basin, or it is outside the raster
+        print "I found no basin in "+input_zone_polygon+" over "+input_value_raster+", the value is NaN"
+        value = float('nan')
+    else:
+        value = zone_stats[paramch+"_mean"].iloc[0]
     resu.append([value])
     print "value = " +str(value)
     
@@ -369,6 +369,203 @@ def GetTicksForUTMNoInversion(FileName,x_max,x_min,y_max,y_min,n_target_tics):
 #==============================================================================
 
 
+#=============================================================================
+# CSV CACHE
+# The LSDTopoTools csv outputs are read many times (e.g. the fullstats csv
+# for every m/n value), so we keep a columnar binary copy of each csv and read
+# that instead. The copy is a single .npz file in CSVCacheDirectory, named
+# from a hash of the path of the csv, holding one array per column, the column
+# names and the size and modification time of the csv it was built from.
+# Nothing is written next to the csv files, so the data directories are left
+# alone. The least recently used copies are deleted when the cache is bigger
+# than CSVCacheMaxBytes. The directory can also be set with the environment
+# variable LSDMT_CSV_CACHE.
+#=============================================================================
+CSVCacheEnabled = True
+CSVCacheDirectory = os.environ.get("LSDMT_CSV_CACHE",
+                                   os.path.join(os.path.expanduser("~"), ".lsdmappingtools", "csv_cache"))
+CSVCacheMaxBytes = 2*1024**3
+
+def _GetCSVFileStamp(csv_path):
+    """
+    This gets the size and modification time of a csv file. The binary copy
+    is only used if these match the values recorded when it was written.
+
+    Args:
+        csv_path (str): the full path to the csv file
+
+    Returns:
+        list with the size in bytes and the modification time
+    """
+    file_stat = os.stat(csv_path)
+    return [int(file_stat.st_size), float(file_stat.st_mtime)]
+
+def GetCSVCacheFileName(csv_path):
+    """
+    This returns the name of the file holding the binary copy of a csv.
+
+    Args:
+        csv_path (str): the full path to the csv file
+
+    Returns:
+        the name of the file in the cache directory
+    """
+    import hashlib
+
+    key = os.path.abspath(csv_path)
+    if not isinstance(key, bytes):
+        key = key.encode("utf-8")
+    return os.path.join(CSVCacheDirectory, "csv_"+hashlib.sha1(key).hexdigest()+".npz")
+
+def _ReadCSVCache(csv_path, stamp):
+    """
+    This loads the binary copy of a csv file if it is up to date.
+
+    Args:
+        csv_path (str): the full path to the csv file
+        stamp (list): the size and modification time of the csv
+
+    Returns:
+        pandas dataframe, or None if there is no valid binary copy
+    """
+    import numpy as np
+
+    cache_file = GetCSVCacheFileName(csv_path)
+    if not os.path.isfile(cache_file):
+        return None
+
+    try:
+        stored = np.load(cache_file, allow_pickle=False)
+        try:
+            if stored["stamp"].tolist() != [float(x) for x in stamp]:
+                return None
+            column_names = stored["columns"].tolist()
+            dtypes = stored["dtypes"].tolist()
+            columns = []
+            for i, dtype_str in enumerate(dtypes):
+                this_column = stored["col%i" % i]
+                # strings are stored as fixed width arrays: pandas wants objects
+                if dtype_str == "object":
+                    this_column = this_column.astype(object)
+                columns.append(this_column)
+        finally:
+            stored.close()
+        os.utime(cache_file, None)
+    except (IOError, OSError, ValueError, KeyError):
+        return None
+
+    df = pd.DataFrame(dict(zip(range(len(columns)), columns)), columns = range(len(columns)))
+    df.columns = column_names
+    return df
+
+def _WriteCSVCache(csv_path, stamp, df):
+    """
+    This writes the binary copy of a csv file and then removes the least
+    recently used copies until the cache is no bigger than CSVCacheMaxBytes.
+    Columns that cannot be stored with an explicit dtype (e.g. strings mixed
+    with missing values) mean the csv is not cached at all. The copy is written
+    to a temporary file and renamed, so a half written copy is never read.
+
+    Args:
+        csv_path (str): the full path to the csv file
+        stamp (list): the size and modification time of the csv
+        df (pandas dataframe): the dataframe read from the csv
+
+    Returns:
+        True if the copy was written
+    """
+    import numpy as np
+
+    arrays = {}
+    dtypes = []
+    for i, col in enumerate(df.columns):
+        this_column = np.asarray(df[col].values)
+        if this_column.dtype.kind == "O":
+            if not all(isinstance(value, str) for value in this_column):
+                return False
+            arrays["col%i" % i] = this_column.astype(str)
+            dtypes.append("object")
+        else:
+            arrays["col%i" % i] = np.ascontiguousarray(this_column)
+            dtypes.append(str(this_column.dtype))
+
+    cache_file = GetCSVCacheFileName(csv_path)
+    tmp_file = cache_file+".tmp%i.npz" % os.getpid()
+    try:
+        if not os.path.isdir(CSVCacheDirectory):
+            os.makedirs(CSVCacheDirectory)
+        np.savez(tmp_file, stamp = np.array(stamp, dtype = np.float64),
+                 columns = np.array([str(c) for c in df.columns]), dtypes = np.array(dtypes), **arrays)
+        if os.path.isfile(cache_file):
+            os.remove(cache_file)
+        os.rename(tmp_file, cache_file)
+    except (IOError, OSError):
+        print("I couldn't write the binary copy of "+csv_path+", I'll just read the csv.")
+        if os.path.isfile(tmp_file):
+            os.remove(tmp_file)
+        return False
+
+    # evict the least recently used copies
+    cached_files = []
+    for fname in os.listdir(CSVCacheDirectory):
+        if fname.startswith("csv_") and fname.endswith(".npz") and ".tmp" not in fname:
+            full_name = os.path.join(CSVCacheDirectory, fname)
+            file_stat = os.stat(full_name)
+            cached_files.append((file_stat.st_mtime, file_stat.st_size, full_name))
+    total_bytes = sum(f[1] for f in cached_files)
+    for mtime, size, full_name in sorted(cached_files):
+        if total_bytes <= CSVCacheMaxBytes or full_name == cache_file:
+            break
+        try:
+            os.remove(full_name)
+            total_bytes -= size
+        except OSError:
+            pass
+
+    return True
+
+def ReadCSVCached(csv_path):
+    """
+    This is a drop in replacement for pd.read_csv(csv_path). The first time
+    a csv is read it is also stored as a columnar binary copy in the csv cache;
+    on later reads the copy is loaded instead of parsing the csv. The copy is
+    rebuilt whenever the size or modification time of the csv changes. Set
+    CSVCacheEnabled = False to always read the csv.
+
+    Args:
+        csv_path (str): the full path to the csv file
+
+    Returns:
+        pandas dataframe with the csv file
+    """
+    if not CSVCacheEnabled or not os.path.isfile(csv_path):
+        return pd.read_csv(csv_path)
+
+    stamp = _GetCSVFileStamp(csv_path)
+    df = _ReadCSVCache(csv_path, stamp)
+    if df is None:
+        df = pd.read_csv(csv_path)
+        _WriteCSVCache(csv_path, stamp, df)
+    return df
+
+def ClearCSVCache(csv_path = None):
+    """
+    This deletes the binary copy of a csv file, or every copy in the cache.
+
+    Args:
+        csv_path (str): the full path to the csv file. If None the whole cache is emptied.
+    """
+    if csv_path is not None:
+        cache_files = [GetCSVCacheFileName(csv_path)]
+    elif os.path.isdir(CSVCacheDirectory):
+        cache_files = [os.path.join(CSVCacheDirectory, fname) for fname in os.listdir(CSVCacheDirectory)
+                       if fname.startswith("csv_") and fname.endswith(".npz")]
+    else:
+        cache_files = []
+    for cache_file in cache_files:
+        if os.path.isfile(cache_file):
+            os.remove(cache_file)
+
 #=============================================================================
 # CSV READERS
 # Read in the csv files to pandas dataframes
@@ -391,7 +588,7 @@ def ReadBaselevelKeysCSV(DataDirectory, fname_prefix):
     baselevel_suffix = '_BaselevelKeys.csv'
     fname = fname_prefix+baselevel_suffix
     # read in the dataframe using pandas
-    df = pd.read_csv(DataDirectory+fname)
+    df = ReadCSVCached(DataDirectory+fname)
 
     return df
 
@@ -413,7 +610,7 @@ def ReadSourceKeysCSV(DataDirectory, fname_prefix):
     source_keys_suffix = '_SourceKeys.csv'
     fname = fname_prefix+source_keys_suffix
     # read in the dataframe using pandas
-    df = pd.read_csv(DataDirectory+fname)
+    df = ReadCSVCached(DataDirectory+fname)
 
     return df
 
@@ -435,7 +632,7 @@ def ReadBasinInfoCSV(DataDirectory, fname_prefix):
     basin_suffix = '_AllBasinsInfo.csv'
     fname = fname_prefix+basin_suffix
     # read in the dataframe using pandas
-    df = pd.read_csv(DataDirectory+fname)
+    df = ReadCSVCached(DataDirectory+fname)
 
     return df
 
@@ -458,7 +655,7 @@ def ReadFullStatsCSV(DataDirectory, fname_prefix, m_over_n):
     fullstats_suffix = '_movernstats_%s_fullstats.csv' %str(m_over_n)
     fname = fname_prefix+fullstats_suffix
     # read in the dataframe using pandas
-    df = pd.read_csv(DataDirectory+fname)
+    df = ReadCSVCached(DataDirectory+fname)
 
     return df
 
@@ -487,7 +684,7 @@ def ReadChiProfileCSV(DataDirectory, fname_prefix):
         fname = fname_prefix+'_movern.csv'
 
     # read in the dataframe using pandas
-    df = pd.read_csv(DataDirectory+fname)
+    df = ReadCSVCached(DataDirectory+fname)
     return df
 
 def ReadBasinStatsCSV(DataDirectory, fname_prefix):
@@ -508,7 +705,7 @@ def ReadBasinStatsCSV(DataDirectory, fname_prefix):
     basin_stats_suffix = '_movernstats_basinstats.csv'
     fname = fname_prefix+basin_stats_suffix
     # read in the dataframe using pandas
-    df = pd.read_csv(DataDirectory+fname)
+    df = ReadCSVCached(DataDirectory+fname)
 
     return df
     
@@ -530,21 +727,9 @@ def AppendBasinStatsCSVs(DataDirectory):
     # get the csv filename
     basin_stats_suffix = '_movernstats_basinstats.csv'
     
-    # decclare empty data frame
-    MasterDF = pd.DataFrame()
-    
-    # get the list of basins as a dict
-    basin_dict = MapBasinsToKeys(DataDirectory)
-    
-    # loop through and get each basin csv
-    for outlet_jn, basin_key in basin_dict.iteritems():
-        print outlet_jn, basin_key
-        this_fname = "basin"+str(outlet_jn)+basin_stats_suffix
-        df = pd.read_csv(DataDirectory+this_fname)
-        df = df[df['basin_key'] == 0]
-        df['basin_key'] = basin_key
-        MasterDF = MasterDF.append(df, ignore_index = True)
-        
+    # read all the basin csvs and append them together
+    MasterDF = AppendBasinCSVFiles(DataDirectory, basin_stats_suffix)
+
     return MasterDF
 
 def ReadBasinStatsPointCSV(DataDirectory, fname_prefix):
@@ -565,7 +750,7 @@ def ReadBasinStatsPointCSV(DataDirectory, fname_prefix):
     csv_suffix = '_point_movernstats_basinstats.csv'
     fname = fname_prefix+csv_suffix
     # read in the dataframe using pandas
-    df = pd.read_csv(DataDirectory+fname)
+    df = ReadCSVCached(DataDirectory+fname)
 
     return df
 
@@ -588,7 +773,7 @@ def ReadChainCSV(DataDirectory, fname_prefix, basin_key):
     chain_suffix = '_Basin%s_chain.csv' %str(basin_key)
     fname = fname_prefix+chain_suffix
     # read in the dataframe using pandas
-    df = pd.read_csv(DataDirectory+fname)
+    df = ReadCSVCached(DataDirectory+fname)
 
     return df
 
@@ -610,7 +795,7 @@ def ReadMCPointsCSV(DataDirectory, fname_prefix):
     mc_points_suffix = '_MCpoint_points_MC_basinstats.csv'
     fname = fname_prefix+mc_points_suffix
     # read in the dataframe using pandas
-    df = pd.read_csv(DataDirectory+fname)
+    df = ReadCSVCached(DataDirectory+fname)
 
     return df
 
@@ -639,7 +824,7 @@ def ReadMChiSegCSV(DataDirectory, fname_prefix, type = "Normal"):
         suffix = "_MChiSegmented_Ks.csv"
     fname = fname_prefix+suffix
     # read in the dataframe using pandas
-    df = pd.read_csv(DataDirectory+fname)
+    df = ReadCSVCached(DataDirectory+fname)
 
     # Getting rid of NoData
 
@@ -666,7 +851,7 @@ def ReadKnickpointCSV(DataDirectory, fname_prefix):
     suffix = '_KsnKn.csv'
     fname = fname_prefix+suffix
     # read in the dataframe using pandas
-    df = pd.read_csv(DataDirectory+fname)
+    df = ReadCSVCached(DataDirectory+fname)
 
     return df
 
@@ -689,7 +874,7 @@ def ReadKnickzoneCSV(DataDirectory, fname_prefix):
     suffix = '_KsnKz.csv'
     fname = fname_prefix+suffix
     # read in the dataframe using pandas
-    df = pd.read_csv(DataDirectory+fname)
+    df = ReadCSVCached(DataDirectory+fname)
 
     return df
 
@@ -719,7 +904,7 @@ def ReadChiResidualsCSVs(DataDirectory, fname_prefix):
     dfs = []
     for f in fnames:
         fname = fname_prefix+f
-        dfs.append(pd.read_csv(DataDirectory+fname))
+        dfs.append(ReadCSVCached(DataDirectory+fname))
 
     return dfs
 
@@ -739,7 +924,7 @@ def ReadRawSAData(DataDirectory, fname_prefix):
     # get the csv filename
     fname_suffix = "_SAvertical.csv"
     fname = fname_prefix+fname_suffix
-    df = pd.read_csv(DataDirectory+fname)
+    df = ReadCSVCached(DataDirectory+fname)
 
     return df
 
@@ -760,17 +945,9 @@ def AppendRawSAData(DataDirectory):
     # get the csv filename
     csv_suffix = "_SAvertical.csv"
     
-    MasterDF = pd.DataFrame()
-    basin_dict = MapBasinsToKeys(DataDirectory)
+    # read all the basin csvs and append them together
+    MasterDF = AppendBasinCSVFiles(DataDirectory, csv_suffix)
 
-    # loop through and get each basin csv
-    for outlet_jn, basin_key in basin_dict.iteritems():
-        this_fname = "basin"+str(outlet_jn)+csv_suffix
-        df = pd.read_csv(DataDirectory+this_fname)
-        df = df[df['basin_key'] == 0]
-        df['basin_key'] = basin_key
-        MasterDF = MasterDF.append(df, ignore_index = True)
-        
     return MasterDF
     
 def ReadSegmentedSAData(DataDirectory, fname_prefix):
@@ -789,7 +966,7 @@ def ReadSegmentedSAData(DataDirectory, fname_prefix):
     # get the csv filename
     fname_suffix = "_SAsegmented.csv"
     fname = fname_prefix+fname_suffix
-    df = pd.read_csv(DataDirectory+fname)
+    df = ReadCSVCached(DataDirectory+fname)
 
     return df
 
@@ -810,7 +987,7 @@ def ReadBinnedSAData(DataDirectory, fname_prefix):
     # get the csv filename
     fname_suffix = "_SAbinned.csv"
     fname = fname_prefix+fname_suffix
-    df = pd.read_csv(DataDirectory+fname)
+    df = ReadCSVCached(DataDirectory+fname)
 
     return df
 
@@ -832,7 +1009,7 @@ def ReadMOverNSummaryCSV(DataDirectory, fname_prefix):
     # get the csv filename
     fname_suffix = "_movern_summary.csv"
     fname = fname_prefix+fname_suffix
-    df = pd.read_csv(DataDirectory+fname)
+    df = ReadCSVCached(DataDirectory+fname)
 
     return df
 
@@ -852,7 +1029,7 @@ def ReadChannelNetworkCSV(DataDirectory, fname_prefix):
     # get the csv filename
     fname_suffix = "_CN.csv"
     fname = fname_prefix+fname_suffix
-    df = pd.read_csv(DataDirectory+fname)
+    df = ReadCSVCached(DataDirectory+fname)
 
     return df
 
@@ -872,7 +1049,7 @@ def ReadChiDataMapCSV(DataDirectory, fname_prefix):
     # get the csv filename
     fname_suffix = "_chi_data_map.csv"
     fname = fname_prefix+fname_suffix
-    df = pd.read_csv(DataDirectory+fname)
+    df = ReadCSVCached(DataDirectory+fname)
 
     return df
 
@@ -904,7 +1081,7 @@ def ReadTerraceCSV(DataDirectory, fname_prefix, outlet_jn):
 
     fname = fname_prefix+csv_suffix
     # read in the dataframe using pandas
-    df = pd.read_csv(DataDirectory+fname)
+    df = ReadCSVCached(DataDirectory+fname)
     return df
 
 def ReadModelCSV(DataDirectory, Base_file):
@@ -925,7 +1102,7 @@ def ReadModelCSV(DataDirectory, Base_file):
 
     fname = Base_file+csv_suffix
     # read in the dataframe using pandas
-    df = pd.read_csv(DataDirectory+fname)
+    df = ReadCSVCached(DataDirectory+fname)
     return df
 
 #-----------------------------------------------------------------------------#
@@ -933,6 +1110,125 @@ def ReadModelCSV(DataDirectory, Base_file):
 # FJC 19/10/17
 #-----------------------------------------------------------------------------#
 
+# The number of threads used to read the basin csv files, and the tables
+# that have already been appended together in this run. There is one table
+# for each directory, csv suffix and set of options. It is kept with the size
+# and modification time of every csv it was made from, and is replaced when
+# any of them changes.
+CSVReaderThreads = 8
+_AppendedCSVCache = {}
+_BasinKeyCache = {}
+
+def _GetDirectoryStamp(DataDirectory):
+    """
+    This gets the absolute path and modification time of a directory, which
+    changes whenever files are added to it or removed from it.
+
+    Args:
+        DataDirectory (str): the data directory
+
+    Returns:
+        tuple with the path and modification time
+    """
+    return (os.path.abspath(DataDirectory), os.stat(DataDirectory).st_mtime)
+
+def _GetBasinCSVName(DataDirectory, outlet_jn, csv_suffix):
+    """
+    This gets the name of the csv file of one basin from a parallel run.
+
+    Args:
+        DataDirectory (str): the data directory
+        outlet_jn (str): the outlet junction of the basin
+        csv_suffix (str): the suffix of the csv file
+
+    Returns:
+        str with the full path to the csv
+    """
+    return DataDirectory+"basin"+str(outlet_jn)+csv_suffix
+
+def _ReadBasinCSV(DataDirectory, outlet_jn, basin_key, csv_suffix, outlet_column, first_row_only):
+    """
+    This reads the csv of one basin from a parallel run and gives it its basin key.
+
+    Args:
+        DataDirectory (str): the data directory
+        outlet_jn (str): the outlet junction of the basin
+        basin_key (int): the basin key assigned by MapBasinsToKeys
+        csv_suffix (str): the suffix of the csv file
+        outlet_column (str): if not None, a column with this name is added holding the outlet junction
+        first_row_only (bool): if true only the first row is kept, otherwise the rows with basin key 0
+
+    Returns:
+        pandas dataframe with the rows of this basin
+    """
+    df = ReadCSVCached(_GetBasinCSVName(DataDirectory, outlet_jn, csv_suffix))
+    if first_row_only:
+        df = df.iloc[[0]].copy()
+    else:
+        df = df[df['basin_key'] == 0].copy()
+    df['basin_key'] = basin_key
+    if outlet_column is not None:
+        df[outlet_column] = outlet_jn
+    return df
+
+def AppendBasinCSVFiles(DataDirectory, csv_suffix, outlet_column=None, first_row_only=False):
+    """
+    This reads the csv files with a given suffix from every basin of a parallel
+    run and appends them together. The directory is only scanned once, the files
+    are read with a pool of threads and the tables are concatenated in one go.
+    The result is kept for later calls in the same run, so it is only read again
+    if basins are added or removed or one of the csv files changes.
+
+    Args:
+        DataDirectory (str): the data directory
+        csv_suffix (str): the suffix of the csv files, e.g. '_movern.csv'
+        outlet_column (str): if not None, a column with this name is added holding the outlet junction
+        first_row_only (bool): if true only the first row of each file is kept,
+        otherwise the rows with basin key 0
+
+    Returns:
+        pandas dataframe with the appended csvs
+    """
+    from multiprocessing.pool import ThreadPool
+
+    basin_dict = MapBasinsToKeys(DataDirectory)
+    basins = sorted(basin_dict.items(), key=lambda basin: basin[1])
+
+    # the table is reused only if every csv it was made from is unchanged
+    cache_key = (os.path.abspath(DataDirectory), csv_suffix, outlet_column, first_row_only)
+    csv_stamps = [[basin[0]]+_GetCSVFileStamp(_GetBasinCSVName(DataDirectory, basin[0], csv_suffix))
+                  for basin in basins]
+    if cache_key in _AppendedCSVCache and _AppendedCSVCache[cache_key][0] == csv_stamps:
+        return _AppendedCSVCache[cache_key][1].copy()
+
+    def read_this_basin(basin):
+        return _ReadBasinCSV(DataDirectory, basin[0], basin[1], csv_suffix, outlet_column, first_row_only)
+
+    if CSVReaderThreads > 1 and len(basins) > 1:
+        pool = ThreadPool(min(CSVReaderThreads, len(basins)))
+        try:
+            dfs = pool.map(read_this_basin, basins)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        dfs = [read_this_basin(basin) for basin in basins]
+
+    if len(dfs) == 0:
+        MasterDF = pd.DataFrame()
+    else:
+        MasterDF = pd.concat(dfs, ignore_index = True)
+
+    _AppendedCSVCache[cache_key] = (csv_stamps, MasterDF)
+    return MasterDF.copy()
+
+def ClearAppendedCSVCache():
+    """
+    This empties the cache of appended basin csvs and basin keys.
+    """
+    _AppendedCSVCache.clear()
+    _BasinKeyCache.clear()
+
 def AppendBasinCSVs(DataDirectory):
     """
     This function reads in a series of basin csv files and appends them together
@@ -950,17 +1246,8 @@ def AppendBasinCSVs(DataDirectory):
     # get the csv filename
     csv_suffix = "_movernstats_basinstats.csv"
 
-    MasterDF = pd.DataFrame()
-    basin_dict = MapBasinsToKeys(DataDirectory)
-
-    # loop through and get each basin csv
-    for outlet_jn, basin_key in basin_dict.iteritems():
-        this_fname = "basin"+str(outlet_jn)+csv_suffix
-        # append to master DF and change the basin key and the junction
-        df = pd.read_csv(DataDirectory+this_fname)
-        df.ix[0, 'basin_key'] = basin_key
-        df.ix[0, 'outlet_jn'] = outlet_jn
-        MasterDF = MasterDF.append(df.iloc[0], ignore_index = True)
+    # read all the basin csvs and append them together
+    MasterDF = AppendBasinCSVFiles(DataDirectory, csv_suffix, outlet_column = 'outlet_jn', first_row_only = True)
 
     return MasterDF
 
@@ -982,17 +1269,8 @@ def AppendFullStatsCSVs(DataDirectory, m_over_n):
     # get the csv filename
     csv_suffix =  '_movernstats_%s_fullstats.csv' %str(m_over_n)
 
-    MasterDF = pd.DataFrame()
-    basin_dict = MapBasinsToKeys(DataDirectory)
-
-    # loop through and get each basin csv
-    for outlet_jn, basin_key in basin_dict.iteritems():
-        this_fname = "basin"+str(outlet_jn)+csv_suffix
-        # append to master DF and change the basin key and the junction
-        df = pd.read_csv(DataDirectory+this_fname)
-        df = df[df['basin_key'] == 0]
-        df['basin_key'] = basin_key
-        MasterDF = MasterDF.append(df, ignore_index = True)
+    # read all the basin csvs and append them together
+    MasterDF = AppendBasinCSVFiles(DataDirectory, csv_suffix)
 
     return MasterDF
 
@@ -1012,7 +1290,7 @@ def ReadMovernCSV(DataDirectory, fname_prefix):
     # get the csv filename
     csv_suffix = '_movern.csv'
     
-    df = pd.read_csv(DataDirectory+fname_prefix+csv_suffix)
+    df = ReadCSVCached(DataDirectory+fname_prefix+csv_suffix)
     
     return df
 
@@ -1033,17 +1311,8 @@ def AppendMovernCSV(DataDirectory):
     # get the csv filename
     csv_suffix =  '_movern.csv'
 
-    MasterDF = pd.DataFrame()
-    basin_dict = MapBasinsToKeys(DataDirectory)
-
-    # loop through and get each basin csv
-    for outlet_jn, basin_key in basin_dict.iteritems():
-        this_fname = "basin"+str(outlet_jn)+csv_suffix
-        # append to master DF and change the basin key and the junction
-        df = pd.read_csv(DataDirectory+this_fname)
-        df = df[df['basin_key'] == 0]
-        df['basin_key'] = basin_key
-        MasterDF = MasterDF.append(df, ignore_index = True)
+    # read all the basin csvs and append them together
+    MasterDF = AppendBasinCSVFiles(DataDirectory, csv_suffix)
 
     return MasterDF
 
@@ -1064,18 +1333,8 @@ def AppendBasinInfoCSVs(DataDirectory):
     # get the csv filename
     csv_suffix =  '_AllBasinsInfo.csv'
 
-    MasterDF = pd.DataFrame()
-    basin_dict = MapBasinsToKeys(DataDirectory)
-
-    # loop through and get each basin csv
-    for outlet_jn, basin_key in basin_dict.iteritems():
-        this_fname = "basin"+str(outlet_jn)+csv_suffix
-        # append to master DF and change the basin key and the junction
-        df = pd.read_csv(DataDirectory+this_fname)
-        df = df[df['basin_key'] == 0]
-        df['basin_key'] = basin_key
-        df['outlet_junction'] = outlet_jn
-        MasterDF = MasterDF.append(df, ignore_index = True)
+    # read all the basin csvs and append them together
+    MasterDF = AppendBasinCSVFiles(DataDirectory, csv_suffix, outlet_column = 'outlet_junction')
 
     return MasterDF
 
@@ -1096,17 +1355,8 @@ def AppendChiDataMapCSVs(DataDirectory):
     # get the csv filename
     csv_suffix =  '_chi_data_map.csv'
 
-    MasterDF = pd.DataFrame()
-    basin_dict = MapBasinsToKeys(DataDirectory)
-
-    # loop through and get each basin csv
-    for outlet_jn, basin_key in basin_dict.iteritems():
-        this_fname = "basin"+str(outlet_jn)+csv_suffix
-        # append to master DF and change the basin key and the junction
-        df = pd.read_csv(DataDirectory+this_fname)
-        df = df[df['basin_key'] == 0]
-        df['basin_key'] = basin_key
-        MasterDF = MasterDF.append(df, ignore_index = True)
+    # read all the basin csvs and append them together
+    MasterDF = AppendBasinCSVFiles(DataDirectory, csv_suffix)
 
     return MasterDF
 
@@ -1127,17 +1377,8 @@ def AppendSABinnedCSVs(DataDirectory):
     # get the csv filename
     csv_suffix =  '_SAbinned.csv'
 
-    MasterDF = pd.DataFrame()
-    basin_dict = MapBasinsToKeys(DataDirectory)
-
-    # loop through and get each basin csv
-    for outlet_jn, basin_key in basin_dict.iteritems():
-        this_fname = "basin"+str(outlet_jn)+csv_suffix
-        # append to master DF and change the basin key and the junction
-        df = pd.read_csv(DataDirectory+this_fname)
-        df = df[df['basin_key'] == 0]
-        df['basin_key'] = basin_key
-        MasterDF = MasterDF.append(df, ignore_index = True)
+    # read all the basin csvs and append them together
+    MasterDF = AppendBasinCSVFiles(DataDirectory, csv_suffix)
 
     return MasterDF
 
@@ -1158,17 +1399,8 @@ def AppendSASegmentedCSVs(DataDirectory):
     # get the csv filename
     csv_suffix =  '_SAsegmented.csv'
 
-    MasterDF = pd.DataFrame()
-    basin_dict = MapBasinsToKeys(DataDirectory)
-
-    # loop through and get each basin csv
-    for outlet_jn, basin_key in basin_dict.iteritems():
-        this_fname = "basin"+str(outlet_jn)+csv_suffix
-        # append to master DF and change the basin key and the junction
-        df = pd.read_csv(DataDirectory+this_fname)
-        df = df[df['basin_key'] == 0]
-        df['basin_key'] = basin_key
-        MasterDF = MasterDF.append(df, ignore_index = True)
+    # read all the basin csvs and append them together
+    MasterDF = AppendBasinCSVFiles(DataDirectory, csv_suffix)
 
     return MasterDF
 
@@ -1189,17 +1421,8 @@ def AppendSAVerticalCSVs(DataDirectory):
     # get the csv filename
     csv_suffix =  '_SAvertical.csv'
 
-    MasterDF = pd.DataFrame()
-    basin_dict = MapBasinsToKeys(DataDirectory)
-
-    # loop through and get each basin csv
-    for outlet_jn, basin_key in basin_dict.iteritems():
-        this_fname = "basin"+str(outlet_jn)+csv_suffix
-        # append to master DF and change the basin key and the junction
-        df = pd.read_csv(DataDirectory+this_fname)
-        df = df[df['basin_key'] == 0]
-        df['basin_key'] = basin_key
-        MasterDF = MasterDF.append(df, ignore_index = True)
+    # read all the basin csvs and append them together
+    MasterDF = AppendBasinCSVFiles(DataDirectory, csv_suffix)
 
     return MasterDF
 
@@ -1221,18 +1444,8 @@ def AppendBasinPointCSVs(DataDirectory):
     # get the csv filename
     csv_suffix =  '_MCpoint_points_MC_basinstats.csv'
 
-    MasterDF = pd.DataFrame()
-    basin_dict = MapBasinsToKeys(DataDirectory)
-
-    # loop through and get each basin csv
-    for outlet_jn, basin_key in basin_dict.iteritems():
-        this_fname = "basin"+str(outlet_jn)+csv_suffix
-        # append to master DF and change the basin key and the junction
-        df = pd.read_csv(DataDirectory+this_fname)
-        df = df[df['basin_key'] == 0]
-        df['basin_key'] = basin_key
-        df['outlet_jn'] = outlet_jn
-        MasterDF = MasterDF.append(df, ignore_index = True)
+    # read all the basin csvs and append them together
+    MasterDF = AppendBasinCSVFiles(DataDirectory, csv_suffix, outlet_column = 'outlet_jn')
 
     return MasterDF
 
@@ -1253,22 +1466,10 @@ def AppendChiResidualsCSVs(DataDirectory):
     # get the csv filename
     fnames = ["_residual_movernstats_movern_residuals_median.csv","_residual_movernstats_movern_residuals_Q1.csv","_residual_movernstats_movern_residuals_Q3.csv"]
 
+    # each file gets its own table
     MasterDFs = []
-
-    MasterDF = pd.DataFrame()
-    basin_dict = MapBasinsToKeys(DataDirectory)
-
     for f in fnames:
-        # loop through and get each basin csv
-        for outlet_jn, basin_key in basin_dict.iteritems():
-            this_fname = "basin"+str(outlet_jn)+f
-            # append to master DF and change the basin key and the junction
-            df = pd.read_csv(DataDirectory+this_fname)
-            df = df[df['basin_key'] == 0]
-            df['basin_key'] = basin_key
-            df['outlet_jn'] = outlet_jn
-            MasterDF = MasterDF.append(df, ignore_index = True)
-        MasterDFs.append(MasterDF)
+        MasterDFs.append(AppendBasinCSVFiles(DataDirectory, f, outlet_column = 'outlet_jn'))
 
     return MasterDFs
 
@@ -1290,6 +1491,11 @@ def MapBasinsToKeys(DataDirectory):
     """
     import os
 
+    # the directory is only scanned again if it has changed
+    dir_path, dir_time = _GetDirectoryStamp(DataDirectory)
+    if dir_path in _BasinKeyCache and _BasinKeyCache[dir_path][0] == dir_time:
+        return dict(_BasinKeyCache[dir_path][1])
+
     # get the csv filename
     csv_suffix = "_movernstats_basinstats.csv"
 
@@ -1306,4 +1512,5 @@ def MapBasinsToKeys(DataDirectory):
             basin_dict[fname] = key
             key+=1
 
+    _BasinKeyCache[dir_path] = (dir_time, dict(basin_dict))
     return basin_dict
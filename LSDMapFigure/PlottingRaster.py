@@ -38,24 +38,41 @@ class BaseRaster(object):
     Args:
         RasterName (str): The name of the rasters (with extension). It is read by gdal so should cope with mulitple formats
         Directory (str): The path to the raster. Needs to have the trailing slash
-        NFF_opti (bool): experimental test of reading raster using numpy.fromfile() which a super efficient binary reader
+        NFF_opti (bool): If true, the raster (ENVI or EHdr only) is memory mapped with numpy rather than read through GDAL. Figures over the same file share the pages.
+        window_extent (list): If given, only this part of the raster, [xmin,xmax,ymin,ymax] in map units, is read.
+        decimation (int): Only read every nth pixel of the raster.
+        dtype (str): How the data is held in memory. "float64" (the default) holds everything as 64 bit floats. "float32" halves the memory, but can't hold integers above 2^24 exactly. "native" keeps the type on disk and masks the nodata, which is best for integer rasters like basins or lithology.
+        target_columns (int): If given, the raster is read from the coarsest level of its overview pyramid that still has at least this many columns across the window. Usually the figure width in inches times the dpi.
+        hillshade (bool): If true the raster is a DEM and its hillshade, made by the hillshade engine when the data is first used, is plotted instead.
 
     Author: DAV and SMM
     """
-    def __init__(self, RasterName, Directory, NFF_opti = False, alpha = 1):
+    def __init__(self, RasterName, Directory, NFF_opti = False, alpha = 1, window_extent = None, decimation = 1,
+                 dtype = "float64", target_columns = None, hillshade = False):
 
         self._RasterFileName = RasterName
         self._RasterDirectory = Directory
         self._FullPathRaster = self._RasterDirectory + self._RasterFileName
 
-        # I think the BaseRaster should contain a numpy array of the Raster
-        if(NFF_opti):
-            self._RasterArray = LSDP.ReadRasterArrayBlocks_numpy(self._FullPathRaster)
-        else:
-            self._RasterArray = LSDP.ReadRasterArrayBlocks(self._FullPathRaster)
+        # The BaseRaster holds a lazy handle on the raster. The array is only read
+        # the first time it is needed, and only for the window that is plotted.
+        self._Raster = LSDP.LazyRaster(self._FullPathRaster, extent = window_extent,
+                                       decimation = decimation, dtype = dtype,
+                                       use_memmap = NFF_opti)
+
+        # If the raster has far more pixels than the figure can show, use a level
+        # of the overview pyramid instead
+        if target_columns is not None:
+            factor = LSDP.ChoosePyramidFactor(self._Raster.window[2], target_columns)
+            if factor > 1:
+                print("I am using the overview pyramid level with factor "+str(factor)+" for "+self._RasterFileName)
+                self._Raster = LSDP.PyramidRaster(self._FullPathRaster, factor,
+                                                  extent = window_extent, dtype = dtype)
+
+        self._Hillshade = hillshade
 
         # Get the extents as a list
-        self._RasterExtents = LSDP.GetRasterExtent(self._FullPathRaster)
+        self._RasterExtents = self._Raster.extent
         self._RasterAspectRatio = (self._RasterExtents[1]-self._RasterExtents[0])/(self._RasterExtents[3]-self._RasterExtents[2])
 
         # set the default colourmap
@@ -68,6 +85,20 @@ class BaseRaster(object):
         self._EPSGString = LSDP.LSDMap_IO.GetUTMEPSG(self._FullPathRaster)
         #print("The EPSGString is: "+ self._EPSGString)
 
+    @property
+    def _RasterArray(self):
+        # The hillshade is made from the DEM the first time the data is read
+        if self._Hillshade and not self._Raster.is_loaded:
+            elevation = self._Raster.data
+            DataResolution = (self._RasterExtents[1]-self._RasterExtents[0])/elevation.shape[1]
+            HSarray = LSDP.HillshadeArray(elevation, DataResolution, NoDataValue = None)
+            self._Raster.data = HSarray.astype(elevation.dtype) if elevation.dtype.kind == "f" else HSarray
+        return self._Raster.data
+
+    @_RasterArray.setter
+    def _RasterArray(self, data_array):
+        self._Raster.data = data_array
+
     @property
     def extents(self):
         return self._RasterExtents
@@ -157,6 +188,19 @@ class BaseRaster(object):
         if self._middlemaskrange is not None:
             self.mask_middle_values()
 
+    def _mask_index(self, index):
+        """
+        Masks the pixels in index. Float arrays get NaN and masked arrays
+        (integer rasters loaded with dtype = "native") get the mask set.
+
+        Args:
+            index (np.array): boolean array of the pixels to mask
+        """
+        if np.ma.isMaskedArray(self._RasterArray):
+            self._RasterArray[index] = np.ma.masked
+        else:
+            self._RasterArray[index] = np.nan
+
     def mask_low_values(self):#
         """
         Reads from the self._drapeminthreshold to mask low values.
@@ -164,7 +208,7 @@ class BaseRaster(object):
         Author: DAV
         """
         low_values_index = self._RasterArray < self._drapeminthreshold
-        self._RasterArray[low_values_index] = np.nan
+        self._mask_index(low_values_index)
 
     def mask_high_values(self):
         """
@@ -173,7 +217,7 @@ class BaseRaster(object):
         Author: DAV
         """
         high_values_index = self._RasterArray < self._drapemaxthreshold
-        self._RasterArray[high_values_index] = np.nan
+        self._mask_index(high_values_index)
 
     def mask_middle_values(self):
         """
@@ -183,7 +227,7 @@ class BaseRaster(object):
         """
         masked_mid_values_index = (np.logical_and(self._RasterArray > self._middlemaskrange[0],
                                    self._RasterArray < self._middlemaskrange[1]))
-        self._RasterArray[masked_mid_values_index] = np.nan
+        self._mask_index(masked_mid_values_index)
 
     def show_raster(self):
         """
@@ -226,7 +270,9 @@ class MapFigure(object):
     etc.
     """
     def __init__(self, BaseRasterName, Directory,
-                 coord_type="UTM", colourbar_location = "None", basemap_colourmap = "gray", plot_title = "None", NFF_opti = False,alpha = 1,*args, **kwargs):
+                 coord_type="UTM", colourbar_location = "None", basemap_colourmap = "gray", plot_title = "None", NFF_opti = False,alpha = 1,
+                 plot_extent = None, dtype = "float64", fig_width_inches = None, fig_dpi = None, hillshade_base = False,
+                 *args, **kwargs):
         """
         Initiates the object.
 
@@ -238,6 +284,11 @@ class MapFigure(object):
             basemap_colourmap (string or colormap): The colourmap of the base raster.
             plot_title (string): The title of the plot, if "None" then will not be plotted.
             NFF_opti (bool): If true, use a fast python native file loading. Much faster but not completely tested.
+            plot_extent (list): If given, only this area, [xmin,xmax,ymin,ymax] in map units, of the base raster and any drapes is read and plotted.
+            dtype (str): How the base raster is held in memory: "float64" (the default), "float32" or "native" (masked, keeps the type on disk).
+            fig_width_inches (float): The width the figure will be saved at. If this and fig_dpi are given, the base raster and drapes are read from an overview pyramid level that has about as many pixels as the figure, which is much faster for big DEMs.
+            fig_dpi (int): The dpi the figure will be saved at.
+            hillshade_base (bool): If true BaseRasterName is a DEM and the base image is its hillshade, made on the fly by the hillshade engine, so you don't need a _hs raster.
 
         Author: SMM and DAV
 
@@ -277,6 +328,12 @@ class MapFigure(object):
         self._BaseRasterName = BaseRasterName
         self._BaseRasterFullName = Directory+BaseRasterName
 
+        # The number of pixels across the saved figure. Rasters are read at about this resolution.
+        if fig_width_inches is not None and fig_dpi is not None:
+            self._target_columns = int(fig_width_inches*fig_dpi)
+        else:
+            self._target_columns = None
+
 
         self.FigFileName = self._Directory+"TestFig.png"
         self.FigFormat = "png"
@@ -287,11 +344,20 @@ class MapFigure(object):
         # and properties
         self._RasterList = []
         if basemap_colourmap == "gray":
-            self._RasterList.append(BaseRaster(BaseRasterName,Directory, NFF_opti = NFF_opti, alpha = alpha))
+            self._RasterList.append(BaseRaster(BaseRasterName,Directory, NFF_opti = NFF_opti, alpha = alpha, window_extent = plot_extent, dtype = dtype,
+                                               target_columns = self._target_columns, hillshade = hillshade_base))
         else:
-            self._RasterList.append(BaseRaster(BaseRasterName,Directory, NFF_opti = NFF_opti, alpha = alpha))
+            self._RasterList.append(BaseRaster(BaseRasterName,Directory, NFF_opti = NFF_opti, alpha = alpha, window_extent = plot_extent, dtype = dtype,
+                                               target_columns = self._target_columns, hillshade = hillshade_base))
             self._RasterList[-1].set_colourmap(basemap_colourmap)
 
+        # If we are only plotting part of the raster, the drapes are read over
+        # the same extent as the base raster so they line up
+        if plot_extent is not None:
+            self._plot_extent = self._RasterList[0].extents
+        else:
+            self._plot_extent = None
+
         # The coordinate type. UTM and UTM with tick in km are supported at the moment
         self._set_coord_type(coord_type)
 
@@ -324,12 +390,15 @@ class MapFigure(object):
         Author: SMM
         """
 
+        # The ticks are made over the part of the raster that is plotted
+        xmin,xmax,ymin,ymax = self._RasterList[0].extents
+
         if self._coord_type == "UTM":
-            self.tick_xlocs,self.tick_ylocs,self.tick_x_labels,self.tick_y_labels = LSDP.GetTicksForUTMNoInversion(self._BaseRasterFullName,self._xmax,self._xmin,
-                             self._ymax,self._ymin,self._n_target_ticks)
+            self.tick_xlocs,self.tick_ylocs,self.tick_x_labels,self.tick_y_labels = LSDP.GetTicksForUTMNoInversion(self._BaseRasterFullName,xmax,xmin,
+                             ymax,ymin,self._n_target_ticks)
         elif self._coord_type == "UTM_km":
-            self.tick_xlocs,self.tick_ylocs,self.tick_x_labels,self.tick_y_labels = LSDP.GetTicksForUTMNoInversion(self._BaseRasterFullName,self._xmax,self._xmin,
-                             self._ymax,self._ymin,self._n_target_ticks)
+            self.tick_xlocs,self.tick_ylocs,self.tick_x_labels,self.tick_y_labels = LSDP.GetTicksForUTMNoInversion(self._BaseRasterFullName,xmax,xmin,
+                             ymax,ymin,self._n_target_ticks)
             n_hacked_digits = 3
             self.tick_x_labels = LSDP.TickLabelShortenizer(self.tick_x_labels,n_hacked_digits)
             self.tick_y_labels = LSDP.TickLabelShortenizer(self.tick_y_labels,n_hacked_digits)
@@ -466,7 +535,7 @@ class MapFigure(object):
                         colour_min_max = [],
                         modify_raster_values=False,
                         old_values=[], new_values=[], cbar_type=float,
-                        NFF_opti = False, custom_min_max = []):
+                        NFF_opti = False, custom_min_max = [], dtype = "float64"):
         """
         This function adds a drape over the base raster.
 
@@ -487,6 +556,7 @@ class MapFigure(object):
             cbar_type (type): Sets the type of the colourbar (if you want int labels, set to int)
             NFF_opti (bool): If true, uses the new file loading functions. It is faster but hasn't been completely tested.
             custom_min_max (list of int/float): if it contains two elements, recast the raster to [min,max] values for display.
+            dtype (str): How the drape is held in memory: "float64" (the default), "float32" or "native" (masked, keeps the type on disk). Use "native" for categorical rasters with big integer values.
 
         Author: SMM
         """
@@ -496,7 +566,7 @@ class MapFigure(object):
         self.ax_list = self._add_drape_image(self.ax_list,RasterName,Directory,colourmap,alpha,
                                              colorbarlabel,discrete_cmap,n_colours, norm,
                                              colour_min_max,modify_raster_values,old_values,
-                                             new_values,cbar_type, NFF_opti, custom_min_max)
+                                             new_values,cbar_type, NFF_opti, custom_min_max, dtype)
         #print("Getting axis limits in drape function: ")
         #print(self.ax_list[0].get_xlim())
 
@@ -509,7 +579,7 @@ class MapFigure(object):
                          colour_min_max = [],
                          modify_raster_values = False,
                          old_values=[], new_values = [], cbar_type=float,
-                         NFF_opti = False, custom_min_max = []):
+                         NFF_opti = False, custom_min_max = [], dtype = "float64"):
         """
         This function adds a drape over the base raster. It does all the dirty work
         I can't quite remember why I did it in two steps but I vaguely recall trying it in one step and it didn't work.
@@ -531,10 +601,12 @@ class MapFigure(object):
             cbar_type (type): Sets the type of the colourbar (if you want int labels, set to int)
             NFF_opti (bool): If true, uses the new file loading functions. It is faster but hasn't been completely tested.
             custom_min_max (list of int/float): if it contains two elements, recast the raster to [min,max] values for display.
+            dtype (str): How the drape is held in memory: "float64" (the default), "float32" or "native".
 
         Author: SMM
         """
-        Raster = BaseRaster(RasterName,Directory, NFF_opti = NFF_opti)
+        Raster = BaseRaster(RasterName,Directory, NFF_opti = NFF_opti, window_extent = self._plot_extent, dtype = dtype,
+                            target_columns = self._target_columns)
         if modify_raster_values == True:
             Raster.replace_raster_values(old_values, new_values)
 
@@ -683,11 +755,16 @@ class MapFigure(object):
             # This will hold the labels. Need to initiate here to ensure it lives outside control statements
             texts = []
 
-            # First get the points
+            # First get the points. These come from the same cache as the outlines
+            # so the raster isn't polygonised again
+            if not parallel:
+                AllPoints = LSDP.GetPointWithinBasins(Directory, RasterName)
+            else:
+                AllPoints = LSDP.GetPointsWithinMultipleBasins(Directory, RasterName)
             Points = {}
             print("The number of basins are: "+str(len(Basins)))
-            for basin_key, basin in Basins.iteritems():
-                Points[basin_key] = Point(basin.representative_point())
+            for basin_key in Basins:
+                Points[basin_key] = AllPoints[basin_key]
             print("The number of points are: "+str(len(Points)))
 
             # Now check if there is a renaming dictionary
@@ -37,7 +37,7 @@ import LSDMapFigure.PlottingHelpers as PlotHelp
 #import LSDPlottingTools.LSDMap_VectorTools as LSDMap_VT
 
 
-def SimpleHillshade(DataDirectory,Base_file, cmap = "jet", cbar_loc = "right", size_format = "ESURF", fig_format = "png", dpi = 250):
+def SimpleHillshade(DataDirectory,Base_file, cmap = "jet", cbar_loc = "right", size_format = "ESURF", fig_format = "png", dpi = 250, make_hillshade = False):
     """
     This function makes a shaded relief plot of the DEM with the basins coloured
     by the basin ID.
@@ -51,6 +51,7 @@ def SimpleHillshade(DataDirectory,Base_file, cmap = "jet", cbar_loc = "right", s
         size_format (str): Either geomorphology or big. Anything else gets you a 4.9 inch wide figure (standard ESURF size)
         fig_format (str): An image format. png, pdf, eps, svg all valid
         dpi (int): The dots per inch of the figure
+        make_hillshade (bool): If true and there is no _hs raster, the hillshade is made from the DEM and written next to it
 
     Returns:
         Shaded relief plot. The elevation is also included in the plot.
@@ -71,6 +72,10 @@ def SimpleHillshade(DataDirectory,Base_file, cmap = "jet", cbar_loc = "right", s
     BackgroundRasterName = Base_file+"_hs.bil"
     DrapeRasterName = Base_file+".bil"
 
+    # make the hillshade if LSDTopoTools hasn't and you asked for it
+    if make_hillshade:
+        LSDP.MakeHillshadeRaster(DataDirectory+DrapeRasterName, DataDirectory+BackgroundRasterName)
+
     # clear the plot
     plt.clf()
 
@@ -85,7 +90,7 @@ def SimpleHillshade(DataDirectory,Base_file, cmap = "jet", cbar_loc = "right", s
 def SimpleHillshadeForAnimation(DataDirectory,Base_file, cmap = "jet", cbar_loc = "right", 
                                 size_format = "ESURF", fig_format = "png", 
                                 dpi = 250, imgnumber = 0, full_basefile = [], 
-                                custom_cbar_min_max = []):
+                                custom_cbar_min_max = [], make_hillshade = False):
     """
     This function make a hillshade image that is optimised for creating 
     an animation. Used with the MuddPILE model
@@ -102,6 +107,7 @@ def SimpleHillshadeForAnimation(DataDirectory,Base_file, cmap = "jet", cbar_loc
         imgnumber (int): the number of the image. Usually frames from model runs have integer numbers after them
         full_basefile (str): The root name of the figures you want. If empty, it uses the data_directory+base_file
         custom_min_max (list of int/float): if it contains two elements, recast the raster to [min,max] values for display.
+        make_hillshade (bool): If true and there is no _hs raster, the hillshade is made from the DEM and written next to it
 
     Returns:
         Shaded relief plot. The elevation is also included in the plot.
@@ -122,6 +128,10 @@ def SimpleHillshadeForAnimation(DataDirectory,Base_file, cmap = "jet", cbar_loc
     BackgroundRasterName = Base_file+"_hs.bil"
     DrapeRasterName = Base_file+".bil"
 
+    # make the hillshade if LSDTopoTools hasn't and you asked for it
+    if make_hillshade:
+        LSDP.MakeHillshadeRaster(DataDirectory+DrapeRasterName, DataDirectory+BackgroundRasterName)
+
     # clear the plot
     plt.clf()
 
@@ -139,7 +149,7 @@ def SimpleHillshadeForAnimation(DataDirectory,Base_file, cmap = "jet", cbar_loc
                  fixed_cbar_characters=4)
 
 
-def PrintAllChannels(DataDirectory,fname_prefix, add_basin_labels = True, cmap = "jet", cbar_loc = "right", size_format = "ESURF", fig_format = "png", dpi = 250):
+def PrintAllChannels(DataDirectory,fname_prefix, add_basin_labels = True, cmap = "jet", cbar_loc = "right", size_format = "ESURF", fig_format = "png", dpi = 250, make_hillshade = False):
     """
     This function prints a channel map over a hillshade. It gets ALL the channels within the DEM
 
@@ -153,6 +163,7 @@ def PrintAllChannels(DataDirectory,fname_prefix, add_basin_labels = True, cmap =
         size_format (str): Either geomorphology or big. Anything else gets you a 4.9 inch wide figure (standard ESURF size)
         fig_format (str): An image format. png, pdf, eps, svg all valid
         dpi (int): The dots per inch of the figure
+        make_hillshade (bool): If true and there is no _hs raster, the hillshade is made from the DEM and written next to it
 
 
     Returns:
@@ -173,6 +184,10 @@ def PrintAllChannels(DataDirectory,fname_prefix, add_basin_labels = True, cmap =
     # Get the filenames you want
     BackgroundRasterName = fname_prefix+"_hs.bil"
     DrapeRasterName = fname_prefix+".bil"
+
+    # make the hillshade if LSDTopoTools hasn't and you asked for it
+    if make_hillshade:
+        LSDP.MakeHillshadeRaster(DataDirectory+DrapeRasterName, DataDirectory+BackgroundRasterName)
     ChannelFileName = fname_prefix+"_CN.csv"
     chi_csv_fname = DataDirectory+ChannelFileName
 
@@ -196,7 +211,7 @@ def PrintAllChannels(DataDirectory,fname_prefix, add_basin_labels = True, cmap =
 
 
 
-def PrintChannels(DataDirectory,fname_prefix, add_basin_labels = True, cmap = "jet", cbar_loc = "right", size_format = "ESURF", fig_format = "png", dpi = 250):
+def PrintChannels(DataDirectory,fname_prefix, add_basin_labels = True, cmap = "jet", cbar_loc = "right", size_format = "ESURF", fig_format = "png", dpi = 250, make_hillshade = False):
     """
     This function prints a channel map over a hillshade.
 
@@ -210,6 +225,7 @@ def PrintChannels(DataDirectory,fname_prefix, add_basin_labels = True, cmap = "j
         size_format (str): Either geomorphology or big. Anything else gets you a 4.9 inch wide figure (standard ESURF size)
         fig_format (str): An image format. png, pdf, eps, svg all valid
         dpi (int): The dots per inch of the figure
+        make_hillshade (bool): If true and there is no _hs raster, the hillshade is made from the DEM and written next to it
 
 
     Returns:
@@ -230,6 +246,10 @@ def PrintChannels(DataDirectory,fname_prefix, add_basin_labels = True, cmap = "j
     # Get the filenames you want
     BackgroundRasterName = fname_prefix+"_hs.bil"
     DrapeRasterName = fname_prefix+".bil"
+
+    # make the hillshade if LSDTopoTools hasn't and you asked for it
+    if make_hillshade:
+        LSDP.MakeHillshadeRaster(DataDirectory+DrapeRasterName, DataDirectory+BackgroundRasterName)
     ChannelFileName = fname_prefix+"_chi_data_map.csv"
     chi_csv_fname = DataDirectory+ChannelFileName
 
@@ -253,7 +273,7 @@ def PrintChannels(DataDirectory,fname_prefix, add_basin_labels = True, cmap = "j
 
 
 
-def PrintChannelsAndBasins(DataDirectory,fname_prefix, add_basin_labels = True, cmap = "jet", cbar_loc = "right", size_format = "ESURF", fig_format = "png", dpi = 250):
+def PrintChannelsAndBasins(DataDirectory,fname_prefix, add_basin_labels = True, cmap = "jet", cbar_loc = "right", size_format = "ESURF", fig_format = "png", dpi = 250, make_hillshade = False):
     """
     This function prints a channel map over a hillshade.
 
@@ -267,6 +287,7 @@ def PrintChannelsAndBasins(DataDirectory,fname_prefix, add_basin_labels = True,
         size_format (str): Either geomorphology or big. Anything else gets you a 4.9 inch wide figure (standard ESURF size)
         fig_format (str): An image format. png, pdf, eps, svg all valid
         dpi (int): The dots per inch of the figure
+        make_hillshade (bool): If true and there is no _hs raster, the hillshade is made from the DEM and written next to it
 
 
     Returns:
@@ -303,6 +324,10 @@ def PrintChannelsAndBasins(DataDirectory,fname_prefix, add_basin_labels = True,
     raster_ext = '.bil'
     #BackgroundRasterName = fname_prefix+raster_ext
     HillshadeName = fname_prefix+'_hs'+raster_ext
+
+    # make the hillshade if LSDTopoTools hasn't and you asked for it
+    if make_hillshade:
+        LSDP.MakeHillshadeRaster(DataDirectory+fname_prefix+raster_ext, DataDirectory+HillshadeName)
     BasinsName = fname_prefix+'_AllBasins'+raster_ext
     print (BasinsName)
     Basins = LSDP.GetBasinOutlines(DataDirectory, BasinsName)
@@ -335,7 +360,7 @@ def PrintChannelsAndBasins(DataDirectory,fname_prefix, add_basin_labels = True,
 
 
 
-def PrintBasins(DataDirectory,fname_prefix, add_basin_labels = True, cmap = "jet", cbar_loc = "right", size_format = "ESURF", fig_format = "png", dpi = 250):
+def PrintBasins(DataDirectory,fname_prefix, add_basin_labels = True, cmap = "jet", cbar_loc = "right", size_format = "ESURF", fig_format = "png", dpi = 250, make_hillshade = False):
     """
     This function makes a shaded relief plot of the DEM with the basins coloured
     by the basin ID.
@@ -355,6 +380,7 @@ def PrintBasins(DataDirectory,fname_prefix, add_basin_labels = True, cmap = "jet
         size_format (str): Either geomorphology or big. Anything else gets you a 4.9 inch wide figure (standard ESURF size)
         fig_format (str): An image format. png, pdf, eps, svg all valid
         dpi (int): The dots per inch of the figure
+        make_hillshade (bool): If true and there is no _hs raster, the hillshade is made from the DEM and written next to it
 
 
     Returns:
@@ -392,6 +418,10 @@ def PrintBasins(DataDirectory,fname_prefix, add_basin_labels = True, cmap = "jet
     raster_ext = '.bil'
     #BackgroundRasterName = fname_prefix+raster_ext
     HillshadeName = fname_prefix+'_hs'+raster_ext
+
+    # make the hillshade if LSDTopoTools hasn't and you asked for it
+    if make_hillshade:
+        LSDP.MakeHillshadeRaster(DataDirectory+fname_prefix+raster_ext, DataDirectory+HillshadeName)
     BasinsName = fname_prefix+'_AllBasins'+raster_ext
     print (BasinsName)
     Basins = LSDP.GetBasinOutlines(DataDirectory, BasinsName)
@@ -426,7 +456,7 @@ def PrintBasins_Complex(DataDirectory,fname_prefix,
                    use_keys_not_junctions = True, show_colourbar = False,
                    Remove_Basins = [], Rename_Basins = {}, Value_dict= {},
                    cmap = "jet", cbar_loc = "right", size_format = "ESURF",
-                   fig_format = "png", dpi = 250):
+                   fig_format = "png", dpi = 250, make_hillshade = False):
     """
     This function makes a shaded relief plot of the DEM with the basins coloured
     by the basin ID.
@@ -446,6 +476,7 @@ def PrintBasins_Complex(DataDirectory,fname_prefix,
         size_format (str): Either geomorphology or big. Anything else gets you a 4.9 inch wide figure (standard ESURF size)
         fig_format (str): An image format. png, pdf, eps, svg all valid
         dpi (int): The dots per inch of the figure
+        make_hillshade (bool): If true and there is no _hs raster, the hillshade is made from the DEM and written next to it
 
 
     Returns:
@@ -483,6 +514,10 @@ def PrintBasins_Complex(DataDirectory,fname_prefix,
     raster_ext = '.bil'
     #BackgroundRasterName = fname_prefix+raster_ext
     HillshadeName = fname_prefix+'_hs'+raster_ext
+
+    # make the hillshade if LSDTopoTools hasn't and you asked for it
+    if make_hillshade:
+        LSDP.MakeHillshadeRaster(DataDirectory+fname_prefix+raster_ext, DataDirectory+HillshadeName)
     BasinsName = fname_prefix+'_AllBasins'+raster_ext
 
     # This initiates the figure
@@ -10,6 +10,7 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 import numpy as np
 from . import LSDMap_OSystemTools as LSDOst
 from . import LSDMap_GDALIO as LSDMap_IO
+from . import LSDMap_Hillshade as LSDMap_HS
 from pyproj import Proj, transform
 
 
@@ -132,7 +133,8 @@ def SetToConstantValue(raster_filename,new_raster_filename, constant_value, driv
 #==============================================================================
 # This function calcualtes a hillshade and writes to file
 #==============================================================================
-def GetHillshade(raster_filename,new_raster_filename, azimuth = 315, angle_altitude = 45, driver_name = "ENVI", NoDataValue = -9999):
+def GetHillshade(raster_filename,new_raster_filename, azimuth = 315, angle_altitude = 45, driver_name = "ENVI", NoDataValue = -9999,
+                 use_engine = False):
     """This calls the hillshade function from the basic manipulation package, but then prints the resulting raster to file.
 
    Args:
@@ -142,12 +144,19 @@ def GetHillshade(raster_filename,new_raster_filename, azimuth = 315, angle_altit
         angle_altitude (float):Altitude angle of the sun.
         driver_name (str): The raster format (see gdal documentation for options. LSDTopoTools used "ENVI" format.)
         NoDataValue (float): The nodata value. Usually set to -9999.
+        use_engine (bool): If true, the hillshade is made by the hillshade engine (LSDMap_Hillshade) rather than the np.gradient hillshade.
 
     Returns:
         None, but prints a new raster to file.
 
     Author: SMM
     """
+    if use_engine:
+        # get the hillshade from the engine and write to file
+        LSDMap_HS.MakeHillshadeRaster(raster_filename, new_raster_filename, azimuth, angle_altitude,
+                                      driver_name = driver_name, NoDataValue = NoDataValue, overwrite = True)
+        return
+
     # avoid circular import
     from . import LSDMap_BasicPlotting as LSDMBP
     # get the hillshade
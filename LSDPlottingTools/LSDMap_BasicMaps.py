@@ -143,6 +143,11 @@ def PlotSlopeRaster(DataDirectory, fname_prefix, size_format='ESURF', FigFormat=
     raster_ext = '.bil'
     ## Just checking if you have a PP version of it
     BackgroundRasterName = fname_prefix+"_slope"+raster_ext
+
+    # If LSDTopoTools hasn't made the slope raster, make it from the DEM. The slope
+    # and curvature are calculated together so the other plot doesn't have to read the DEM again.
+    if not os.path.isfile(DataDirectory+BackgroundRasterName) and os.path.isfile(DataDirectory+fname_prefix+raster_ext):
+        LSDP.MakeTerrainDerivativeRasters(DataDirectory+fname_prefix+raster_ext, derivatives = ["slope","curvature"])
     
     
 
@@ -213,6 +218,11 @@ def PlotCurveRaster(DataDirectory, fname_prefix, size_format='ESURF', FigFormat=
     raster_ext = '.bil'
     ## Just checking if you have a PP version of it
     BackgroundRasterName = fname_prefix+"_curvature"+raster_ext
+
+    # If LSDTopoTools hasn't made the curvature raster, make it from the DEM. The slope
+    # and curvature are calculated together so the other plot doesn't have to read the DEM again.
+    if not os.path.isfile(DataDirectory+BackgroundRasterName) and os.path.isfile(DataDirectory+fname_prefix+raster_ext):
+        LSDP.MakeTerrainDerivativeRasters(DataDirectory+fname_prefix+raster_ext, derivatives = ["slope","curvature"])
     
     
 
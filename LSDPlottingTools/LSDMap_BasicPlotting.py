@@ -13,6 +13,7 @@ from .adjust_text import adjust_text
 import LSDPlottingTools.LSDMap_GDALIO as LSDMap_IO
 import LSDPlottingTools.LSDMap_BasicManipulation as LSDMap_BM
 import LSDPlottingTools.LSDMap_OSystemTools as LSDOst
+import LSDPlottingTools.LSDMap_Hillshade as LSDMap_HS
 from scipy import signal
 import matplotlib.pyplot as plt
 from LSDPlottingTools import colours
@@ -352,6 +353,9 @@ def GetTicksForUTMNoInversion(FileName,x_max,x_min,y_max,y_min,n_target_tics):
         y_max (float): The maximum value on the y axis (in metres).
         n_target_ticks (int): The number of ticks you want on the axis (this is optimised so you may not get exactly this number)
 
+    Note:
+        If any of the bounds are None the bounds of the whole raster are used.
+
     Returns:
         new_xlocs (float list): List of locations of the ticks in metres.
         new_x_labels (str list): List of strings for ticks, will be location in kilometres.
@@ -361,8 +365,10 @@ def GetTicksForUTMNoInversion(FileName,x_max,x_min,y_max,y_min,n_target_tics):
     Author: SMM
     """
 
-    CellSize,XMin,XMax,YMin,YMax = LSDMap_IO.GetUTMMaxMin(FileName)
-    NDV, xsize, ysize, GeoT, Projection, DataType = LSDMap_IO.GetGeoInfo(FileName)
+    if None in [x_max,x_min,y_max,y_min]:
+        CellSize,XMin,XMax,YMin,YMax = LSDMap_IO.GetUTMMaxMin(FileName)
+    else:
+        XMin,XMax,YMin,YMax = x_min,x_max,y_min,y_max
 
     #print("Getting ticks. YMin: "+str(YMin)+" and YMax: "+str(YMax))
 
@@ -1386,14 +1392,20 @@ def BasinsOverFancyHillshade(FileName, HSName, BasinName, Basin_csv_name, basin_
 
 #==============================================================================
 # Make a simple hillshade plot
-def Hillshade(raster_file, azimuth = 315, angle_altitude = 45, NoDataValue = -9999,z_factor = 1):
+def Hillshade(raster_file, azimuth = 315, angle_altitude = 45, NoDataValue = -9999,z_factor = 1, DataResolution = 1,
+              use_engine = False):
     """Creates a hillshade raster
 
     Args:
-        raster_file (str): The name of the raster file with path and extension.
+        raster_file (str): The name of the raster file with path and extension, or a numpy array of elevations.
         azimuth (float): Azimuth of sunlight
         angle_altitude (float): Angle altitude of sun
         NoDataValue (float): The nodata value of the raster
+        z_factor (float): z_factor
+        DataResolution (float): The size of the pixels if raster_file is an array and use_engine is true. For files it is read from the raster.
+        use_engine (bool): If true, the hillshade engine in LSDMap_Hillshade is used (the LSDTopoTools
+            algorithm, scaled by the pixel size, using the compiled kernel if it has been built).
+            The default keeps the np.gradient hillshade, so existing figures don't change.
 
     Returns:
         HSArray (numpy.array): The hillshade array
@@ -1404,6 +1416,16 @@ def Hillshade(raster_file, azimuth = 315, angle_altitude = 45, NoDataValue = -99
 
     #print("The raster file is: "+raster_file)
 
+    if use_engine:
+        if isinstance(raster_file, np.ndarray):
+            return LSDMap_HS.HillshadeArray(raster_file, DataResolution, azimuth, angle_altitude,
+                                            NoDataValue, z_factor)
+        elif isinstance(raster_file, str) or isinstance(raster_file, type(u"")):
+            return LSDMap_HS.HillshadeRasterFile(raster_file, azimuth, angle_altitude, z_factor)
+        else:
+            print("raster_file must be either a filepath (string) or a numpy array. Try again.")
+            return
+
     # You have passed a filepath to be read in as a raster
     if isinstance(raster_file, str):
       array = LSDMap_IO.ReadRasterArrayBlocks(raster_file,raster_band=1)
@@ -0,0 +1,281 @@
+## LSDMap_BatchPlotting.py
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+## These functions render lots of figures that all have the same layout, for
+## example one chi profile for every river. Each worker process builds the
+## figure (the axes, labels, grids etc.) once from a template function and
+## then only redraws the data for every frame. The frames are shared out
+## between a pool of processes.
+##
+## A template function takes the template arguments and returns anything
+## (usually a dict with the figure, axes and artists that get updated).
+## A frame function takes the template and one frame and saves the figure.
+## Both have to be defined at the top level of a module so they can be sent
+## to the worker processes.
+##
+## The frames can also be made into a video: the frame function returns the
+## PNG of the figure and these are piped straight to ffmpeg in order, so no
+## images are written to disk.
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import time
+import subprocess
+
+# The template of the worker process. Each worker has its own.
+_BatchTemplate = {}
+
+#==============================================================================
+def _InitBatchWorker(template_function, template_args):
+    """This builds the figure template in a worker process.
+    """
+    _BatchTemplate["template"] = template_function(*template_args)
+#==============================================================================
+
+#==============================================================================
+def _CloseBatchTemplate():
+    """This closes the figure of the template (if it is a dict with a "fig").
+    """
+    template = _BatchTemplate.pop("template", None)
+    if isinstance(template, dict) and "fig" in template:
+        import matplotlib.pyplot as plt
+        plt.close(template["fig"])
+#==============================================================================
+
+#==============================================================================
+def _RenderBatchFrame(args):
+    """This renders one frame with the template of this worker process.
+    """
+    frame_function, frame = args
+    return frame_function(_BatchTemplate["template"], frame)
+#==============================================================================
+
+#==============================================================================
+def OpenVideoEncoder(video_name, framerate = 3, video_size = "1230x566"):
+    """This starts ffmpeg reading PNG images from a pipe and writing them to an
+    mp4 video.
+
+    Args:
+        video_name (str): The name of the video, with the path
+        framerate (int): The frames per second
+        video_size (str): The size of the video in pixels, "widthxheight"
+
+    Returns:
+        The ffmpeg process. Write the PNGs to its stdin.
+    """
+    system_call = ["ffmpeg", "-y", "-f", "image2pipe", "-vcodec", "png", "-framerate", str(framerate), "-i", "-",
+                   "-vcodec", "libx264", "-s", video_size, "-pix_fmt", "yuv420p", video_name]
+    print(" ".join(system_call))
+    return subprocess.Popen(system_call, stdin = subprocess.PIPE)
+#==============================================================================
+
+#==============================================================================
+def RenderFigureBatch(template_function, frame_function, frames, template_args = (), n_processes = None,
+                      video_name = None, framerate = 3, video_size = "1230x566"):
+    """This renders a batch of figures with the same layout.
+
+    Args:
+        template_function (function): makes the figure template from template_args
+        frame_function (function): draws one frame on the template and saves it. It returns the name of the saved file,
+            or the PNG of the figure (as bytes) if you are making a video.
+        frames (list): The data for each figure. They are rendered in this order.
+        template_args (tuple): The arguments of template_function
+        n_processes (int): The number of processes. Default is the number of CPUs. If 1 everything is done in this process.
+        video_name (str): If this is given the frames are piped to ffmpeg and made into this video
+        framerate (int): The frames per second of the video
+        video_size (str): The size of the video in pixels, "widthxheight"
+
+    Returns:
+        list: the names of the files, in the same order as frames. If you are making a video it is just the video name.
+    """
+    from multiprocessing import Pool, cpu_count
+
+    start_time = time.time()
+    n_total = len(frames)
+    if n_total == 0:
+        return []
+
+    if n_processes is None:
+        n_processes = cpu_count()
+    n_processes = max(1, min(n_processes, n_total))
+    jobs = [(frame_function, frame) for frame in frames]
+    report_every = max(1, n_total//20)
+
+    # the encoder is started first so a failure to start it leaves no workers behind
+    encoder = None
+    if video_name is not None:
+        encoder = OpenVideoEncoder(video_name, framerate, video_size)
+
+    pool = None
+    file_names = []
+    try:
+        if n_processes == 1:
+            _InitBatchWorker(template_function, template_args)
+            results = (_RenderBatchFrame(job) for job in jobs)
+        else:
+            pool = Pool(n_processes, initializer = _InitBatchWorker, initargs = (template_function, template_args))
+            results = pool.imap(_RenderBatchFrame, jobs, chunksize = max(1, n_total//(4*n_processes)))
+
+        for n_done, this_file in enumerate(results, 1):
+            if encoder is not None:
+                encoder.stdin.write(this_file)
+            else:
+                file_names.append(this_file)
+            if n_done % report_every == 0 or n_done == n_total:
+                print("Rendered "+str(n_done)+" of "+str(n_total)+" figures in "+str(round(time.time()-start_time, 1))+" s")
+    except BaseException:
+        # stop the workers now rather than letting them render the rest of the queue
+        if pool is not None:
+            pool.terminate()
+        raise
+    else:
+        if pool is not None:
+            pool.close()
+    finally:
+        if pool is not None:
+            pool.join()
+        else:
+            _CloseBatchTemplate()
+        if encoder is not None:
+            encoder.stdin.close()
+            encoder.wait()
+
+    if video_name is not None:
+        return [video_name]
+    return file_names
+#==============================================================================
+
+#==============================================================================
+def PartitionByColumn(df, column):
+    """This splits a dataframe into one dataframe for each value of a column with
+    a single groupby, rather than masking the dataframe for each value.
+
+    Args:
+        df (pandas dataframe): The dataframe
+        column (str): The column to split on, e.g. "source_key"
+
+    Returns:
+        dict: where the key is the value of the column and the value is the dataframe
+    """
+    return dict((key, group) for key, group in df.groupby(column, sort=True))
+#==============================================================================
+
+#==============================================================================
+# RUNNING INDEPENDENT TASKS
+# These run a list of independent tasks (for example all the plots of one
+# sensitivity run) on a pool of processes and keep a record of how long each
+# took and whether it failed. A task is a dict with:
+#   "name": a name for the task
+#   "calls": a list of (function, args, kwargs) that are run in order
+# Any other keys (e.g. the directory) are copied to the record of the task.
+# A task that raises an exception is recorded as failed and the others carry on.
+#==============================================================================
+def _RunBatchTask(task):
+    """This runs the calls of one task and times them.
+    """
+    import sys
+    import traceback
+
+    record = dict((key, value) for key, value in task.items() if key != "calls")
+    record["status"] = "done"
+    record["error"] = None
+    start_time = time.time()
+    record["start"] = start_time
+    try:
+        for function, args, kwargs in task["calls"]:
+            function(*args, **kwargs)
+    except Exception as e:
+        record["status"] = "failed"
+        record["error"] = repr(e)
+        record["traceback"] = traceback.format_exc()
+    finally:
+        # the plotting functions don't always close their figures
+        if "matplotlib.pyplot" in sys.modules:
+            sys.modules["matplotlib.pyplot"].close("all")
+    record["seconds"] = round(time.time()-start_time, 3)
+    return record
+#==============================================================================
+
+#==============================================================================
+def RunTaskPool(tasks, n_processes = None):
+    """This runs independent tasks on a pool of processes.
+
+    Args:
+        tasks (list): The tasks, each a dict with a "name" and a list of "calls" (function, args, kwargs).
+            The functions have to be defined at the top level of a module.
+        n_processes (int): The number of processes. Default is the number of CPUs. If 1 everything is done in this process.
+
+    Returns:
+        list: a record of each task (in the same order as tasks) with its "status" ("done" or "failed"),
+        "error", "start" and "seconds", plus the other keys of the task.
+    """
+    from multiprocessing import Pool, cpu_count
+
+    start_time = time.time()
+    n_total = len(tasks)
+    if n_total == 0:
+        return []
+
+    if n_processes is None:
+        n_processes = cpu_count()
+    n_processes = max(1, min(n_processes, n_total))
+
+    records = [None]*n_total
+    jobs = [dict(task, task_index = i) for i, task in enumerate(tasks)]
+    if n_processes == 1:
+        results = (_RunBatchTask(job) for job in jobs)
+        pool = None
+    else:
+        # chunksize of 1: the tasks can take very different times
+        pool = Pool(n_processes)
+        results = pool.imap_unordered(_RunBatchTask, jobs, chunksize = 1)
+
+    try:
+        for n_done, record in enumerate(results, 1):
+            records[record.pop("task_index")] = record
+            print("Finished "+str(n_done)+" of "+str(n_total)+" tasks: "+str(record["name"])+" ("+record["status"]+
+                  ", "+str(record["seconds"])+" s)")
+    except BaseException:
+        # stop the workers now rather than letting them run the rest of the tasks
+        if pool is not None:
+            pool.terminate()
+        raise
+    else:
+        if pool is not None:
+            pool.close()
+    finally:
+        if pool is not None:
+            pool.join()
+
+    print("The tasks took "+str(round(time.time()-start_time, 1))+" s")
+    return records
+#==============================================================================
+
+#==============================================================================
+def WriteRunReport(report_name, records, **run_info):
+    """This writes the records of a run of tasks to a json file.
+
+    Args:
+        report_name (str): The name of the json file, with the path
+        records (list): The records from RunTaskPool
+        run_info: Anything else you want in the report (e.g. the arguments of the run)
+
+    Returns:
+        list: the names of the failed tasks
+    """
+    import json
+
+    failed = [record["name"] for record in records if record["status"] != "done"]
+    report = dict(run_info)
+    report["n_tasks"] = len(records)
+    report["n_failed"] = len(failed)
+    report["failed"] = failed
+    report["total_task_seconds"] = round(sum(record["seconds"] for record in records), 3)
+    report["tasks"] = records
+
+    with open(report_name, "w") as f:
+        json.dump(report, f, indent = 2, sort_keys = True)
+    print("I've written the report of the run to "+report_name)
+    if failed:
+        print("WARNING! These tasks failed: "+", ".join(failed))
+    return failed
+#==============================================================================
@@ -0,0 +1,229 @@
+## LSDMap_BuildManifest.py
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+## These functions keep track of which figures need to be remade when a
+## plotting script is run again. Every plotting call (a "step") is recorded in
+## a json manifest in the data directory with:
+##   the function and the parameters it was called with
+##   the input files (path, size and modification time, or an md5 hash)
+##   the names of the files it wrote
+## The manifest also keeps the size and modification time of every file
+## written by any step, as it was left by the last step that wrote it. When a
+## step is run again with the same parameters and the same inputs, and its
+## outputs are still there and untouched since the build wrote them, it is
+## skipped. Since the stamp of an output is kept once, two steps that write
+## the same file (e.g. the m/n summary csv) don't make each other out of date.
+##
+## The inputs of a step are the data files in the directory that start with
+## one of the input prefixes (csv files and rasters). This is the prefix of
+## the DEM, plus "basin" for the per-basin files of a parallel run. A data
+## file written by a step (e.g. the m/n summary csv) is an input of the steps
+## that come after it in the script, but not of the step itself or of the
+## steps before it, so the steps have to be run in the order of their
+## dependencies. A change to any data file remakes all the figures, and a step
+## that rewrites a data file remakes the steps after it.
+##
+## The outputs are found by looking at which files in the directory (and its
+## sub-directories) were created or changed while the step ran.
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import json
+import time
+import hashlib
+
+# The extensions of the files that are inputs to the plots
+BuildInputExtensions = [".csv", ".bil", ".hdr", ".tif", ".asc", ".flt"]
+
+# Directories (by their ending) that are never looked at for outputs
+BuildIgnoredDirectories = []
+
+# Parameters that don't change the figures, so they are not part of a step
+BuildIgnoredParameters = ["n_processes"]
+
+#==============================================================================
+def GetFileStamp(file_name, use_hash = False):
+    """This gets the size and modification time of a file, or its md5 hash.
+
+    Args:
+        file_name (str): The name of the file, with the path
+        use_hash (bool): If true the md5 hash is used instead of the modification time
+
+    Returns:
+        list: the size in bytes and the modification time (or the hash)
+    """
+    file_stat = os.stat(file_name)
+    if not use_hash:
+        return [int(file_stat.st_size), float(file_stat.st_mtime)]
+
+    md5 = hashlib.md5()
+    with open(file_name, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            md5.update(chunk)
+    return [int(file_stat.st_size), md5.hexdigest()]
+#==============================================================================
+
+#==============================================================================
+def _GetStepKey(function, args, kwargs):
+    """This makes the key of a step from the function and its parameters.
+    """
+    description = [function.__module__+"."+function.__name__,
+                   [repr(a) for a in args],
+                   sorted([str(k), repr(v)] for k, v in kwargs.items() if k not in BuildIgnoredParameters)]
+    return json.dumps(description, sort_keys = True)
+#==============================================================================
+
+class BuildManifest(object):
+
+    # The constructor: it needs the directory and the prefix of the data files
+    def __init__(self, DataDirectory, fname_prefix = "", manifest_name = None, force = False, use_hash = False,
+                 input_prefixes = None):
+        """This object decides which plotting steps have to be run and records
+        what each step read and wrote.
+
+        Args:
+            DataDirectory (str): the data directory
+            fname_prefix (str): The prefix of the data files. If empty all the data files in the directory are inputs.
+            manifest_name (str): The name of the manifest. Default is DataDirectory+fname_prefix+"_build_manifest.json"
+            force (bool): If true every step is run (and recorded)
+            use_hash (bool): If true the inputs are compared by their md5 hash rather than their modification time
+            input_prefixes (list): The prefixes of the input files. Default is [fname_prefix]. Add "basin" for a parallel run.
+        """
+        if not DataDirectory:
+            DataDirectory = os.getcwd()
+        self.DataDirectory = DataDirectory
+        self.fname_prefix = fname_prefix if fname_prefix else ""
+        if manifest_name is None:
+            manifest_name = os.path.join(DataDirectory, self.fname_prefix+"_build_manifest.json")
+        self.manifest_name = manifest_name
+        if input_prefixes is None:
+            input_prefixes = [self.fname_prefix]
+        self.input_prefixes = tuple(input_prefixes)
+        self.force = force
+        self.use_hash = use_hash
+        self.n_run = 0
+        self.n_skipped = 0
+
+        # the files written by the steps that have been run (or skipped) so far
+        self.produced = set()
+
+        self.steps = {}
+        self.outputs = {}
+        if os.path.isfile(manifest_name):
+            try:
+                with open(manifest_name, "r") as f:
+                    manifest = json.load(f)
+                self.steps = manifest["steps"]
+                self.outputs = manifest["outputs"]
+            except (IOError, OSError, ValueError, KeyError):
+                print("I couldn't read the build manifest "+manifest_name+", I'll remake all the figures.")
+                self.steps = {}
+                self.outputs = {}
+
+    def _GetOutputFiles(self):
+        """The files written by any of the recorded steps."""
+        return set(self.outputs.keys())
+
+    def _IsInput(self, fname, output_files, own_outputs):
+        """Checks if a file written by the steps is an input of a step. Only the
+        files written by the steps before it are."""
+        if fname in own_outputs:
+            return False
+        return fname not in output_files or fname in self.produced
+
+    def _GetInputStamps(self, own_outputs = ()):
+        """The stamps of the input files of a step.
+
+        Args:
+            own_outputs (list): The files the step wrote the last time it was run
+        """
+        output_files = self._GetOutputFiles()
+        stamps = {}
+        for fname in sorted(os.listdir(self.DataDirectory)):
+            full_name = os.path.join(self.DataDirectory, fname)
+            if (fname.startswith(self.input_prefixes) and os.path.splitext(fname)[1].lower() in BuildInputExtensions
+                    and self._IsInput(full_name, output_files, own_outputs) and os.path.isfile(full_name)):
+                stamps[full_name] = GetFileStamp(full_name, self.use_hash)
+        return stamps
+
+    def _GetDirectorySnapshot(self):
+        """The size and modification time of every file in the directory tree."""
+        snapshot = {}
+        for root, dirs, files in os.walk(self.DataDirectory):
+            dirs[:] = [d for d in dirs if not any(d.endswith(ignored) for ignored in BuildIgnoredDirectories)]
+            for fname in files:
+                full_name = os.path.join(root, fname)
+                if full_name == self.manifest_name or fname.startswith(os.path.basename(self.manifest_name)):
+                    continue
+                try:
+                    snapshot[full_name] = GetFileStamp(full_name)
+                except OSError:
+                    pass
+        return snapshot
+
+    def _IsUpToDate(self, step, input_stamps):
+        """Checks if a recorded step still matches its inputs and outputs."""
+        if not step["outputs"]:
+            return False
+        # files that turned out to be written by this step or a later one are not inputs
+        output_files = self._GetOutputFiles()
+        recorded_inputs = dict((fname, stamp) for fname, stamp in step["inputs"].items()
+                               if self._IsInput(fname, output_files, step["outputs"]))
+        if recorded_inputs != input_stamps:
+            return False
+        for fname in step["outputs"]:
+            if fname not in self.outputs or not os.path.isfile(fname) or GetFileStamp(fname) != self.outputs[fname]:
+                return False
+        return True
+
+    def Save(self):
+        """This writes the manifest. It is written to a temporary file first so
+        a run that is killed never leaves half a manifest.
+        """
+        tmp_name = self.manifest_name+".tmp%i" % os.getpid()
+        with open(tmp_name, "w") as f:
+            json.dump({"steps": self.steps, "outputs": self.outputs}, f, indent = 1, sort_keys = True)
+        if os.path.isfile(self.manifest_name):
+            os.remove(self.manifest_name)
+        os.rename(tmp_name, self.manifest_name)
+
+    def Run(self, function, *args, **kwargs):
+        """This runs a plotting step, unless it is up to date.
+
+        Args:
+            function: The plotting function
+            args, kwargs: The arguments of the function
+
+        Returns:
+            The result of the function (None if the step was skipped)
+        """
+        key = _GetStepKey(function, args, kwargs)
+        own_outputs = self.steps[key]["outputs"] if key in self.steps else []
+        input_stamps = self._GetInputStamps(own_outputs)
+        if not self.force and key in self.steps and self._IsUpToDate(self.steps[key], input_stamps):
+            print("The figures of "+function.__name__+" are up to date, I'm skipping it.")
+            self.produced.update(own_outputs)
+            self.n_skipped += 1
+            return None
+
+        before = self._GetDirectorySnapshot()
+        start_time = time.time()
+        # forget the step until it has finished, so a failed step is always run again
+        self.steps.pop(key, None)
+        result = function(*args, **kwargs)
+        after = self._GetDirectorySnapshot()
+
+        outputs = dict((fname, stamp) for fname, stamp in after.items() if before.get(fname) != stamp)
+        input_stamps = dict((fname, stamp) for fname, stamp in input_stamps.items() if fname not in outputs)
+        self.outputs.update(outputs)
+        self.produced.update(outputs.keys())
+        self.steps[key] = {"name": function.__name__, "inputs": input_stamps, "outputs": sorted(outputs.keys()),
+                           "seconds": round(time.time()-start_time, 3)}
+        self.n_run += 1
+        self.Save()
+        return result
+
+    def PrintSummary(self):
+        """This prints how many steps were run and skipped.
+        """
+        print("I ran "+str(self.n_run)+" plotting steps and skipped "+str(self.n_skipped)+" that were up to date.")
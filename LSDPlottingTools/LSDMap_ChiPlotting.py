@@ -64,6 +64,55 @@ def ConvertBasinIndexToJunction(BasinPointData,BasinIndexList):
     return basin_junction_list
 
 
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+def GetSourceIndex(Source, Chi):
+    """This sorts the chi points by source once so that the points of every source
+    can be found without masking the whole dataset for each source.
+
+    Args:
+        Source (array): The source key of each point
+        Chi (array): The chi coordinate of each point
+
+    Returns:
+        A dict with:
+            "order": the indices of the points sorted by source (the order within a source is kept)
+            "sources": the source keys, from low to high
+            "offsets": where each source starts in "order"
+            "lengths": the number of points in each source
+            "argmax": the index of the point with the highest chi in each source
+            "argmin": the index of the point with the lowest chi in each source
+        The indices in "argmax" and "argmin" refer to the original arrays.
+    """
+    Source = np.asarray(Source)
+    Chi = np.asarray(Chi, dtype=float)
+
+    # A stable sort keeps the points of a source in their original order,
+    # so the first maximum of a source is the same point argmax would find
+    order = np.argsort(Source, kind="mergesort")
+    sorted_source = Source[order]
+    sorted_chi = Chi[order]
+
+    offsets = np.flatnonzero(np.r_[True, sorted_source[1:] != sorted_source[:-1]]) if order.size else np.zeros(0, dtype=int)
+    lengths = np.diff(np.r_[offsets, order.size])
+    sources = sorted_source[offsets]
+
+    if order.size:
+        max_chi = np.maximum.reduceat(sorted_chi, offsets)
+        min_chi = np.minimum.reduceat(sorted_chi, offsets)
+        segment = np.repeat(np.arange(offsets.size), lengths)
+        positions = np.arange(order.size)
+        no_match = order.size
+        first_max = np.minimum.reduceat(np.where(sorted_chi == max_chi[segment], positions, no_match), offsets)
+        first_min = np.minimum.reduceat(np.where(sorted_chi == min_chi[segment], positions, no_match), offsets)
+        argmax = order[first_max]
+        argmin = order[first_min]
+    else:
+        argmax = np.zeros(0, dtype=int)
+        argmin = np.zeros(0, dtype=int)
+
+    return {"order": order, "sources": sources, "offsets": offsets, "lengths": lengths,
+            "argmax": argmax, "argmin": argmin}
+
 ##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
 def FindSourceInformation(thisPointData):
     """This function finds the source locations, with chi elevation, flow distance, etc.
@@ -79,59 +128,30 @@ def FindSourceInformation(thisPointData):
     """
 
     # Get the chi, m_chi, basin number, and source ID code
-    chi = thisPointData.QueryData('chi')
-    chi = [float(x) for x in chi]
-    elevation = thisPointData.QueryData('elevation')
-    elevation = [float(x) for x in elevation]
-    fdist = thisPointData.QueryData('flow distance')
-    fdist = [float(x) for x in fdist]
-    source = thisPointData.QueryData('source_key')
-    source = [int(x) for x in source]
-    latitude = thisPointData.GetLatitude()
-    longitude = thisPointData.GetLongitude()
-
-
+    Chi = np.asarray(thisPointData.QueryData('chi'), dtype=float)
+    Elevation = np.asarray(thisPointData.QueryData('elevation'), dtype=float)
+    Fdist = np.asarray(thisPointData.QueryData('flow distance'), dtype=float)
+    Source = np.asarray(thisPointData.QueryData('source_key')).astype(int)
+    Latitude = np.asarray(thisPointData.GetLatitude())
+    Longitude = np.asarray(thisPointData.GetLongitude())
 
+    print("N sources is: "+str(Source.max()+1))
 
-    Chi = np.asarray(chi)
-    Elevation = np.asarray(elevation)
-    Fdist = np.asarray(fdist)
-    Source = np.asarray(source)
-    Latitude = np.asarray(latitude)
-    Longitude = np.asarray(longitude)
-
-    n_sources = Source.max()+1
-    print("N sources is: "+str(n_sources))
-
-    # This loops through all the source indices, and then picks out the
-    # Elevation, chi coordinate and flow distance of each node
+    # The source index gives the node with the highest chi (the source) and the
+    # lowest chi of every source in one pass.
     # Then it returns a dictionary containing the elements of the node
+    source_index = GetSourceIndex(Source, Chi)
     these_source_nodes = {}
-    for src_idx in range(0,n_sources):
-        m = np.ma.masked_where(Source!=src_idx, Source)
-
-        # Mask the unwanted values
-        maskX = np.ma.masked_where(np.ma.getmask(m), Chi)
-        maskElevation = np.ma.masked_where(np.ma.getmask(m), Elevation)
-        maskFlowDistance = np.ma.masked_where(np.ma.getmask(m), Fdist)
-        maskLatitude = np.ma.masked_where(np.ma.getmask(m), Latitude)
-        maskLongitude= np.ma.masked_where(np.ma.getmask(m), Longitude)
-
-        # get the locations of the source
+    for src_idx, idx_of_max, idx_of_min in zip(source_index["sources"], source_index["argmax"], source_index["argmin"]):
         this_dict = {}
-        idx_of_max_FD = maskX.argmax()
-        this_dict["FlowDistance"]=maskFlowDistance[idx_of_max_FD]
-        this_dict["Chi"]=maskX[idx_of_max_FD]
-        this_dict["Elevation"]=maskElevation[idx_of_max_FD]
-        this_dict["Latitude"]=maskLatitude[idx_of_max_FD]
-        this_dict["Longitude"]=maskLongitude[idx_of_max_FD]
-
-        # get the minimum of the source
-        idx_of_min_Chi = maskX.argmin()
-        chi_length = maskX[idx_of_max_FD]-maskX[idx_of_min_Chi]
-        this_dict["SourceLength"]=chi_length
+        this_dict["FlowDistance"]=Fdist[idx_of_max]
+        this_dict["Chi"]=Chi[idx_of_max]
+        this_dict["Elevation"]=Elevation[idx_of_max]
+        this_dict["Latitude"]=Latitude[idx_of_max]
+        this_dict["Longitude"]=Longitude[idx_of_max]
+        this_dict["SourceLength"]=Chi[idx_of_max]-Chi[idx_of_min]
 
-        these_source_nodes[src_idx] = this_dict
+        these_source_nodes[int(src_idx)] = this_dict
 
     return these_source_nodes
 
@@ -1138,6 +1158,12 @@ def ChiProfiles(chi_csv_fname, FigFileName = 'Image.pdf',FigFormat = 'show',
         print("I am defaulting to look at basin 0")
         basin_order_list.append(0)
 
+    # Index the points of each source once, rather than masking all the data for every source
+    if(have_segmented_elevation):
+        source_index = GetSourceIndex(Source, Chi)
+        source_slices = dict((int(source), slice(start, start+length)) for source, start, length in
+                             zip(source_index["sources"], source_index["offsets"], source_index["lengths"]))
+
     texts = []
     bbox_props = dict(boxstyle="circle,pad=0.1", fc="w", ec="k", lw=0.5,alpha = 0.25)
     for basin_number in basin_order_list:
@@ -1163,10 +1189,10 @@ def ChiProfiles(chi_csv_fname, FigFileName = 'Image.pdf',FigFormat = 'show',
             print(myset)
             sources_list = list(myset)
             for source in sources_list:
-                m_mask = np.ma.masked_where(Source!=source, Source)
-                mask_maskX = np.ma.masked_where(np.ma.getmask(m_mask), Chi)
-                maskSegmentedElevation = np.ma.masked_where(np.ma.getmask(m_mask), Segmented_elevation)
-                a_line, = ax.plot(mask_maskX,maskSegmentedElevation,'b',alpha = 0.6)
+                if source not in source_slices:
+                    continue
+                these_points = source_index["order"][source_slices[source]]
+                a_line, = ax.plot(Chi[these_points],Segmented_elevation[these_points],'b',alpha = 0.6)
                 a_line.set_dashes([3,1])
 
 
@@ -10,10 +10,87 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 import osgeo.gdal as gdal
 import osgeo.gdal_array as gdal_array
 import numpy as np
+import os
+from collections import OrderedDict
 from osgeo import osr
 from os.path import exists
 from osgeo.gdalconst import GA_ReadOnly
 
+#==============================================================================
+# The metadata of recently used rasters, so we don't open the same file with
+# GDAL every time we want its extent, nodata or EPSG. Keyed on the absolute path;
+# entries are thrown away if the raster or its header changes on disk.
+RasterMetadataCacheSize = 256
+_RasterMetadataCache = OrderedDict()
+#==============================================================================
+
+#==============================================================================
+def _GetRasterFileStamp(FileName):
+    """This gets the modification time and size of a raster and, if there is one,
+    its ENVI header, so we can tell if the cached metadata is stale.
+    """
+    stat = os.stat(FileName)
+    stamp = [stat.st_mtime, stat.st_size]
+    header_name = FileName[:FileName.rfind('.')]+".hdr"
+    if header_name != FileName and exists(header_name):
+        header_stat = os.stat(header_name)
+        stamp.extend([header_stat.st_mtime, header_stat.st_size])
+    return tuple(stamp)
+#==============================================================================
+
+#==============================================================================
+def GetRasterMetadata(FileName):
+    """This gets the metadata of a raster. The raster is only opened by GDAL the
+    first time it is asked for; after that the metadata comes from a cache that
+    keeps the most recently used RasterMetadataCacheSize rasters.
+
+    Args:
+        FileName (str): The filename (with path and extension) of the raster.
+
+    Return:
+        dict: with the keys NDV, xsize, ysize, GeoT, ProjectionWkt, DataType and EPSG. EPSG is None until GetUTMEPSG has been called.
+    """
+    if exists(FileName) is False:
+            raise Exception('[Errno 2] No such file or directory: \'' + FileName + '\'')
+
+    full_path = os.path.abspath(FileName)
+    stamp = _GetRasterFileStamp(FileName)
+
+    if full_path in _RasterMetadataCache:
+        cached_stamp, metadata = _RasterMetadataCache.pop(full_path)
+        if cached_stamp == stamp:
+            # put it back at the end since it is now the most recently used
+            _RasterMetadataCache[full_path] = (cached_stamp, metadata)
+            return metadata
+
+    SourceDS = gdal.Open(FileName, gdal.GA_ReadOnly)
+    if SourceDS == None:
+        raise Exception("Unable to read the data file")
+
+    band = SourceDS.GetRasterBand(1)
+    metadata = {"NDV": band.GetNoDataValue(),
+                "xsize": SourceDS.RasterXSize,
+                "ysize": SourceDS.RasterYSize,
+                "GeoT": SourceDS.GetGeoTransform(),
+                "ProjectionWkt": SourceDS.GetProjectionRef(),
+                "DataType": gdal.GetDataTypeName(band.DataType),
+                "EPSG": None}
+    SourceDS = None
+
+    _RasterMetadataCache[full_path] = (stamp, metadata)
+    while len(_RasterMetadataCache) > RasterMetadataCacheSize:
+        _RasterMetadataCache.popitem(last = False)
+
+    return metadata
+#==============================================================================
+
+#==============================================================================
+def ClearRasterMetadataCache():
+    """This empties the raster metadata cache.
+    """
+    _RasterMetadataCache.clear()
+#==============================================================================
+
 #==============================================================================
 def getNoDataValue(rasterfn):
     """This gets the nodata value from the raster
@@ -26,9 +103,7 @@ def getNoDataValue(rasterfn):
 
     Author: SMM
     """
-    raster = gdal.Open(rasterfn)
-    band = raster.GetRasterBand(1)
-    return band.GetNoDataValue()
+    return GetRasterMetadata(rasterfn)["NDV"]
 #==============================================================================
 
 #==============================================================================
@@ -243,22 +318,15 @@ def GetGeoInfo(FileName):
     """
 
 
-    if exists(FileName) is False:
-            raise Exception('[Errno 2] No such file or directory: \'' + FileName + '\'')
-
-
-    SourceDS = gdal.Open(FileName, gdal.GA_ReadOnly)
-    if SourceDS == None:
-        raise Exception("Unable to read the data file")
+    metadata = GetRasterMetadata(FileName)
 
-    NDV = SourceDS.GetRasterBand(1).GetNoDataValue()
-    xsize = SourceDS.RasterXSize
-    ysize = SourceDS.RasterYSize
-    GeoT = SourceDS.GetGeoTransform()
+    NDV = metadata["NDV"]
+    xsize = metadata["xsize"]
+    ysize = metadata["ysize"]
+    GeoT = metadata["GeoT"]
     Projection = osr.SpatialReference()
-    Projection.ImportFromWkt(SourceDS.GetProjectionRef())
-    DataType = SourceDS.GetRasterBand(1).DataType
-    DataType = gdal.GetDataTypeName(DataType)
+    Projection.ImportFromWkt(metadata["ProjectionWkt"])
+    DataType = metadata["DataType"]
 
     return NDV, xsize, ysize, GeoT, Projection, DataType
 #==============================================================================
@@ -276,19 +344,16 @@ def GetUTMEPSG(FileName):
 
     Author: SMM
     """
-    if exists(FileName) is False:
-            raise Exception('[Errno 2] No such file or directory: \'' + FileName + '\'')
-
-    # see if the file exists and get the dataset
-    SourceDS = gdal.Open(FileName, gdal.GA_ReadOnly)
-    if SourceDS == None:
-        raise Exception("Unable to read the data file")
+    # see if the file exists and get the metadata
+    metadata = GetRasterMetadata(FileName)
+    if metadata["EPSG"] is not None:
+        return metadata["EPSG"]
 
     EPSG_string = 'NULL'
 
     # get the projection
     print("Let me get that projection for you")
-    prj=SourceDS.GetProjection()
+    prj=metadata["ProjectionWkt"]
     srs=osr.SpatialReference(wkt=prj)
 
     if srs.IsProjected:
@@ -342,6 +407,7 @@ def GetUTMEPSG(FileName):
 
 
     print(EPSG_string)
+    metadata["EPSG"] = EPSG_string
     return EPSG_string
 
 
@@ -384,10 +450,7 @@ def CheckNoData(FileName):
         raise Exception('[Errno 2] No such file or directory: \'' + FileName + '\'')
 
     # read the file, and check if there is a no data value
-    SourceDS = gdal.Open(FileName, gdal.GA_ReadOnly)
-    if SourceDS == None:
-        raise Exception("Unable to read the data file")
-    NoDataValue = SourceDS.GetRasterBand(1).GetNoDataValue()
+    NoDataValue = getNoDataValue(FileName)
 
     print("In the check nodata routine. Nodata is: ")
     print(NoDataValue)
@@ -412,6 +475,9 @@ def CheckNoData(FileName):
 
             this_file.close()
 
+            # the header has changed so the cached metadata is out of date
+            _RasterMetadataCache.pop(os.path.abspath(FileName), None)
+
     NDV, xsize, ysize, GeoT, Projection, DataType = GetGeoInfo(FileName)
 
     return xsize*ysize
@@ -420,14 +486,65 @@ def CheckNoData(FileName):
 
 
 #==============================================================================
-def ReadRasterArrayBlocks(raster_file,raster_band=1):
+def GetPolicyDtype(native_dtype, dtype = "float64"):
+    """This gets the numpy dtype that a raster reader should return.
+
+    Args:
+        native_dtype (np.dtype): The dtype of the data on disk
+        dtype (str): The dtype policy. Options are:
+
+            * "float64": everything is converted to 64 bit floats and nodata becomes NaN (the old behaviour)
+            * "float32": everything is converted to 32 bit floats and nodata becomes NaN. Half the memory of float64.
+            * "native": the data keeps the type it has on disk and nodata is tracked with a mask (a numpy masked array)
+
+    Return:
+        np.dtype: the dtype of the array
+    """
+    if dtype == "float64":
+        return np.dtype('float64')
+    elif dtype == "float32":
+        return np.dtype('float32')
+    elif dtype == "native":
+        return np.dtype(native_dtype)
+    else:
+        raise ValueError("Sorry, the dtype policy: "+str(dtype)+" is not supported. Options are float64, float32 and native.")
+#==============================================================================
+
+#==============================================================================
+def ApplyNoDataPolicy(data_array, NoDataValue, dtype = "float64"):
+    """This marks the nodata in an array that has already been cast with GetPolicyDtype.
+    Float policies put NaN in the nodata pixels (in place). The native policy returns
+    a masked array that shares memory with data_array.
+
+    Args:
+        data_array (np.array): The raster data
+        NoDataValue (float): The nodata value, or None if there isn't one
+        dtype (str): The dtype policy (see GetPolicyDtype)
+
+    Return:
+        np.array or np.ma.MaskedArray: The array with the nodata marked
+    """
+    if dtype == "native":
+        if NoDataValue is None:
+            return np.ma.MaskedArray(data_array, mask = np.ma.nomask, copy = False)
+        else:
+            return np.ma.masked_equal(data_array, NoDataValue, copy = False)
+
+    if NoDataValue is not None:
+        data_array[data_array == NoDataValue] = np.nan
+    return data_array
+#==============================================================================
+
+#==============================================================================
+def ReadRasterArrayBlocks(raster_file,raster_band=1,dtype="float64"):
     """This reads a raster file (from GDAL) into an array. The "blocks" bit makes it efficient.
     Args:
         FileName (str): The filename (with path and extension) of the raster.
         raster_band (int): the band of the raster (almost all uses with LSDTopoTools will have a 1 band raster)
+        dtype (str): The dtype policy: "float64", "float32" or "native". See GetPolicyDtype.
 
     Return:
-        np.array: A numpy array with the data from the raster.
+        np.array: A numpy array with the data from the raster (a masked array if dtype is "native").
 
     Author: SMM
     """
@@ -462,7 +579,8 @@ def ReadRasterArrayBlocks(raster_file,raster_band=1):
     min_value = band.GetMinimum()
 
     # now initiate the array
-    data_array = np.zeros((ysize,xsize))
+    native_dtype = gdal_array.GDALTypeCodeToNumericTypeCode(band.DataType)
+    data_array = np.zeros((ysize,xsize), dtype = GetPolicyDtype(native_dtype,dtype))
 
     #print "data shape is: "
     #print data_array.shape
@@ -491,117 +609,674 @@ def ReadRasterArrayBlocks(raster_file,raster_band=1):
             data_array[i:i+rows,j:j+cols] = values
 
     print("NoData is:", NoDataValue)
-    if NoDataValue is not None:
-        nodata_mask = data_array == NoDataValue
-        data_array[nodata_mask] = np.nan
+    data_array = ApplyNoDataPolicy(data_array, NoDataValue, dtype)
 
     return data_array
 #==============================================================================
 
 #==============================================================================
-def ReadRasterArrayBlocks_numpy(raster_file,raster_band=1):
+def GetRasterWindowFromExtent(FileName, extent):
+    """This converts an extent in map coordinates into a pixel window of the raster.
+    The window is grown outwards to whole pixels and clipped to the edges of the raster.
+
+    Args:
+        FileName (str): The filename (with path and extension) of the raster.
+        extent (list): The extent in map units as [XMin,XMax,YMin,YMax]
+
+    Return:
+        list: The window as [x_offset, y_offset, n_cols, n_rows], all in pixels
     """
-    This reads a raster file into an array using numpy. The "blocks" bit makes it efficient.
+
+    NDV, xsize, ysize, GeoT, Projection, DataType = GetGeoInfo(FileName)
+    XMin = GeoT[0]
+    YMax = GeoT[3]
+    x_res = GeoT[1]
+    y_res = abs(GeoT[5])
+
+    # rows count down from the top of the raster
+    col_min = int(np.floor((extent[0]-XMin)/x_res))
+    col_max = int(np.ceil((extent[1]-XMin)/x_res))
+    row_min = int(np.floor((YMax-extent[3])/y_res))
+    row_max = int(np.ceil((YMax-extent[2])/y_res))
+
+    col_min = min(max(col_min,0),xsize)
+    col_max = min(max(col_max,0),xsize)
+    row_min = min(max(row_min,0),ysize)
+    row_max = min(max(row_max,0),ysize)
+
+    if col_max <= col_min or row_max <= row_min:
+        raise Exception("The extent "+str(extent)+" does not overlap the raster "+FileName)
+
+    return [col_min,row_min,col_max-col_min,row_max-row_min]
+#==============================================================================
+
+#==============================================================================
+def GetRasterWindowExtent(FileName, window):
+    """This gets the extent in map coordinates of a pixel window of the raster.
+
     Args:
         FileName (str): The filename (with path and extension) of the raster.
-        raster_band (int): the band of the raster (almost all uses with LSDTopoTools will have a 1 band raster) Doesn't work yet for more than one band.
+        window (list): The window as [x_offset, y_offset, n_cols, n_rows]
 
     Return:
-        np.array: A numpy array with the data from the raster.
+        list: The extent of the window as [XMin,XMax,YMin,YMax]
+    """
 
-    Author: SMM
+    NDV, xsize, ysize, GeoT, Projection, DataType = GetGeoInfo(FileName)
+    x_res = GeoT[1]
+    y_res = abs(GeoT[5])
+
+    XMin = GeoT[0]+window[0]*x_res
+    XMax = XMin+window[2]*x_res
+    YMax = GeoT[3]-window[1]*y_res
+    YMin = YMax-window[3]*y_res
+
+    return [XMin,XMax,YMin,YMax]
+#==============================================================================
+
+#==============================================================================
+def ReadRasterWindow(raster_file, raster_band=1, window=None, extent=None, decimation=1, dtype="float64"):
+    """This reads part of a raster into an array. Only the requested window is read from disk,
+    so you can plot a small area of a very big DEM without loading the whole thing.
+
+    Args:
+        raster_file (str): The filename (with path and extension) of the raster.
+        raster_band (int): the band of the raster (almost all uses with LSDTopoTools will have a 1 band raster)
+        window (list): The pixel window as [x_offset, y_offset, n_cols, n_rows]. If None the whole raster is read.
+        extent (list): The extent in map units as [XMin,XMax,YMin,YMax]. If given it overrides the window.
+        decimation (int): Only read every nth pixel. GDAL does the resampling (nearest neighbour) so the full resolution data is never held in memory.
+        dtype (str): The dtype policy: "float64", "float32" or "native". See GetPolicyDtype.
+
+    Return:
+        np.array: A numpy array with the data from the window, nodata set to NaN (or masked if dtype is "native").
     """
 
-    print("I will now use numpy.fromfile to load your raster, I still need to be tested, If something goes wrong switch back to the classic method by switching NFF_opti = False. Classic method = unefficient.")
     if exists(raster_file) is False:
             raise Exception('[Errno 2] No such file or directory: \'' + raster_file + '\'')
 
-    with open(raster_file[:-3]+"hdr","r") as hdr_file:
-        print("I am opening your raster info")
-        no_data_hdr = -9999 # setting the default noData in case there is no value setted in the hdr file
-        for line in hdr_file:
-            #testing the data type
-            if(line[0:9] == "data type"):
-                info_dtype = line[-2:]
-                info_dtype = int(info_dtype)
+    if extent is not None:
+        window = GetRasterWindowFromExtent(raster_file, extent)
+
+    dataset = gdal.Open(raster_file, GA_ReadOnly )
+    if dataset == None:
+        raise Exception("Unable to read the data file")
+
+    band = dataset.GetRasterBand(raster_band)
+    NoDataValue = band.GetNoDataValue()
+
+    if window is None:
+        window = [0,0,band.XSize,band.YSize]
+    x_offset,y_offset,n_cols,n_rows = window
+
+    decimation = max(int(decimation),1)
+    buf_cols = max(int(np.ceil(n_cols/decimation)),1)
+    buf_rows = max(int(np.ceil(n_rows/decimation)),1)
+
+    values = band.ReadAsArray(x_offset, y_offset, n_cols, n_rows, buf_xsize = buf_cols, buf_ysize = buf_rows)
+    data_array = values.astype(GetPolicyDtype(values.dtype,dtype), copy = False)
+    data_array = ApplyNoDataPolicy(data_array, NoDataValue, dtype)
+
+    return data_array
+#==============================================================================
+
+#==============================================================================
+class LazyRaster(object):
+    """
+    A handle on a raster (or a window of a raster) that does not read any data until
+    the data is asked for. The extent and size are available straight away from the
+    header, so you can set up a figure before anything is loaded.
+
+    Args:
+        raster_file (str): The filename (with path and extension) of the raster.
+        raster_band (int): the band of the raster
+        window (list): The pixel window as [x_offset, y_offset, n_cols, n_rows]. If None the whole raster is used.
+        extent (list): The extent in map units as [XMin,XMax,YMin,YMax]. If given it overrides the window.
+        decimation (int): Only read every nth pixel.
+        dtype (str): The dtype policy: "float64", "float32" or "native". See GetPolicyDtype.
+        use_memmap (bool): If true, the data is memory mapped with ReadRasterArrayBlocks_numpy rather than read through GDAL. Only works for ENVI and EHdr rasters.
+    """
+    def __init__(self, raster_file, raster_band=1, window=None, extent=None, decimation=1, dtype="float64",
+                 use_memmap=False):
+
+        if exists(raster_file) is False:
+            raise Exception('[Errno 2] No such file or directory: \'' + raster_file + '\'')
+
+        self._raster_file = raster_file
+        self._raster_band = raster_band
+        self._decimation = max(int(decimation),1)
+        self._dtype = dtype
+        self._use_memmap = use_memmap
+
+        if extent is not None:
+            self._window = GetRasterWindowFromExtent(raster_file, extent)
+        elif window is not None:
+            self._window = list(window)
+        else:
+            NDV, xsize, ysize, GeoT, Projection, DataType = GetGeoInfo(raster_file)
+            self._window = [0,0,xsize,ysize]
+
+        self._extent = GetRasterWindowExtent(raster_file, self._window)
+        self._data = None
+
+    @property
+    def raster_file(self):
+        return self._raster_file
+
+    @property
+    def window(self):
+        return self._window
+
+    @property
+    def extent(self):
+        return self._extent
+
+    @property
+    def decimation(self):
+        return self._decimation
+
+    @property
+    def shape(self):
+        """The (rows, cols) of the array you will get. Doesn't read the data."""
+        return (max(int(np.ceil(self._window[3]/self._decimation)),1),
+                max(int(np.ceil(self._window[2]/self._decimation)),1))
+
+    @property
+    def is_loaded(self):
+        return self._data is not None
+
+    @property
+    def data(self):
+        """The data array. It is read from disk the first time you ask for it."""
+        if self._data is None:
+            if self._use_memmap:
+                self._data = ReadRasterArrayBlocks_numpy(self._raster_file, self._raster_band,
+                                                         dtype = self._dtype, window = self._window,
+                                                         decimation = self._decimation)
             else:
-                if(line[0:8] == "map info"):
-                    info = line[12:-2]
-                    info = info.split(",")
-                    x_min = float(info[3])
-                    y_max = float(info[4])
-                    x_res = float(info[5])
-                    y_res = float(info[6])
-                    utm_zone = int(info[7])
-                    utm_hemisphere = info[8]
-                else:
-                    if(line[0:7] == "samples"):
-                        num_col = line.replace(" ","").split("=")[1]
-                        print("there are " + str(num_col) + " columns")
-                        num_col = int(num_col)
-                    else:
-                        if(line[0:5] == "lines"):
-                            num_lines = line.replace(" ","").split("=")[1]
-                            print("there are " + str(num_lines) + " lines")
-                            num_lines = int(num_lines)
-                        else:
-                            if(line[0:17] == "data ignore value"):
-                                no_data_hdr = line.replace(" ","").split("=")[1]
-                                print("No data value is: " + str(no_data_hdr) )
-                                no_data_hdr = float(no_data_hdr)
-
-
-        #The type of data representation:
-        #1 = Byte: 8-bit unsigned integer
-        #2 = Integer: 16-bit signed integer
-        #3 = Long: 32-bit signed integer
-        #4 = Floating-point: 32-bit single-precision
-        #5 = Double-precision: 64-bit double-precision floating-point
-        #6 = Complex: Real-imaginary pair of single-precision floating-point
-        #9 = Double-precision complex: Real-imaginary pair of double precision floating-point
-        #12 = Unsigned integer: 16-bit
-        #13 = Unsigned long integer: 32-bit
-        #14 = 64-bit long integer (signed)
-        #15 = 64-bit unsigned long integer (unsigned)
-
-    if(info_dtype == 1):
-        data_type = np.dtype('uint8')
+                self._data = ReadRasterWindow(self._raster_file, self._raster_band,
+                                              window = self._window, decimation = self._decimation,
+                                              dtype = self._dtype)
+        return self._data
+
+    @data.setter
+    def data(self, data_array):
+        self._data = data_array
+
+    def unload(self):
+        """Drops the data so the memory can be reclaimed. It will be re-read if you ask for it again."""
+        self._data = None
+#==============================================================================
+
+#==============================================================================
+# The ENVI data type codes and the numpy types they map to
+ENVIDataTypes = {1: 'uint8',
+                 2: 'int16',
+                 3: 'int32',
+                 4: 'float32',
+                 5: 'float64',
+                 6: 'complex64',
+                 9: 'complex128',
+                 12: 'uint16',
+                 13: 'uint32',
+                 14: 'int64',
+                 15: 'uint64'}
+#==============================================================================
+
+#==============================================================================
+def GetHeaderFileName(raster_file):
+    """This gets the name of the header file that goes with an ENVI or EHdr raster.
+    It looks for both name.hdr and name.bil.hdr
+
+    Args:
+        raster_file (str): The filename (with path and extension) of the raster.
+
+    Return:
+        str: The filename of the header
+    """
+    candidates = [raster_file[:raster_file.rfind('.')]+".hdr", raster_file+".hdr"]
+    for header_name in candidates:
+        if exists(header_name):
+            return header_name
+    raise Exception('[Errno 2] No such file or directory: \'' + candidates[0] + '\'')
+#==============================================================================
+
+#==============================================================================
+def ReadENVIHeader(raster_file):
+    """This reads the header of an ENVI raster (the LSDTopoTools format) or an ESRI
+    EHdr raster. Values in {} can run over several lines.
+
+    Args:
+        raster_file (str): The filename (with path and extension) of the raster (not the header).
+
+    Return:
+        dict: with the keys
+
+            * samples: the number of columns
+            * lines: the number of rows
+            * bands: the number of bands
+            * header_offset: the number of bytes to skip at the start of the file
+            * dtype: the numpy dtype, including the byte order
+            * interleave: bsq, bil or bip
+            * nodata: the nodata value, -9999 if the header doesn't have one
+            * map_info: the ENVI map info as a list of strings, None if there isn't one
+    """
+    header_name = GetHeaderFileName(raster_file)
+    with open(header_name, 'r') as hdr_file:
+        lines = hdr_file.readlines()
+
+    if len(lines) > 0 and lines[0].strip().upper() == "ENVI":
+        header = {}
+        key = None
+        value = ""
+        for line in lines[1:]:
+            if key is None:
+                if "=" not in line:
+                    continue
+                key, value = line.split("=",1)
+                key = key.strip().lower()
+                value = value.strip()
+            else:
+                value = value+" "+line.strip()
+            # keep reading lines until the braces close
+            if value.startswith("{") and not value.endswith("}"):
+                continue
+            header[key] = value.strip("{} ")
+            key = None
+
+        if "data type" not in header:
+            raise Exception("The header "+header_name+" has no data type")
+        data_type = int(header["data type"])
+        if data_type not in ENVIDataTypes:
+            raise Exception("Unknown ENVI data type: "+str(data_type))
+        dtype = np.dtype(ENVIDataTypes[data_type])
+        if int(header.get("byte order","0")) == 1:
+            dtype = dtype.newbyteorder('>')
+        else:
+            dtype = dtype.newbyteorder('<')
+
+        nodata = header.get("data ignore value", "-9999")
+        map_info = header.get("map info", None)
+        info = {"samples": int(header["samples"]),
+                "lines": int(header["lines"]),
+                "bands": int(header.get("bands","1")),
+                "header_offset": int(header.get("header offset","0")),
+                "dtype": dtype,
+                "interleave": header.get("interleave","bsq").lower(),
+                "nodata": float(nodata),
+                "map_info": None if map_info is None else [x.strip() for x in map_info.split(",")]}
     else:
-        if(info_dtype == 2):
-            data_type = np.dtype('int16')
+        # This is an ESRI EHdr header: one KEY VALUE pair per line
+        header = {}
+        for line in lines:
+            split_line = line.split()
+            if len(split_line) >= 2:
+                header[split_line[0].lower()] = split_line[1]
+
+        nbits = int(header.get("nbits","8"))
+        pixeltype = header.get("pixeltype","unsignedint").lower()
+        if pixeltype == "float":
+            kind = 'f'
+        elif pixeltype.startswith("signed"):
+            kind = 'i'
         else:
-            if(info_dtype == 3):
-                data_type = np.dtype('int32')
-            else:
-                if(info_dtype == 4):
-                    data_type = np.dtype('Float32')
-                else:
-                    if(info_dtype == 5):
-                        data_type = np.dtype('Float64')
-                    else:
-                        if(info_dtype == 12):
-                            data_type = np.dtype('uint16')
-    print("your data type is "  + str(data_type))
-    # Alright now loading and converting the data
-    print("I am now ingesting your raster")
-    data_array = np.fromfile(raster_file,data_type).reshape(num_lines,num_col)
-    if(info_dtype in [1,2,3,12]):
-        data_array = data_array.astype(float)
-    print("I nailed it")
-    x_max = x_min + x_res*num_col
-    y_min = y_max - y_res*num_lines
-    print("I am returning the raster array and info")
-    NoDataValue = no_data_hdr
-    if NoDataValue is not None:
-        data_array[data_array == NoDataValue] = np.nan
+            kind = 'u'
+        if header.get("byteorder","i").lower() in ["m","msbfirst"]:
+            byte_order = '>'
+        else:
+            byte_order = '<'
+        dtype = np.dtype(byte_order+kind+str(nbits//8))
+
+        nodata = header.get("nodata", "-9999")
+        info = {"samples": int(header["ncols"]),
+                "lines": int(header["nrows"]),
+                "bands": int(header.get("nbands","1")),
+                "header_offset": int(header.get("skipbytes","0")),
+                "dtype": dtype,
+                "interleave": header.get("layout","bil").lower(),
+                "nodata": float(nodata),
+                "map_info": None}
+
+    if info["interleave"] not in ["bsq","bil","bip"]:
+        raise Exception("Unknown interleave: "+info["interleave"])
+
+    return info
+#==============================================================================
+
+#==============================================================================
+def MemmapENVIRaster(raster_file, raster_band=1):
+    """This maps a band of an ENVI or EHdr raster into memory without reading it.
+    The pages are read by the operating system as they are needed and are shared
+    between every process (and every MapFigure) that maps the same file, so several
+    figures over the same DEM don't each hold a copy.
+
+    The map is copy-on-write: you can change the returned array without touching
+    the file, and only the pages you change take up private memory.
+
+    Args:
+        raster_file (str): The filename (with path and extension) of the raster.
+        raster_band (int): the band of the raster (1 based)
+
+    Return:
+        np.array: A (rows, cols) view of the band. It is a view on the memory map, no data is copied.
+    """
+    if exists(raster_file) is False:
+            raise Exception('[Errno 2] No such file or directory: \'' + raster_file + '\'')
+
+    info = ReadENVIHeader(raster_file)
+    n_rows = info["lines"]
+    n_cols = info["samples"]
+    n_bands = info["bands"]
+    if raster_band < 1 or raster_band > n_bands:
+        raise Exception("The raster only has "+str(n_bands)+" bands, you asked for band "+str(raster_band))
+
+    if info["interleave"] == "bsq":
+        shape = (n_bands,n_rows,n_cols)
+    elif info["interleave"] == "bil":
+        shape = (n_rows,n_bands,n_cols)
+    else:
+        shape = (n_rows,n_cols,n_bands)
+
+    mapped = np.memmap(raster_file, dtype = info["dtype"], mode = 'c',
+                       offset = info["header_offset"], shape = shape)
 
+    band_idx = raster_band-1
+    if info["interleave"] == "bsq":
+        return mapped[band_idx]
+    elif info["interleave"] == "bil":
+        return mapped[:,band_idx,:]
+    else:
+        return mapped[:,:,band_idx]
+#==============================================================================
+
+#==============================================================================
+def ReadRasterArrayBlocks_numpy(raster_file,raster_band=1,dtype=None,window=None,decimation=1):
+    """
+    This reads an ENVI (or EHdr) raster into an array using a numpy memory map. Windows and
+    decimation are just slices of the map, so only the pages you need are ever read.
+
+    Args:
+        FileName (str): The filename (with path and extension) of the raster.
+        raster_band (int): the band of the raster (almost all uses with LSDTopoTools will have a 1 band raster)
+        dtype (str): The dtype policy: "float64", "float32" or "native". See GetPolicyDtype. If None, integer rasters are converted to float64 and float rasters keep their type.
+        window (list): The pixel window as [x_offset, y_offset, n_cols, n_rows]. If None the whole raster is read.
+        decimation (int): Only read every nth pixel.
+
+    Return:
+        np.array: A numpy array with the data from the raster. With the "native" policy this is
+        a masked array over the memory map, so the data is not copied.
+
+    Author: SMM
+    """
+
+    print("I am memory mapping your raster.")
+    data_array = MemmapENVIRaster(raster_file, raster_band)
+    NoDataValue = ReadENVIHeader(raster_file)["nodata"]
+
+    if window is not None:
+        x_offset,y_offset,n_cols,n_rows = window
+        data_array = data_array[y_offset:y_offset+n_rows,x_offset:x_offset+n_cols]
+    decimation = max(int(decimation),1)
+    if decimation > 1:
+        data_array = data_array[::decimation,::decimation]
+
+    if dtype is None:
+        # the old behaviour: integers become float64, floats keep their type
+        if data_array.dtype.kind == 'f':
+            data_array = data_array.astype(data_array.dtype.newbyteorder('='), copy = False)
+            if NoDataValue is not None:
+                data_array[data_array == NoDataValue] = np.nan
+            return data_array
+        dtype = "float64"
+
+    # this doesn't copy anything if the data on disk already has the right type
+    data_array = data_array.astype(GetPolicyDtype(data_array.dtype.newbyteorder('='),dtype), copy = False)
+    data_array = ApplyNoDataPolicy(data_array, NoDataValue, dtype)
 
     return data_array
 #==============================================================================
 
+#==============================================================================
+# RASTER WRITER
+# Rasters are written in blocks of rows so big derived products never need a
+# second full-size copy. GeoTIFFs are tiled and compressed with the smallest
+# data type that holds the data, and can have internal overviews or be written
+# as cloud optimised GeoTIFFs. ENVI rasters (the LSDTopoTools format) are
+# always written as Float32 so LSDTopoTools can read them.
+#==============================================================================
+RasterWriterBlockSize = 256
+RasterWriterCompression = "DEFLATE"
+
+# The integer GDAL types, from the smallest, with the range of values they hold
+_CompactIntegerTypes = [("Byte", 0, 255), ("UInt16", 0, 65535), ("Int16", -32768, 32767),
+                        ("UInt32", 0, 4294967295), ("Int32", -2147483648, 2147483647)]
+
+# The numpy type of each GDAL type
+_GDALTypeToNumpy = {"Byte": np.uint8, "UInt16": np.uint16, "Int16": np.int16, "UInt32": np.uint32,
+                    "Int32": np.int32, "Float32": np.float32, "Float64": np.float64}
+
+#==============================================================================
+def GetCompactDataType(data, NoDataValue = -9999):
+    """This gets the smallest GDAL data type that can hold some data and the
+    nodata value. Floating point data is Float32, integer data gets the smallest
+    integer type that holds its range. Integer data with a NaN nodata value is
+    written as floats, since NaN can't go in an integer raster.
+
+    Args:
+        data (np.array): The data, or a numpy dtype if you don't know the range of the data
+        NoDataValue (float): The nodata value that will be written
+
+    Return:
+        str: the name of the GDAL data type
+    """
+    if isinstance(data, np.ndarray):
+        dtype = data.dtype
+    else:
+        dtype = np.dtype(data)
+        data = None
+
+    if dtype.kind == 'b':
+        low, high = 0, 1
+    elif dtype.kind in 'iu':
+        if data is not None and data.size > 0:
+            low, high = int(data.min()), int(data.max())
+        else:
+            low, high = int(np.iinfo(dtype).min), int(np.iinfo(dtype).max)
+    else:
+        return "Float32"
+
+    if NoDataValue is not None:
+        if np.isnan(NoDataValue):
+            # Float32 only holds integers exactly up to 2^24
+            if max(abs(low), abs(high)) <= 2**24:
+                return "Float32"
+            return "Float64"
+        if float(NoDataValue) != int(NoDataValue):
+            return "Float32"
+        low = min(low, int(NoDataValue))
+        high = max(high, int(NoDataValue))
+
+    for type_name, type_low, type_high in _CompactIntegerTypes:
+        if low >= type_low and high <= type_high:
+            return type_name
+    return "Float64"
+#==============================================================================
+
+#==============================================================================
+def _ArrayRowBlocks(data_array, block_rows):
+    """This splits an array into blocks of rows for WriteRaster.
+    """
+    for row_offset in range(0, data_array.shape[0], block_rows):
+        yield row_offset, data_array[row_offset:row_offset+block_rows]
+#==============================================================================
+
+#==============================================================================
+def _ChainBlocks(first_block, blocks):
+    """This puts the block we looked at to get the data type back in front.
+    """
+    yield first_block
+    for block in blocks:
+        yield block
+#==============================================================================
+
+#==============================================================================
+def _PrepareRasterBlock(block, numpy_type, NoDataValue):
+    """This puts the nodata value in the masked and NaN pixels of a block and
+    converts it to the type that is written.
+    """
+    if np.ma.isMaskedArray(block):
+        block = block.filled(NoDataValue if NoDataValue is not None else 0)
+    block = np.asarray(block)
+    if block.dtype.kind == 'f' and NoDataValue is not None:
+        nan_pixels = np.isnan(block)
+        if nan_pixels.any():
+            block = np.where(nan_pixels, NoDataValue, block)
+    return block.astype(numpy_type, copy = False)
+#==============================================================================
+
+#==============================================================================
+def _GetOverviewFactors(xsize, ysize, block_size):
+    """The overview levels, halving the raster until it fits in a block.
+    """
+    factors = []
+    factor = 2
+    while max(xsize, ysize)/factor >= block_size:
+        factors.append(factor)
+        factor = factor*2
+    return factors
+#==============================================================================
+
+#==============================================================================
+def WriteRaster(newRasterfn, data, template = None, GeoT = None, ProjectionWkt = None, shape = None,
+                driver_name = "GTiff", NoDataValue = -9999, data_type = None, compress = None,
+                block_size = None, overviews = None, cloud_optimised = False):
+    """This writes a raster one block of rows at a time. The georeferencing comes
+    from a template raster (through the metadata cache, so it isn't opened again)
+    or can be given directly.
+
+    Args:
+        newRasterfn (str): The filename (with path and extension) of the new raster.
+        data: Either a 2D array, or an iterable (e.g. a generator) of (row_offset, block) pairs
+            where block is a 2D array with all the columns of the raster. NaN and masked pixels get the nodata value.
+        template: The filename of a raster with the same extent, or its metadata from GetRasterMetadata
+        GeoT (tuple): The geotransform. Overrides the template.
+        ProjectionWkt (str): The projection. Overrides the template.
+        shape (tuple): (nrows, ncols) of the raster. Only needed if data is not an array and there is no template.
+        driver_name (str): The type of raster to write. "GTiff" is tiled and compressed. "ENVI" is the LSDTopoTools format.
+        NoDataValue (float): The no data value
+        data_type (str): The GDAL data type (e.g. "Float32"). Default is the smallest type that holds the data (always Float32 for ENVI).
+        compress (str): The GeoTIFF compression. Default is RasterWriterCompression. "NONE" for no compression.
+        block_size (int): The size of the tiles. Default is RasterWriterBlockSize.
+        overviews: A list of overview factors (e.g. [2,4,8]), or "auto" for all the levels down to one tile
+        cloud_optimised (bool): If true the raster is written as a cloud optimised GeoTIFF, with overviews
+
+    Return:
+        str: the name of the raster
+    """
+    if block_size is None:
+        block_size = RasterWriterBlockSize
+    if compress is None:
+        compress = RasterWriterCompression
+
+    # the extent of the raster
+    if template is not None:
+        if not isinstance(template, dict):
+            template = GetRasterMetadata(template)
+        if GeoT is None:
+            GeoT = template["GeoT"]
+        if ProjectionWkt is None:
+            ProjectionWkt = template["ProjectionWkt"]
+        if shape is None:
+            shape = (template["ysize"], template["xsize"])
+
+    if isinstance(data, np.ndarray):
+        if data.ndim != 2:
+            raise Exception("I can only write 2D arrays to a raster")
+        if shape is not None and tuple(shape) != data.shape:
+            raise Exception("The array is "+str(data.shape)+" but the raster is "+str(tuple(shape)))
+        shape = data.shape
+        if data_type is None and driver_name != "ENVI":
+            data_type = GetCompactDataType(data, NoDataValue)
+        blocks = _ArrayRowBlocks(data, block_size)
+    else:
+        if shape is None:
+            raise Exception("I need a template or the shape of the raster to write blocks")
+        blocks = iter(data)
+        first_block = next(blocks, None)
+        if data_type is None and driver_name != "ENVI" and first_block is not None:
+            data_type = GetCompactDataType(np.asarray(first_block[1]).dtype, NoDataValue)
+        if first_block is not None:
+            blocks = _ChainBlocks(first_block, blocks)
+
+    if data_type is None:
+        data_type = "Float32"
+    numpy_type = _GDALTypeToNumpy[data_type]
+    nrows, ncols = shape
+
+    # the creation options
+    options = []
+    if driver_name == "GTiff":
+        options = ["TILED=YES", "BLOCKXSIZE="+str(block_size), "BLOCKYSIZE="+str(block_size), "BIGTIFF=IF_SAFER"]
+        if compress != "NONE":
+            options.append("COMPRESS="+compress)
+            if compress in ["DEFLATE", "LZW", "ZSTD"]:
+                options.append("PREDICTOR="+("3" if data_type.startswith("Float") else "2"))
+
+    if cloud_optimised:
+        if driver_name != "GTiff":
+            raise Exception("Cloud optimised rasters have to be GeoTIFFs")
+        if overviews is None:
+            overviews = "auto"
+        # write it in memory first so the overviews can go before the data
+        out_name = "/vsimem/"+os.path.basename(newRasterfn)+".tmp.tif"
+    else:
+        out_name = newRasterfn
+
+    driver = gdal.GetDriverByName(driver_name)
+    outRaster = driver.Create(out_name, ncols, nrows, 1, gdal.GetDataTypeByName(data_type), options = options)
+    if outRaster is None:
+        raise Exception("Unable to create the raster "+newRasterfn)
+    if GeoT is not None:
+        outRaster.SetGeoTransform(GeoT)
+    if ProjectionWkt is not None:
+        outRaster.SetProjection(ProjectionWkt)
+    outband = outRaster.GetRasterBand(1)
+    if NoDataValue is not None:
+        outband.SetNoDataValue(NoDataValue)
+
+    for row_offset, block in blocks:
+        outband.WriteArray(_PrepareRasterBlock(block, numpy_type, NoDataValue), 0, int(row_offset))
+
+    if overviews is not None:
+        if overviews == "auto":
+            overviews = _GetOverviewFactors(ncols, nrows, block_size)
+        if len(overviews) > 0:
+            resampling = "AVERAGE" if data_type.startswith("Float") else "NEAREST"
+            # the compression of the overviews is a global option, so put back whatever it was
+            old_compress_overview = gdal.GetConfigOption("COMPRESS_OVERVIEW")
+            try:
+                if driver_name == "GTiff" and compress != "NONE":
+                    gdal.SetConfigOption("COMPRESS_OVERVIEW", compress)
+                outRaster.BuildOverviews(resampling, overviews)
+            finally:
+                gdal.SetConfigOption("COMPRESS_OVERVIEW", old_compress_overview)
+
+    outband.FlushCache()
+    if cloud_optimised:
+        outband = None
+        cog = driver.CreateCopy(newRasterfn, outRaster, options = options+["COPY_SRC_OVERVIEWS=YES"])
+        cog = None
+        outRaster = None
+        gdal.Unlink(out_name)
+    outband = None
+    outRaster = None
+
+    return newRasterfn
+#==============================================================================
+
 #==============================================================================
 def array2raster(rasterfn,newRasterfn,array,driver_name = "ENVI", noDataValue = -9999):
     """Takes an array and writes to a GDAL compatible raster. It needs another raster to map the dimensions.
+    ENVI rasters are Float32; GeoTIFFs are tiled, compressed and use the smallest type that holds the data (see WriteRaster).
 
     Args:
         FileName (str): The filename (with path and extension) of a raster that has the same dimensions as the raster to be written.
@@ -615,26 +1290,7 @@ def array2raster(rasterfn,newRasterfn,array,driver_name = "ENVI", noDataValue =
 
     Author: SMM
     """
-
-    raster = gdal.Open(rasterfn)
-    geotransform = raster.GetGeoTransform()
-    originX = geotransform[0]
-    originY = geotransform[3]
-    pixelWidth = geotransform[1]
-    pixelHeight = geotransform[5]
-    cols = raster.RasterXSize
-    rows = raster.RasterYSize
-
-    driver = gdal.GetDriverByName(driver_name)
-    outRaster = driver.Create(newRasterfn, cols, rows, 1, gdal.GDT_Float32)
-    outRaster.SetGeoTransform((originX, pixelWidth, 0, originY, 0, pixelHeight))
-    outRaster.GetRasterBand(1).SetNoDataValue( noDataValue )
-    outband = outRaster.GetRasterBand(1)
-    outband.WriteArray(array)
-    outRasterSRS = osr.SpatialReference()
-    outRasterSRS.ImportFromWkt(raster.GetProjectionRef())
-    outRaster.SetProjection(outRasterSRS.ExportToWkt())
-    outband.FlushCache()
+    WriteRaster(newRasterfn, array, template = rasterfn, driver_name = driver_name, NoDataValue = noDataValue)
 #==============================================================================
 
 
@@ -642,55 +1298,45 @@ def RasterDifference(RasterFile1, RasterFile2, raster_band=1, OutFileName="Test.
     """
     Takes two rasters of same size and subtracts second from first,
     e.g. Raster1 - Raster2 = raster_of_difference
-    then writes it out to file
+    then writes it out to file. The rasters are read and the difference written
+    in strips, so neither raster has to fit in memory. Pixels that are nodata in
+    either raster are nodata in the difference.
     """
-
-    Raster1 = gdal.Open(RasterFile1)
-    Raster2 = gdal.Open(RasterFile2)
+    metadata1 = GetRasterMetadata(RasterFile1)
+    metadata2 = GetRasterMetadata(RasterFile2)
 
     print("RASTER 1: ")
-    print(Raster1.GetGeoTransform())
-    print(Raster1.RasterCount)
-    print(Raster1.GetRasterBand(1).XSize)
-    print(Raster1.GetRasterBand(1).YSize)
-    print(Raster1.GetRasterBand(1).DataType)
+    print(metadata1["GeoT"])
+    print(metadata1["xsize"])
+    print(metadata1["ysize"])
+    print(metadata1["DataType"])
 
     print("RASTER 2: ")
-    print(Raster2.GetGeoTransform())
-    print(Raster2.RasterCount)
-    print(Raster2.GetRasterBand(1).XSize)
-    print(Raster2.GetRasterBand(1).YSize)
-    print(Raster2.GetRasterBand(1).DataType)
-
-    raster_array1 = np.array(Raster1.GetRasterBand(raster_band).ReadAsArray())
-    raster_array2 = np.array(Raster2.GetRasterBand(raster_band).ReadAsArray())
-
-    assert(raster_array1.shape == raster_array2.shape )
-    print("Shapes: ", raster_array1.shape, raster_array2.shape)
+    print(metadata2["GeoT"])
+    print(metadata2["xsize"])
+    print(metadata2["ysize"])
+    print(metadata2["DataType"])
 
-    difference_raster_array = raster_array1 - raster_array2
+    assert((metadata1["ysize"],metadata1["xsize"]) == (metadata2["ysize"],metadata2["xsize"]))
+    print("Shapes: ", (metadata1["ysize"],metadata1["xsize"]), (metadata2["ysize"],metadata2["xsize"]))
 
-#    import matplotlib.pyplot as plt
-#
-#    plt.imshow(difference_raster_array)
-#
+    NoDataValue = metadata1["NDV"] if metadata1["NDV"] is not None else -9999
+    ncols = metadata1["xsize"]
+    nrows = metadata1["ysize"]
+    strip_rows = RasterWriterBlockSize*4
 
-    driver = gdal.GetDriverByName(OutFileType)
+    def difference_blocks():
+        for row_offset in range(0, nrows, strip_rows):
+            window = [0, row_offset, ncols, min(strip_rows, nrows-row_offset)]
+            raster_array1 = ReadRasterWindow(RasterFile1, raster_band, window = window, dtype = "float32")
+            raster_array2 = ReadRasterWindow(RasterFile2, raster_band, window = window, dtype = "float32")
+            yield row_offset, raster_array1 - raster_array2
 
-    dsOut = driver.Create(OutFileName,
-                          Raster1.GetRasterBand(1).XSize,
-                          Raster1.GetRasterBand(1).YSize,
-                          1,
-                          gdal.GDT_Float32)
-                          #Raster1.GetRasterBand(raster_band).DataType)
-
-
-    gdal_array.CopyDatasetInfo(Raster1,dsOut)
-    bandOut = dsOut.GetRasterBand(1)
-    gdal_array.BandWriteArray(bandOut, difference_raster_array)
+    WriteRaster(OutFileName, difference_blocks(), template = metadata1, driver_name = OutFileType,
+                NoDataValue = NoDataValue, data_type = "Float32")
 
 #==============================================================================
-def PolygoniseRaster(DataDirectory, RasterFile, OutputShapefile='polygons'):
+def PolygoniseRaster(DataDirectory, RasterFile, OutputShapefile='polygons', write_shapefile=True):
     """
     This function takes in a raster and converts to a polygon shapefile using rasterio
     from https://gis.stackexchange.com/questions/187877/how-to-polygonize-raster-to-shapely-polygons/187883#187883?newreg=8b1f507529724a8488ce4789ba787363
@@ -699,6 +1345,7 @@ def PolygoniseRaster(DataDirectory, RasterFile, OutputShapefile='polygons'):
         DataDirectory (str): the data directory with the basin raster
         RasterFile (str): the name of the raster
         OutputShapefile (str): the name of the output shapefile WITHOUT EXTENSION. Default = 'polygons'
+        write_shapefile (bool): If false the polygons are only returned, not written to the shapefile. Default = True
 
     Returns:
         Dictionary where key is the raster value and the value is a shapely polygon
@@ -741,19 +1388,21 @@ def PolygoniseRaster(DataDirectory, RasterFile, OutputShapefile='polygons'):
 
     # transform results into shapely geometries and write to shapefile using fiona
     geoms = list(results)
+    shape_list = [(float(f['properties']['raster_val']), Polygon(shape(f['geometry']))) for f in geoms]
     PolygonDict = {}
-    with fiona.open(DataDirectory+OutputShapefile, 'w', crs=crs, driver='ESRI Shapefile', schema=schema) as output:
-        for f in geoms:
-            this_shape = Polygon(shape(f['geometry']))
-            this_val = float(f['properties']['raster_val'])
-            if this_val != NDV: # remove no data values
-                output.write({'geometry': mapping(this_shape), 'properties':{'ID': this_val}})
-            PolygonDict[this_val] = this_shape
+    for this_val, this_shape in shape_list:
+        PolygonDict[this_val] = this_shape
+
+    if write_shapefile:
+        with fiona.open(DataDirectory+OutputShapefile, 'w', crs=crs, driver='ESRI Shapefile', schema=schema) as output:
+            for this_val, this_shape in shape_list:
+                if this_val != NDV: # remove no data values
+                    output.write({'geometry': mapping(this_shape), 'properties':{'ID': this_val}})
 
     return PolygonDict
 
 #==============================================================================
-def PolygoniseRasterMerge(DataDirectory, RasterFile, OutputShapefile='polygons'):
+def PolygoniseRasterMerge(DataDirectory, RasterFile, OutputShapefile='polygons', write_shapefile=True):
     """
     This function takes in a raster and converts to a polygon shapefile using rasterio
     from https://gis.stackexchange.com/questions/187877/how-to-polygonize-raster-to-shapely-polygons/187883#187883?newreg=8b1f507529724a8488ce4789ba787363
@@ -765,6 +1414,7 @@ def PolygoniseRasterMerge(DataDirectory, RasterFile, OutputShapefile='polygons')
         DataDirectory (str): the data directory with the basin raster
         RasterFile (str): the name of the raster
         OutputShapefile (str): the name of the output shapefile WITHOUT EXTENSION. Default = 'polygons'
+        write_shapefile (bool): If false the polygons are only returned, not written to the shapefile. Default = True
 
     Returns:
         Dictionary where key is the raster value and the value is a shapely polygon
@@ -808,17 +1458,21 @@ def PolygoniseRasterMerge(DataDirectory, RasterFile, OutputShapefile='polygons')
 
     # transform results into shapely geometries and write to shapefile using fiona
     geoms = list(results)
+    shape_list = []
     PolygonDict = {}
-    with fiona.open(DataDirectory+OutputShapefile, 'w', crs=crs, driver='ESRI Shapefile', schema=schema) as output:
-        for f in geoms:
-            this_shape = Polygon(shape(f['geometry']))
-            this_val = float(f['properties']['raster_val'])
-            if this_val in PolygonDict:
-                Polygons = [this_shape, PolygonDict[this_val]]
-                this_shape = cascaded_union(Polygons)
-            if this_val != NDV: # remove no data values
-                output.write({'geometry': mapping(this_shape), 'properties':{'ID': this_val}})
-
-            PolygonDict[this_val] = this_shape
+    for f in geoms:
+        this_shape = Polygon(shape(f['geometry']))
+        this_val = float(f['properties']['raster_val'])
+        if this_val in PolygonDict:
+            Polygons = [this_shape, PolygonDict[this_val]]
+            this_shape = cascaded_union(Polygons)
+        shape_list.append((this_val, this_shape))
+        PolygonDict[this_val] = this_shape
+
+    if write_shapefile:
+        with fiona.open(DataDirectory+OutputShapefile, 'w', crs=crs, driver='ESRI Shapefile', schema=schema) as output:
+            for this_val, this_shape in shape_list:
+                if this_val != NDV: # remove no data values
+                    output.write({'geometry': mapping(this_shape), 'properties':{'ID': this_val}})
 
     return PolygonDict
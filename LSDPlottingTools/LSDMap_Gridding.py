@@ -0,0 +1,315 @@
+## LSDMap_Gridding.py
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+## These functions turn scattered x,y,z points (e.g. the output of a model
+## like CHILD, or a point cloud) into a raster.
+##
+## The raster is made a block of rows at a time, so only the points and one
+## block of the grid are in memory, and the blocks can be written straight to
+## a raster with WriteRaster. The methods are:
+##   "mean": the mean of the points in each pixel (binning, no interpolation)
+##   "nearest": the value of the nearest point (KD-tree)
+##   "idw": inverse distance weighting of the nearest points (KD-tree)
+##   "linear": linear interpolation on a Delaunay triangulation of the points
+## If the points already fill a regular lattice with the resolution of the
+## raster (one point on every node) they are just put in their pixels. Points
+## on a lattice with missing nodes (e.g. a hexagonal mesh) are gridded with the
+## method you asked for.
+##
+## Pixels with no value (outside the triangulation, or further than
+## max_distance from any point) are NaN, and nodata in the raster.
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import numpy as np
+from . import LSDMap_GDALIO as LSDMap_IO
+
+# The number of rows of the grid made at a time
+GriddingChunkRows = 256
+
+# The methods this module knows about
+GriddingMethods = ["mean", "nearest", "idw", "linear"]
+
+#==============================================================================
+def _GetLatticeIndex(coordinate, tolerance = 1e-3):
+    """This checks if coordinates are on a regular spacing.
+
+    Returns:
+        the smallest coordinate, the spacing and the index of each coordinate on the lattice, or None
+    """
+    unique_coordinates = np.unique(coordinate)
+    if unique_coordinates.size < 2:
+        return None
+    spacing = np.min(np.diff(unique_coordinates))
+    position = (coordinate-unique_coordinates[0])/spacing
+    index = np.round(position).astype(np.int64)
+    if np.max(np.abs(position-index)) > tolerance:
+        return None
+    return unique_coordinates[0], spacing, index
+#==============================================================================
+
+#==============================================================================
+def DetectRegularLattice(x, y):
+    """This checks if points lie on a regular lattice (e.g. they were written
+    from a raster), with at most one point per node and at least a quarter of the nodes filled.
+
+    Args:
+        x (array): The x coordinates of the points
+        y (array): The y coordinates of the points
+
+    Returns:
+        dict: with the "GeoT" and "shape" (nrows, ncols) of the raster with a pixel centred on
+        each node and "complete", which is True if there is a point on every node. None if the
+        points are not on a lattice
+    """
+    x = np.asarray(x, dtype = float)
+    y = np.asarray(y, dtype = float)
+    x_lattice = _GetLatticeIndex(x)
+    y_lattice = _GetLatticeIndex(y)
+    if x_lattice is None or y_lattice is None:
+        return None
+
+    x_min, x_res, cols = x_lattice
+    y_min, y_res, rows_from_bottom = y_lattice
+    ncols = int(cols.max())+1
+    nrows = int(rows_from_bottom.max())+1
+    # scattered points would give a huge lattice that is nearly empty
+    if ncols*nrows > 4*x.size:
+        return None
+    rows = nrows-1-rows_from_bottom
+    if np.unique(rows*ncols+cols).size != x.size:
+        return None
+
+    GeoT = (x_min-0.5*x_res, x_res, 0, y_min+(nrows-0.5)*y_res, 0, -y_res)
+    return {"GeoT": GeoT, "shape": (nrows, ncols), "complete": ncols*nrows == x.size}
+#==============================================================================
+
+#==============================================================================
+def GetGridFromExtent(extent, resolution):
+    """This gets the georeferencing of a raster covering an extent.
+
+    Args:
+        extent (list): The extent of the raster as [XMin,XMax,YMin,YMax] (the edges of the pixels)
+        resolution (float or list): The size of the pixels, or [x_res, y_res]
+
+    Returns:
+        the GeoT and the shape (nrows, ncols) of the raster
+    """
+    if np.ndim(resolution) == 0:
+        resolution = [resolution, resolution]
+    x_res, y_res = float(resolution[0]), float(resolution[1])
+    ncols = int(np.ceil((extent[1]-extent[0])/x_res-1e-6))
+    nrows = int(np.ceil((extent[3]-extent[2])/y_res-1e-6))
+    GeoT = (extent[0], x_res, 0, extent[3], 0, -y_res)
+    return GeoT, (nrows, ncols)
+#==============================================================================
+
+#==============================================================================
+def _GetPixelIndices(x, y, GeoT):
+    """The row and column of the pixel each point is in.
+    """
+    cols = np.floor((x-GeoT[0])/GeoT[1]).astype(np.int64)
+    rows = np.floor((y-GeoT[3])/GeoT[5]).astype(np.int64)
+    return rows, cols
+#==============================================================================
+
+#==============================================================================
+def _GetBlockCentres(GeoT, row_offset, n_rows, ncols):
+    """The coordinates of the centres of the pixels of a block of rows, as an (n, 2) array.
+    """
+    x_centres = GeoT[0]+(np.arange(ncols)+0.5)*GeoT[1]
+    y_centres = GeoT[3]+(np.arange(row_offset, row_offset+n_rows)+0.5)*GeoT[5]
+    xx, yy = np.meshgrid(x_centres, y_centres)
+    return np.column_stack((xx.ravel(), yy.ravel()))
+#==============================================================================
+
+#==============================================================================
+def _BinnedBlocks(x, y, z, GeoT, shape, chunk_rows):
+    """This makes the blocks of the grid with the mean of the points in each pixel.
+    The points are sorted by row once so each block only looks at its own points.
+    """
+    nrows, ncols = shape
+    rows, cols = _GetPixelIndices(x, y, GeoT)
+    inside = (rows >= 0) & (rows < nrows) & (cols >= 0) & (cols < ncols)
+    rows, cols, z = rows[inside], cols[inside], z[inside]
+    order = np.argsort(rows, kind = "mergesort")
+    rows, cols, z = rows[order], cols[order], z[order]
+
+    for row_offset in range(0, nrows, chunk_rows):
+        n_rows = min(chunk_rows, nrows-row_offset)
+        first, last = np.searchsorted(rows, [row_offset, row_offset+n_rows])
+        pixel = (rows[first:last]-row_offset)*ncols+cols[first:last]
+        counts = np.bincount(pixel, minlength = n_rows*ncols)
+        sums = np.bincount(pixel, weights = z[first:last], minlength = n_rows*ncols)
+        block = np.full(n_rows*ncols, np.nan)
+        has_points = counts > 0
+        block[has_points] = sums[has_points]/counts[has_points]
+        yield row_offset, block.reshape(n_rows, ncols)
+#==============================================================================
+
+#==============================================================================
+def _KDTreeBlocks(x, y, z, GeoT, shape, chunk_rows, method, max_distance, n_neighbours, power):
+    """This makes the blocks of the grid from the nearest points, found with a KD-tree.
+    """
+    from scipy.spatial import cKDTree
+
+    nrows, ncols = shape
+    tree = cKDTree(np.column_stack((x, y)))
+    k = 1 if method == "nearest" else min(n_neighbours, z.size)
+    upper_bound = np.inf if max_distance is None else max_distance
+    # missing neighbours get the index z.size, so give them a value
+    z_padded = np.append(z, np.nan if k == 1 else 0.0)
+
+    for row_offset in range(0, nrows, chunk_rows):
+        n_rows = min(chunk_rows, nrows-row_offset)
+        distance, index = tree.query(_GetBlockCentres(GeoT, row_offset, n_rows, ncols), k = k, distance_upper_bound = upper_bound)
+        if k == 1:
+            block = z_padded[index]
+        else:
+            found = np.isfinite(distance)
+            weights = np.where(found, 1.0/np.maximum(distance, 1e-12)**power, 0.0)
+            weight_sum = weights.sum(axis = 1)
+            with np.errstate(invalid = "ignore", divide = "ignore"):
+                block = (weights*z_padded[index]).sum(axis = 1)/weight_sum
+            # a pixel centre right on a point takes its value
+            exact = distance[:, 0] == 0
+            block[exact] = z_padded[index[exact, 0]]
+            block[weight_sum == 0] = np.nan
+        yield row_offset, block.reshape(n_rows, ncols)
+#==============================================================================
+
+#==============================================================================
+def _LinearBlocks(x, y, z, GeoT, shape, chunk_rows):
+    """This makes the blocks of the grid by linear interpolation. The points are
+    triangulated once and the triangulation is used for every block.
+    """
+    from scipy.spatial import Delaunay
+    from scipy.interpolate import LinearNDInterpolator
+
+    nrows, ncols = shape
+    interpolator = LinearNDInterpolator(Delaunay(np.column_stack((x, y))), z, fill_value = np.nan)
+    for row_offset in range(0, nrows, chunk_rows):
+        n_rows = min(chunk_rows, nrows-row_offset)
+        block = interpolator(_GetBlockCentres(GeoT, row_offset, n_rows, ncols))
+        yield row_offset, np.asarray(block).reshape(n_rows, ncols)
+#==============================================================================
+
+#==============================================================================
+def GridPointBlocks(x, y, z, resolution = None, extent = None, method = "linear", max_distance = None,
+                    n_neighbours = 8, power = 2, chunk_rows = None):
+    """This grids scattered points a block of rows at a time.
+
+    Args:
+        x, y, z (arrays): The coordinates and values of the points. Points with a NaN value are ignored.
+        resolution (float or list): The size of the pixels, or [x_res, y_res]. If None the points must be on a regular lattice.
+        extent (list): The extent of the raster as [XMin,XMax,YMin,YMax]. Default is the extent of the points.
+        method (str): "mean", "nearest", "idw" or "linear"
+        max_distance (float): For "nearest" and "idw", pixels further than this from any point get no value. Default is no limit.
+        n_neighbours (int): The number of points used by "idw"
+        power (float): The power of the distance in "idw"
+        chunk_rows (int): The number of rows in a block. Default is GriddingChunkRows.
+
+    Returns:
+        the GeoT, the shape (nrows, ncols) of the raster and a generator of (row_offset, block) pairs
+    """
+    if method not in GriddingMethods:
+        raise Exception("I don't know the gridding method "+method+". I know "+", ".join(GriddingMethods))
+    if chunk_rows is None:
+        chunk_rows = GriddingChunkRows
+
+    x = np.asarray(x, dtype = float)
+    y = np.asarray(y, dtype = float)
+    z = np.asarray(z, dtype = float)
+    has_value = np.isfinite(x) & np.isfinite(y) & np.isfinite(z)
+    x, y, z = x[has_value], y[has_value], z[has_value]
+    if z.size == 0:
+        raise Exception("There are no points with values to grid")
+
+    # points filling a lattice with the same pixels as the raster are just put in their pixels
+    lattice = DetectRegularLattice(x, y)
+    if lattice is not None:
+        lattice_GeoT = lattice["GeoT"]
+        if resolution is None:
+            resolution = [lattice_GeoT[1], -lattice_GeoT[5]]
+        if extent is None:
+            extent = [lattice_GeoT[0], lattice_GeoT[0]+lattice["shape"][1]*lattice_GeoT[1],
+                      lattice_GeoT[3]+lattice["shape"][0]*lattice_GeoT[5], lattice_GeoT[3]]
+    elif resolution is None:
+        raise Exception("The points are not on a regular lattice, so I need the resolution of the raster")
+
+    if extent is None:
+        extent = [x.min(), x.max(), y.min(), y.max()]
+    GeoT, shape = GetGridFromExtent(extent, resolution)
+
+    if lattice is not None and lattice["complete"]:
+        # the pixel centres have to be on the lattice nodes
+        rows, cols = _GetPixelIndices(x, y, GeoT)
+        x_offset = (x-GeoT[0])/GeoT[1]-cols
+        y_offset = (y-GeoT[3])/GeoT[5]-rows
+        if np.allclose(x_offset, 0.5, atol = 1e-3) and np.allclose(y_offset, 0.5, atol = 1e-3):
+            print("The points are on a regular lattice, I'll put them straight into the raster")
+            method = "mean"
+
+    if method == "mean":
+        blocks = _BinnedBlocks(x, y, z, GeoT, shape, chunk_rows)
+    elif method == "linear":
+        blocks = _LinearBlocks(x, y, z, GeoT, shape, chunk_rows)
+    else:
+        blocks = _KDTreeBlocks(x, y, z, GeoT, shape, chunk_rows, method, max_distance, n_neighbours, power)
+
+    return GeoT, shape, blocks
+#==============================================================================
+
+#==============================================================================
+def GridPoints(x, y, z, resolution = None, extent = None, method = "linear", **kwargs):
+    """This grids scattered points into an array.
+
+    Args:
+        x, y, z (arrays): The coordinates and values of the points
+        resolution (float or list): The size of the pixels. If None the points must be on a regular lattice.
+        extent (list): The extent of the raster as [XMin,XMax,YMin,YMax]. Default is the extent of the points.
+        method (str): "mean", "nearest", "idw" or "linear"
+        kwargs: The other arguments of GridPointBlocks (max_distance, n_neighbours, power, chunk_rows)
+
+    Returns:
+        the array (NaN where there is no value; the first row is the top of the raster) and its GeoT
+    """
+    GeoT, shape, blocks = GridPointBlocks(x, y, z, resolution, extent, method, **kwargs)
+    grid = np.empty(shape)
+    for row_offset, block in blocks:
+        grid[row_offset:row_offset+block.shape[0]] = block
+    return grid, GeoT
+#==============================================================================
+
+#==============================================================================
+def GridPointsToRaster(newRasterfn, x, y, z, resolution = None, extent = None, method = "linear", EPSG = None,
+                       ProjectionWkt = None, driver_name = "ENVI", NoDataValue = -9999, **kwargs):
+    """This grids scattered points and writes them to a raster, one block of rows
+    at a time, so the whole grid is never in memory.
+
+    Args:
+        newRasterfn (str): The filename (with path and extension) of the new raster
+        x, y, z (arrays): The coordinates and values of the points
+        resolution (float or list): The size of the pixels. If None the points must be on a regular lattice.
+        extent (list): The extent of the raster as [XMin,XMax,YMin,YMax]. Default is the extent of the points.
+        method (str): "mean", "nearest", "idw" or "linear"
+        EPSG (int): The EPSG code of the coordinates
+        ProjectionWkt (str): The projection of the coordinates (if you don't give the EPSG code)
+        driver_name (str): The type of raster, e.g. "ENVI" or "GTiff"
+        NoDataValue (float): The no data value
+        kwargs: The other arguments of GridPointBlocks (max_distance, n_neighbours, power, chunk_rows)
+
+    Returns:
+        str: the name of the raster
+    """
+    from osgeo import osr
+
+    if ProjectionWkt is None and EPSG is not None:
+        srs = osr.SpatialReference()
+        srs.ImportFromEPSG(int(EPSG))
+        ProjectionWkt = srs.ExportToWkt()
+
+    GeoT, shape, blocks = GridPointBlocks(x, y, z, resolution, extent, method, **kwargs)
+    print("I am gridding the points into a raster of "+str(shape[1])+" by "+str(shape[0])+" pixels")
+    return LSDMap_IO.WriteRaster(newRasterfn, blocks, GeoT = GeoT, ProjectionWkt = ProjectionWkt, shape = shape,
+                                 driver_name = driver_name, NoDataValue = NoDataValue)
+#==============================================================================
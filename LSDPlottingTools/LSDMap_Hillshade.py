@@ -0,0 +1,322 @@
+## LSDMap_Hillshade.py
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+## The hillshade engine. All of the hillshades in LSDMappingTools are made
+## here. It uses the same algorithm as the hillshade in the LSDTopoTools core
+## C++ libraries (Horn's method for the gradients). If the compiled kernel
+## (fast_hillshade.pyx, build it with setup_cython.py) is available it is used
+## and runs on all cores; otherwise a vectorised numpy version is used.
+## Both give the same result. Nodata pixels get NaN and pixels next to nodata
+## or the edge of the raster use the centre pixel in place of the missing
+## neighbours. Big rasters are done in strips of rows.
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import numpy as np
+import os
+from os.path import exists
+from . import LSDMap_GDALIO as LSDMap_IO
+from . import LSDMap_TerrainDerivatives as LSDMap_TD
+
+try:
+    from . import fast_hillshade as _fast_hillshade
+except ImportError:
+    _fast_hillshade = None
+
+# The number of rows read at a time when making the hillshade of a raster file
+HillshadeTileRows = 2048
+
+# Hillshades of raster files are cached on disk as uint8 .npy files, named by a
+# hash of the DEM (path, size and modification time) and the sun parameters.
+# The least recently used files are deleted when the cache is bigger than
+# HillshadeCacheMaxBytes. The directory can also be set with the environment
+# variable LSDMT_HILLSHADE_CACHE.
+HillshadeCacheEnabled = True
+HillshadeCacheDirectory = os.environ.get("LSDMT_HILLSHADE_CACHE",
+                                         os.path.join(os.path.expanduser("~"), ".lsdmappingtools", "hillshade_cache"))
+HillshadeCacheMaxBytes = 2*1024**3
+
+# The value used for nodata in the cached hillshades. Shading is stored as 0-254.
+_HillshadeCacheNoData = 255
+
+#==============================================================================
+def GetHillshadeKernel(use_compiled=True):
+    """This tells you which hillshade kernel will be used.
+
+    Args:
+        use_compiled (bool): If false the numpy kernel is always used
+
+    Returns:
+        str: "compiled" or "numpy"
+    """
+    if use_compiled and _fast_hillshade is not None:
+        return "compiled"
+    else:
+        return "numpy"
+#==============================================================================
+
+#==============================================================================
+def _HillshadeNumpy(terrain_array, DataResolution, azimuth, angle_altitude, z_factor):
+    """This is the numpy hillshade kernel. terrain_array must be a float array
+    with NaN in the nodata pixels.
+    """
+    stencil = LSDMap_TD.GetNeighbourStencil(terrain_array)
+    dzdx, dzdy = LSDMap_TD.GetHornGradients(stencil, DataResolution)
+    HSarray = LSDMap_TD.ShadeFromGradients(dzdx, dzdy, azimuth, angle_altitude, z_factor)
+    HSarray[np.isnan(terrain_array)] = np.nan
+
+    return HSarray
+#==============================================================================
+
+#==============================================================================
+def HillshadeArray(terrain_array, DataResolution = 1, azimuth = 315, angle_altitude = 45,
+                   NoDataValue = -9999, z_factor = 1, use_compiled = True):
+    """Creates a hillshade from an array of elevations.
+
+    Args:
+        terrain_array (numpy array): The elevations. NaN, masked pixels and pixels equal to NoDataValue are nodata.
+        DataResolution (float): The size of the pixels
+        azimuth (float): Azimuth of sunlight
+        angle_altitude (float): Angle altitude of sun
+        NoDataValue (float): The nodata value of the array
+        z_factor (float): z_factor
+        use_compiled (bool): If false the numpy kernel is used even if the compiled one is available
+
+    Returns:
+        HSArray (numpy.array): The hillshade array, with NaN in the nodata pixels
+    """
+    if np.ma.isMaskedArray(terrain_array):
+        terrain_array = np.ma.filled(terrain_array.astype(np.float64), np.nan)
+    terrain_array = np.array(terrain_array, dtype=np.float64)
+    if NoDataValue is not None:
+        terrain_array[terrain_array == NoDataValue] = np.nan
+    terrain_array[np.isinf(terrain_array)] = np.nan
+
+    if GetHillshadeKernel(use_compiled) == "compiled":
+        return np.asarray(_fast_hillshade.Hillshade(terrain_array, float(DataResolution),
+                                                    float(azimuth), float(angle_altitude),
+                                                    np.nan, float(z_factor)))
+    else:
+        return _HillshadeNumpy(terrain_array, float(DataResolution), float(azimuth),
+                               float(angle_altitude), float(z_factor))
+#==============================================================================
+
+#==============================================================================
+def GetHillshadeCacheFileName(raster_file, azimuth = 315, angle_altitude = 45, z_factor = 1):
+    """This gets the name of the file in the hillshade cache for a DEM and set of
+    sun parameters. The name is a hash of the DEM path, its size and modification
+    time and the parameters, so a changed DEM or new parameters get a new file.
+
+    Args:
+        raster_file (str): The filename (with path and extension) of the DEM.
+        azimuth (float): Azimuth of sunlight
+        angle_altitude (float): Angle altitude of sun
+        z_factor (float): z_factor
+
+    Returns:
+        str: the filename in the cache directory
+    """
+    import hashlib
+
+    key = repr((os.path.abspath(raster_file), LSDMap_IO._GetRasterFileStamp(raster_file),
+                float(azimuth), float(angle_altitude), float(z_factor)))
+    if not isinstance(key, bytes):
+        key = key.encode("utf-8")
+    digest = hashlib.sha1(key).hexdigest()
+    return os.path.join(HillshadeCacheDirectory, "hs_"+digest+".npy")
+#==============================================================================
+
+#==============================================================================
+def _ReadHillshadeCache(cache_file):
+    """This reads a hillshade from the cache and marks it as recently used.
+
+    Returns:
+        HSArray (numpy.array): The hillshade, or None if it isn't in the cache
+    """
+    if not exists(cache_file):
+        return None
+    try:
+        stored = np.load(cache_file, mmap_mode="r")
+        HSarray = _DequantiseHillshade(stored)
+        os.utime(cache_file, None)
+    except (IOError, OSError, ValueError):
+        return None
+    return HSarray
+#==============================================================================
+
+#==============================================================================
+def _QuantiseHillshade(HSarray):
+    """This turns a hillshade into the uint8 kept in the cache: 0-254, with
+    _HillshadeCacheNoData in the nodata pixels.
+    """
+    stored = np.full(HSarray.shape, _HillshadeCacheNoData, dtype=np.uint8)
+    valid = ~np.isnan(HSarray)
+    stored[valid] = np.rint(np.clip(HSarray[valid], 0, 255)*(254.0/255.0)).astype(np.uint8)
+    return stored
+#==============================================================================
+
+#==============================================================================
+def _DequantiseHillshade(stored):
+    """This turns a uint8 hillshade from the cache back into a 0-255 float hillshade.
+    """
+    HSarray = stored.astype(np.float64)*(255.0/254.0)
+    HSarray[stored == _HillshadeCacheNoData] = np.nan
+    return HSarray
+#==============================================================================
+
+#==============================================================================
+def _WriteHillshadeCache(cache_file, stored):
+    """This writes a hillshade (from _QuantiseHillshade) to the cache and then removes the least
+    recently used files until the cache is no bigger than HillshadeCacheMaxBytes.
+    """
+    tmp_file = cache_file+".tmp%i.npy" % os.getpid()
+    try:
+        if not os.path.isdir(HillshadeCacheDirectory):
+            os.makedirs(HillshadeCacheDirectory)
+        np.save(tmp_file, stored)
+        os.rename(tmp_file, cache_file)
+    except (IOError, OSError):
+        print("I couldn't write the hillshade to the cache in "+HillshadeCacheDirectory)
+        return
+
+    # evict the least recently used files
+    cached_files = []
+    for fname in os.listdir(HillshadeCacheDirectory):
+        if fname.startswith("hs_") and fname.endswith(".npy") and ".tmp" not in fname:
+            full_name = os.path.join(HillshadeCacheDirectory, fname)
+            file_stat = os.stat(full_name)
+            cached_files.append((file_stat.st_mtime, file_stat.st_size, full_name))
+    total_bytes = sum(f[1] for f in cached_files)
+    for mtime, size, full_name in sorted(cached_files):
+        if total_bytes <= HillshadeCacheMaxBytes or full_name == cache_file:
+            break
+        try:
+            os.remove(full_name)
+            total_bytes -= size
+        except OSError:
+            pass
+#==============================================================================
+
+#==============================================================================
+def ClearHillshadeCache():
+    """This deletes all of the hillshades in the cache.
+    """
+    if not os.path.isdir(HillshadeCacheDirectory):
+        return
+    for fname in os.listdir(HillshadeCacheDirectory):
+        if fname.startswith("hs_") and fname.endswith(".npy"):
+            os.remove(os.path.join(HillshadeCacheDirectory, fname))
+#==============================================================================
+
+#==============================================================================
+def HillshadeRasterFile(raster_file, azimuth = 315, angle_altitude = 45, z_factor = 1,
+                        tile_rows = None, use_compiled = True, use_cache = True):
+    """Creates a hillshade of a raster file. The raster is read and shaded in
+    strips of rows (with one row of overlap on each side), so only a strip of
+    the elevations is in memory at a time.
+
+    The hillshade is kept in the hillshade cache, so asking again for the same
+    DEM and sun parameters just reads it back. The cache keeps the shading to the
+    nearest 1/254, and a new hillshade is rounded in the same way, so the result is
+    the same whether or not it came from the cache.
+
+    Args:
+        raster_file (str): The filename (with path and extension) of the raster.
+        azimuth (float): Azimuth of sunlight
+        angle_altitude (float): Angle altitude of sun
+        z_factor (float): z_factor
+        tile_rows (int): The number of rows in each strip. Default is HillshadeTileRows.
+        use_compiled (bool): If false the numpy kernel is used even if the compiled one is available
+        use_cache (bool): If false the hillshade cache is not used
+
+    Returns:
+        HSArray (numpy.array): The hillshade array, with NaN in the nodata pixels
+    """
+    if exists(raster_file) is False:
+        raise Exception('[Errno 2] No such file or directory: \'' + raster_file + '\'')
+
+    use_cache = use_cache and HillshadeCacheEnabled
+    if use_cache:
+        cache_file = GetHillshadeCacheFileName(raster_file, azimuth, angle_altitude, z_factor)
+        HSarray = _ReadHillshadeCache(cache_file)
+        if HSarray is not None:
+            print("I got the hillshade of "+raster_file+" from the cache")
+            return HSarray
+
+    if tile_rows is None:
+        tile_rows = HillshadeTileRows
+    tile_rows = max(int(tile_rows), 1)
+
+    metadata = LSDMap_IO.GetRasterMetadata(raster_file)
+    ncols = metadata["xsize"]
+    nrows = metadata["ysize"]
+    DataResolution = abs(metadata["GeoT"][1])
+
+    print("Making a hillshade of "+raster_file+" with the "+GetHillshadeKernel(use_compiled)+" kernel")
+    HSarray = np.empty((nrows, ncols))
+    for row_start in range(0, nrows, tile_rows):
+        row_end = min(row_start+tile_rows, nrows)
+
+        # read one extra row above and below so the strips join up
+        read_start = max(row_start-1, 0)
+        read_end = min(row_end+1, nrows)
+        terrain_tile = LSDMap_IO.ReadRasterWindow(raster_file, window = [0, read_start, ncols, read_end-read_start])
+
+        HS_tile = HillshadeArray(terrain_tile, DataResolution, azimuth, angle_altitude,
+                                 None, z_factor, use_compiled)
+        HSarray[row_start:row_end] = HS_tile[row_start-read_start:row_end-read_start]
+
+    if use_cache:
+        stored = _QuantiseHillshade(HSarray)
+        _WriteHillshadeCache(cache_file, stored)
+        HSarray = _DequantiseHillshade(stored)
+
+    return HSarray
+#==============================================================================
+
+#==============================================================================
+def GetHillshadeRasterName(raster_file):
+    """This returns the name LSDTopoTools gives the hillshade of a raster, i.e.
+    the raster name with _hs before the extension.
+
+    Args:
+        raster_file (str): The filename (with path and extension) of the raster.
+
+    Returns:
+        str: the name of the hillshade raster
+    """
+    split_name = os.path.splitext(raster_file)
+    return split_name[0]+"_hs"+split_name[1]
+#==============================================================================
+
+#==============================================================================
+def MakeHillshadeRaster(raster_file, hillshade_file = None, azimuth = 315, angle_altitude = 45,
+                        z_factor = 1, driver_name = "ENVI", NoDataValue = -9999, overwrite = False):
+    """This makes the hillshade raster of a DEM if it doesn't exist already.
+    An existing hillshade (e.g. one written by LSDTopoTools) is kept unless
+    overwrite is True.
+
+    Args:
+        raster_file (str): The filename (with path and extension) of the DEM.
+        hillshade_file (str): The filename of the hillshade. Default is the DEM name with _hs before the extension.
+        azimuth (float): Azimuth of sunlight
+        angle_altitude (float): Angle altitude of sun
+        z_factor (float): z_factor
+        driver_name (str): The raster format (see gdal documentation for options. LSDTopoTools used "ENVI" format.)
+        NoDataValue (float): The nodata value written to the hillshade.
+        overwrite (bool): If true the hillshade is always made
+
+    Returns:
+        str: the filename of the hillshade
+    """
+    if hillshade_file is None:
+        hillshade_file = GetHillshadeRasterName(raster_file)
+
+    if not overwrite and exists(hillshade_file):
+        return hillshade_file
+
+    HSarray = HillshadeRasterFile(raster_file, azimuth, angle_altitude, z_factor)
+    HSarray[np.isnan(HSarray)] = NoDataValue
+    LSDMap_IO.array2raster(raster_file, hillshade_file, HSarray, driver_name, NoDataValue)
+
+    return hillshade_file
+#==============================================================================
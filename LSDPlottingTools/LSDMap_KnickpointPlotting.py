@@ -19,6 +19,7 @@ from LSDMapFigure.PlottingRaster import BaseRaster
 from LSDMapFigure import PlottingHelpers as Helper
 from LSDPlottingTools import colours as lsdcolours
 from LSDPlottingTools import statsutilities as SUT
+from LSDPlottingTools import LSDMap_BatchPlotting as LSDMap_BP
 from LSDPlottingTools import init_plotting_DV
 import LSDPlottingTools as LSDP
 import sys
@@ -367,7 +368,149 @@ def chi_profile_knickpoint(DataDirectory, fname_prefix, size_format='ESURF', Fig
 
     print("done")
 
-def chi_profile_knickzone(DataDirectory, fname_prefix, size_format='ESURF', FigFormat='png', basin_list = [], knickpoint_value = 'delta_ksn', river_length_threshold = 0, outlier_detection_method = '', outlier_detection_binning = ''):
+def _KnickzoneProfileTemplate(size_format, ylabel_KZ):
+    """
+    This makes the figure used for every river by chi_profile_knickzone: the axes,
+    labels and grids, and the artists that are updated for each river.
+    """
+    # Set up fonts for plots
+    label_size = 8
+    rcParams['font.family'] = 'sans-serif'
+    rcParams['font.sans-serif'] = ['arial']
+    rcParams['font.size'] = label_size
+
+    # make a figure with required dimensions
+    if size_format == "geomorphology":
+        fig = plt.figure(facecolor='white',figsize=(6.25,3.5))
+    elif size_format == "big":
+        fig = plt.figure(facecolor='white',figsize=(16,9))
+    else:
+        fig = plt.figure(facecolor='white',figsize=(4.92126,3.5))
+
+    # create the axis and its position
+    ## axis 1: The Chi profile and the knickpoints
+    gs = plt.GridSpec(100,100,bottom=0.15,left=0.15,right=0.95,top=0.95)
+    ax = fig.add_subplot(gs[0:80,0:100])
+    ## axis 2: The cumul axis
+    ax2 = fig.add_subplot(gs[80:100,0:100])
+
+    # The artists that are updated for each river
+    cumul_line, = ax2.plot([], [], lw = 0.5, c = '#787878')
+    profile_line, = ax.plot([], [], lw = 1.2 , c ='#0089B9',alpha = 1,zorder = 7)
+    knickpoints = ax.scatter([], [], c = [], cmap = 'RdBu_r', s = [], alpha = 0.75, lw = 0.5, edgecolor = "k", zorder = 10)
+
+    # Display options
+    ## distance from the axis
+    ax.yaxis.labelpad = 7
+    ax2.yaxis.labelpad = 7
+    ## Name of the xlabels
+    ax2.set_xlabel(r'$\chi$')
+    ## Name of y labels
+    ax2.set_ylabel(ylabel_KZ, rotation = 90, fontsize = 7)
+    ax.set_ylabel('Elevation (m)', rotation = 90, fontsize = 7)
+    ## Disabling the xaxis of the cumul axis as this is the same than the firts one.
+    ax.xaxis.set_ticks_position('none')
+    ax.tick_params(axis = 'x', labelbottom = False)
+    ax2.xaxis.set_ticks_position('bottom')
+    for axil in [ax,ax2]:
+        axil.tick_params(axis = 'y', labelsize = 7)
+    # Finally setting grids to test if this looks good
+    ax.grid(color = 'k', linestyle = '-', linewidth = 0.5, alpha = 0.1)
+    ax2.grid(color = 'k', linestyle = '-', linewidth = 0.5, alpha = 0.1)
+
+    return {"fig": fig, "ax": ax, "ax2": ax2, "cumul_line": cumul_line,
+            "profile_line": profile_line, "knickpoints": knickpoints}
+
+def _PaddedLimits(low, high, margin = 0.05):
+    """
+    The axis limits matplotlib would give data between low and high.
+    """
+    pad = margin*(high-low)
+    if pad == 0:
+        pad = margin*abs(low) if low != 0 else 1
+    return [low-pad, high+pad]
+
+def _DrawKnickzoneProfile(template, frame):
+    """
+    This draws the chi profile of one river on the template from
+    _KnickzoneProfileTemplate and saves it.
+
+    Args:
+        template (dict): from _KnickzoneProfileTemplate
+        frame (dict): with the knickpoints (tKdf), chi profile (tCdf) and knickzones (tKzdf)
+            of the river, the knickpoint column and the name of the figure
+
+    Returns:
+        The name of the figure
+    """
+    ax = template["ax"]
+    ax2 = template["ax2"]
+    knickpoint_col = frame["knickpoint_col"]
+
+    #Sorting by Chi values, not automatic since I am probably weridly using itrator to print the map in c++
+    tKdf = frame["tKdf"].sort_values("chi")
+    tCdf = frame["tCdf"].sort_values("chi")
+    tKzdf = frame["tKzdf"]
+
+    chi = tCdf["chi"].values
+    elevation = tCdf["elevation"].values
+    Kchi = tKdf["chi"].values.copy()
+    Kvalue = tKdf[knickpoint_col].values
+
+    # Plotting the cumul ksn_variation
+    ## shifting first and initial value at 0 for the variations
+    Kchi[0] = chi.min()
+    ## then plotting
+    template["cumul_line"].set_data(Kchi, Kvalue)
+    fills = [ax2.fill_between(Kchi,0,Kvalue, color = "k", alpha = 0.9),
+             ax.fill_between(chi,0,elevation, color = '#AAAAAA' , alpha = 0.8)]
+    for Achi, Bchi, sign in zip(tKzdf['Achi'].values, tKzdf['Bchi'].values, tKzdf['sign'].values):
+        if(sign == 1):
+            colotempolo = "#EF0808"
+        else:
+            colotempolo = "#0055FF"
+        in_zone = (chi >= Achi) & (chi <= Bchi)
+
+        if(Achi == Bchi):
+            lw_temp = 0.5
+        else:
+            lw_temp = 0
+        fills.append(ax.fill_between(chi[in_zone],0,elevation[in_zone], color = colotempolo , alpha = 0.5,lw = lw_temp))
+
+    # Plotting the Chi profiles
+    template["profile_line"].set_data(chi, elevation)
+
+    # sizing the points, casting between 10 and 100
+    size = np.abs(Kvalue)
+    size = size/size.max()*100 + 10
+
+    knickpoints = template["knickpoints"]
+    knickpoints.set_offsets(np.column_stack((Kchi, tKdf["elevation"].values)))
+    knickpoints.set_sizes(size)
+    knickpoints.set_array(tKdf["sign"].values)
+    knickpoints.autoscale()
+
+    # Display options
+    ## setting the same Chi xlimits to display on the same scale
+    chi_limits = _PaddedLimits(min(chi.min(), Kchi.min()), max(chi.max(), Kchi.max()))
+    ax.set_xlim(chi_limits)
+    ax2.set_xlim(chi_limits)
+    ax2.set_ylim(_PaddedLimits(min(0, Kvalue.min()), max(0, Kvalue.max())))
+
+    # setting the elevation limits
+    adjuster = 0.05 * (elevation.max()-elevation.min()) # This adjuster create larger ylimits for the elevation axis.  5 % from the min/max.
+    ax.set_ylim([elevation.min()-adjuster,elevation.max()+adjuster])
+
+    # Saving the figure
+    template["fig"].savefig(frame["save_name"], dpi = 400)
+
+    # Removing this river to get ready for the new one
+    for fill in fills:
+        fill.remove()
+
+    return frame["save_name"]
+
+def chi_profile_knickzone(DataDirectory, fname_prefix, size_format='ESURF', FigFormat='png', basin_list = [], knickpoint_value = 'delta_ksn', river_length_threshold = 0, outlier_detection_method = '', outlier_detection_binning = '', n_processes = None):
 
     """
     This creates a chi profiles with the knickpoint on top of the profile, and the knickzones information in the back.
@@ -380,6 +523,7 @@ def chi_profile_knickzone(DataDirectory, fname_prefix, size_format='ESURF', FigF
         FigFormat (str): The format of the figure. Usually 'png' or 'pdf'. If "show" then it calls the matplotlib show() command.
         knickpoint_value (str): select which knickpoint/zone to display: 'delta_ksn' for the slope of the profile; 'ratio_ksn' for the slope of the ratio variations profile; 'natural' for the angle
         river_length_threshold (int or float): ignore the rivers below a certain length. TO CODE.
+        n_processes (int): The number of processes used to make the figures. Default is the number of CPUs.
        
     Returns:
         Nothing, but save one figure for each rivers.
@@ -440,105 +584,26 @@ def chi_profile_knickzone(DataDirectory, fname_prefix, size_format='ESURF', FigF
 
     #now plotting
     print("I am plotting one figure per river, it can take a while. If you are processing a large area, I would recommend to select main channels")
-    for hussard in Kdf["source_key"].unique():
-    # for hussard in [0,19]: #TEMPORARY TEST FOR COLUMBIA CA
-        # make a figure with required dimensions
-        if size_format == "geomorphology":
-            fig = plt.figure(1, facecolor='white',figsize=(6.25,3.5))            
-        elif size_format == "big":
-            fig = plt.figure(1, facecolor='white',figsize=(16,9))            
-        else:
-            fig = plt.figure(1, facecolor='white',figsize=(4.92126,3.5))
 
-        # create the axis and its position
-        ## axis 1: The Chi profile and the knickpoints
-        gs = plt.GridSpec(100,100,bottom=0.15,left=0.15,right=0.95,top=0.95)
-        ax = fig.add_subplot(gs[0:80,0:100])
-        ## axis 2: The cumul axis
-        gs = plt.GridSpec(100,100,bottom=0.15,left=0.15,right=0.95,top=0.95)
-        ax2 = fig.add_subplot(gs[80:100,0:100])
-        
-        # Selecting the data for this river
-        tKdf = Kdf[Kdf["source_key"] == hussard]
-        tCdf = Cdf[Cdf["source_key"] == hussard]
-        tKzdf = Kzdf[Kzdf["source_key"] == hussard]
-
-        #Sorting by Chi values, not automatic since I am probably weridly using itrator to print the map in c++
-        tKdf = tKdf.sort_values("chi")
-        tCdf = tCdf.sort_values("chi")
-        #tKzdf = tKzdf.sort_values("chi")
-
-        # Plotting the cumul ksn_variation
-        ## shifting first and initial value at 0 for the variations
-        tKdf.iloc[0, tKdf.columns.get_loc('chi')] = tCdf["chi"].min()
-        ## then plotting
-        ax2.plot(tKdf['chi'], tKdf[knickpoint_col],lw = 0.5, c = '#787878' )
-        ax2.fill_between(tKdf["chi"],0,tKdf[knickpoint_col], color = "k", alpha = 0.9)
-        ax.fill_between(tCdf["chi"],0,tCdf["elevation"], color = '#AAAAAA' , alpha = 0.8)
-        for index, row in tKzdf.iterrows():
-            # ax2.plot([row['Achi'],row['Bchi']],[row[cumul_col],row[cumul_col]], lw = 0.75, c = '#787878')
-            if(row['sign'] == 1):
-                colotempolo = "#EF0808"
-            else:
-                colotempolo = "#0055FF"
-            tempdfforplotting = tCdf[tCdf["chi"]>=row['Achi']]
-            tempdfforplotting = tempdfforplotting[tempdfforplotting["chi"]<=row['Bchi']]
-
-            if(row['Achi'] ==row['Bchi']):
-                lw_temp = 0.5
-            else:
-                lw_temp = 0
-            ax.fill_between(tempdfforplotting["chi"],0,tempdfforplotting["elevation"], color = colotempolo , alpha = 0.5,lw = lw_temp)
-
-        # Plotting the Chi profiles
-        ax.plot(tCdf["chi"],tCdf["elevation"], lw = 1.2 , c ='#0089B9',alpha = 1,zorder = 7)
-
-        # sizing the points, casting between 10 and 100
-        size = tKdf[knickpoint_col].abs()
-        size = size/size.max()*100 + 10
-
-        ax.scatter(tKdf["chi"],tKdf["elevation"], c = tKdf["sign"],cmap = 'RdBu_r', s = size, alpha = 0.75, lw = 0.5, edgecolor = "k", zorder = 10)
-
-        # Display options
-        ## setting the same Chi xlimits to display on the same scale
-        ax2.set_xlim(ax.get_xlim())
-        
-        # setting the elevation limits
-        adjuster = 0.05 * (tCdf["elevation"].max()-tCdf["elevation"].min()) # This adjuster create larger ylimits for the elevation axis.  5 % from the min/max.
-        ax.set_ylim([tCdf["elevation"].min()-adjuster,tCdf["elevation"].max()+adjuster])
-        ## distance from the axis
-        ax.yaxis.labelpad = 7
-        ax2.yaxis.labelpad = 7
-        ## Color of the label, ticks and axis
-        ### Cumul axis
-        # ax.yaxis.label.set_color('#787878')
-        # ax.tick_params(axis='y', colors='#787878')
-        # ax.spines['right'].set_color('#787878')
-        # ax.spines['bottom'].set_visible(False)
-
-        ## Name of the xlabels
-        ax2.set_xlabel(r'$\chi$')
-        ## Name of y labels
-        ax2.set_ylabel(ylabel_KZ, rotation = 90, fontsize = 7)
-        ax.set_ylabel('Elevation (m)', rotation = 90, fontsize = 7)
-        ## Disabling the xaxis of the cumul axis as this is the same than the firts one.
-        ax.xaxis.set_ticks_position('none')
-        ax.set_xticklabels([])
-        ax2.xaxis.set_ticks_position('bottom')
-        for axil in [ax,ax2]:
-            for tick in axil.yaxis.get_major_ticks():
-                tick.label.set_fontsize(7)
-        # Finally setting grids to test if this looks good
-        ax.grid(color = 'k', linestyle = '-', linewidth = 0.5, alpha = 0.1)
-        ax2.grid(color = 'k', linestyle = '-', linewidth = 0.5, alpha = 0.1)
-
-        # Saving the figure
+    # split the data by river once
+    Kdfs = LSDMap_BP.PartitionByColumn(Kdf, "source_key")
+    Cdfs = LSDMap_BP.PartitionByColumn(Cdf, "source_key")
+    Kzdfs = LSDMap_BP.PartitionByColumn(Kzdf, "source_key")
+    empty_Kzdf = Kzdf.iloc[0:0]
+
+    frames = []
+    for hussard in sorted(Kdfs):
+        if hussard not in Cdfs:
+            print("I have no chi profile for source "+str(hussard)+", skipping it")
+            continue
         ## Building the name, it has to be specific to avoid replacing files
         save_name = raster_directory + fname_prefix + "_Source" + str(hussard) + suffix_method + '_' + outlier_detection_method +  "."+FigFormat
-        plt.savefig(save_name, dpi = 400)
+        frames.append({"tKdf": Kdfs[hussard], "tCdf": Cdfs[hussard], "tKzdf": Kzdfs.get(hussard, empty_Kzdf),
+                       "knickpoint_col": knickpoint_col, "save_name": save_name})
 
-        # Clearing the figure to get ready for the new one
-        plt.clf()
+    # make the figures in parallel, with one figure in each process that is reused for every river
+    LSDMap_BP.RenderFigureBatch(_KnickzoneProfileTemplate, _DrawKnickzoneProfile, frames,
+                                template_args = (size_format, ylabel_KZ), n_processes = n_processes)
 
     # Printing done to tell people that this is done
     print("done")
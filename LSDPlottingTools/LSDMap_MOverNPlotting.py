@@ -398,6 +398,126 @@ def CompareMOverNEstimatesAllMethods(DataDirectory, fname_prefix, basin_list=[0]
     OutDF.to_csv(outname,index=False)
 
 
+class MOverNStatsStore(object):
+
+    # The constructor: it needs the directory and prefix of the fullstats files
+    def __init__(self, DataDirectory, fname_prefix, m_over_n_values, parallel=False):
+        """This object holds the MLE and RMSE data from all of the fullstats files
+        (one per m/n value) in memory, so the outlier analysis reads each file only once.
+
+        The data are stored in arrays with one row per m/n value and one column per
+        tributary (i.e. each row of a fullstats file), together with the basin key and
+        test source key of each column. The tributaries of each basin keep the order
+        they have in the fullstats files, since the outlier counters are indexed by
+        position within the basin.
+
+        Args:
+            DataDirectory (str): the data directory with the m/n csv files
+            fname_prefix (str): The prefix for the m/n csv files
+            m_over_n_values (list or array): the m/n values, one fullstats file is read for each
+            parallel (bool): If true the fullstats files from a parallel basin run are appended together
+        """
+        self.m_over_n_values = np.asarray(m_over_n_values)
+
+        MLE_rows = []
+        RMSE_rows = []
+        for idx, m_over_n in enumerate(self.m_over_n_values):
+            if not parallel:
+                FullStatsDF = Helper.ReadFullStatsCSV(DataDirectory,fname_prefix,m_over_n)
+            else:
+                FullStatsDF = Helper.AppendFullStatsCSVs(DataDirectory,m_over_n)
+
+            if idx == 0:
+                self.basin_keys = FullStatsDF['basin_key'].values
+                self.source_keys = FullStatsDF['test_source_key'].values
+            elif not (np.array_equal(FullStatsDF['basin_key'].values, self.basin_keys) and
+                      np.array_equal(FullStatsDF['test_source_key'].values, self.source_keys)):
+                # the rows are in a different order: line them up with the first file
+                FullStatsDF = FullStatsDF.set_index(['basin_key','test_source_key'])
+                FullStatsDF = FullStatsDF.reindex(list(zip(self.basin_keys, self.source_keys)))
+
+            MLE_rows.append(np.asarray(FullStatsDF['MLE'].values, dtype=float))
+            RMSE_rows.append(np.asarray(FullStatsDF['RMSE'].values, dtype=float))
+
+        self.MLE = np.vstack(MLE_rows)
+        self.RMSE = np.vstack(RMSE_rows)
+
+        # index of the columns belonging to each basin
+        self._BasinIndices = {}
+        sort_index = np.argsort(self.basin_keys, kind='mergesort')
+        unique_basins, first_index = np.unique(self.basin_keys[sort_index], return_index=True)
+        for basin, these_indices in zip(unique_basins, np.split(sort_index, first_index[1:])):
+            self._BasinIndices[basin] = these_indices
+
+    def GetBasinKeys(self):
+        """This returns the basin keys in the fullstats files
+
+        Returns:
+            list of basin keys
+        """
+        return [int(basin) for basin in sorted(self._BasinIndices.keys())]
+
+    def GetBasinIndices(self, basin_number):
+        """This returns the columns of the stored arrays belonging to a basin
+
+        Args:
+            basin_number (int): The basin you want
+
+        Returns:
+            array of column indices (empty if the basin is not in the files)
+        """
+        return self._BasinIndices.get(basin_number, np.array([], dtype=int))
+
+    def GetOutlierCounter(self, basin_number):
+        """This counts, for each tributary in a basin, the number of m/n values for which
+        it is an outlier. All the m/n values are done at once using the MAD based
+        outlier test on each row.
+
+        Args:
+            basin_number (int): The basin you want
+
+        Returns:
+            array with the number of times each tributary is detected to be an outlier
+        """
+        these_indices = self.GetBasinIndices(basin_number)
+        if these_indices.size == 0:
+            return np.zeros(0)
+
+        MLE_block = self.MLE[:, these_indices]
+        RMSE_block = self.RMSE[:, these_indices]
+
+        # As in the original analysis, the outliers are found from the RMSE
+        # values and the vector is flipped if the maximum MLE is an outlier
+        outliers = LSDP.lsdstatsutilities.is_outlier_rows(RMSE_block)
+        MLE_index_max = np.argmax(MLE_block, axis=1)
+        flip = outliers[np.arange(outliers.shape[0]), MLE_index_max]
+        outliers[flip] = ~outliers[flip]
+
+        return np.sum(outliers, axis=0).astype(float)
+
+    def RecalculateMLEWithRemoveList(self, basin_number, remove_list_index):
+        """This recalculates the total MLE of a basin for every m/n value while
+        incrementally removing tributaries. Removed tributaries get an MLE of 1.
+
+        Args:
+            basin_number (int): The basin you want
+            remove_list_index (list of lists): This contains information about what tributaries to remove
+
+        Returns:
+            MLEs (array): the MLE values for each m/n (rows) and each iterated
+            removed tributary (columns). The first column is with no tributaries removed.
+        """
+        these_indices = self.GetBasinIndices(basin_number)
+        MLE_block = self.MLE[:, these_indices]
+
+        # each row of the mask has the tributaries removed up to that step
+        remove_mask = np.zeros((len(remove_list_index)+1, these_indices.size), dtype=bool)
+        for step, stuff_to_remove in enumerate(remove_list_index):
+            remove_mask[step+1] = remove_mask[step]
+            remove_mask[step+1, list(stuff_to_remove)] = True
+
+        return np.prod(np.where(remove_mask[np.newaxis, :, :], 1.0, MLE_block[:, np.newaxis, :]), axis=2)
+
 def CheckMLEOutliers(DataDirectory, fname_prefix, basin_list=[0], start_movern=0.2, d_movern=0.1, n_movern=7, parallel=False):
     """
     This function uses the fullstats files to search for outliers in the
@@ -450,90 +570,19 @@ def CheckMLEOutliers(DataDirectory, fname_prefix, basin_list=[0], start_movern=0
     end_movern = start_movern+d_movern*(n_movern-1)
     m_over_n_values = np.linspace(start_movern,end_movern,n_movern)
 
-    # we open the first file just so that we can get a counter list
+    # read all of the fullstats files once
     print "PARALLEL = ", parallel
-    if not parallel:
-        FirstDF = Helper.ReadFullStatsCSV(DataDirectory,fname_prefix,m_over_n_values[0])
-    else:
-        FirstDF = Helper.AppendFullStatsCSVs(DataDirectory,m_over_n_values[0])
-
-    # get the number of basins
-    basin_keys = list(FirstDF['basin_key'])
-    basin_keys = [float(x) for x in basin_keys]
+    StatsStore = MOverNStatsStore(DataDirectory, fname_prefix, m_over_n_values, parallel)
 
     # get the list of basins
     if basin_list == []:
         print("You didn't give me a list of basins, so I'll just run the analysis on all of them!")
-        basin_list = basin_keys
-        basin_set = set(basin_list)
-        basin_list = list(basin_set)
-        basin_list = [int(i) for i in basin_list]
+        basin_list = StatsStore.GetBasinKeys()
 
-    # make a data object that will hold the counters
+    # Now count the outliers of each basin over all of the m/n values
     Outlier_counter = {}
-    # loop through the basins
     for basin in basin_list:
-        # mask the data so you only get the correct basin
-        FirstDF_basin = FirstDF[FirstDF['basin_key'] == basin]
-
-        trib_values = list(FirstDF_basin['test_source_key'])
-        n_nodes = len(trib_values)
-        # make the counter with zeros
-        this_counter = np.zeros(n_nodes)
-        Outlier_counter[basin] = this_counter
-
-    # Now we loop through all the files, calculating the outliers
-    for m_over_n in m_over_n_values:
-
-        #load the file
-        if not parallel:
-            FullStatsDF = Helper.ReadFullStatsCSV(DataDirectory,fname_prefix,m_over_n)
-        else:
-            FullStatsDF = Helper.AppendFullStatsCSVs(DataDirectory,m_over_n)
-
-        print("This_m_over_n is: "+str(m_over_n))
-
-        # loop through the basins
-        for basin in basin_list:
-
-            # mask the data so you only get the correct basin
-            FullStatsDF_basin = FullStatsDF[FullStatsDF['basin_key'] == basin]
-
-            # extract the relevant data
-            MLE_values = list(FullStatsDF_basin['MLE'])
-            RMSE_values = list(FullStatsDF_basin['RMSE'])
-            trib_values = list(FullStatsDF_basin['test_source_key'])
-            print ('N values: '+str(len(MLE_values))+' '+str(len(RMSE_values))+' '+str(len(trib_values)))
-
-            # now get the outliers
-            MLE_array = np.asarray(MLE_values)
-            RMSE_array = np.asarray(RMSE_values)
-
-            # Get the outliers using the MAD-based outlier function
-            RMSE_outliers = LSDP.lsdstatsutilities.is_outlier(RMSE_array)
-            MLE_outliers = LSDP.lsdstatsutilities.is_outlier(RMSE_array)
-
-            # now check each of the outlier arrays to see if e need to flip the array
-            RMSE_index_min = np.argmin(RMSE_array)
-            #RMSE_min = np.min(RMSE_array)
-
-            # if the max MLE is an outlier, flip the outlier vector
-            if (RMSE_outliers[RMSE_index_min]):
-                RMSE_outliers = [not i for i in RMSE_outliers]
-
-            MLE_index_max = np.argmax(MLE_array)
-
-            # if the max MLE is an outlier, flip the outlier vector
-            if (MLE_outliers[MLE_index_max]):
-                MLE_outliers = [not i for i in MLE_outliers]
-
-            # turn the outliers vector into an integer
-            int_Outlier = [int(i) for i in MLE_outliers]
-            #print("Integer outliers are: ")
-            #print(int_Outlier)
-
-            # add this outlier counter to the outlier dict
-            Outlier_counter[basin] = Outlier_counter[basin]+int_Outlier
+        Outlier_counter[basin] = StatsStore.GetOutlierCounter(basin)
 
     # Now try to calculate MLE by removing outliers
 
@@ -551,7 +600,8 @@ def CheckMLEOutliers(DataDirectory, fname_prefix, basin_list=[0], start_movern=0
                                                                                 basin_number,
                                                                                 start_movern,
                                                                                 d_movern,
-                                                                                n_movern, parallel)
+                                                                                n_movern, parallel,
+                                                                                StatsStore)
         best_fit_movern_dict[basin_number] = movern_of_max_MLE
         removed_sources_dict[basin_number] = remove_list_index
         MLEs_dict[basin_number] = MLEs
@@ -561,7 +611,7 @@ def CheckMLEOutliers(DataDirectory, fname_prefix, basin_list=[0], start_movern=0
 
     return Outlier_counter, removed_sources_dict, best_fit_movern_dict, MLEs_dict
 
-def Iteratively_recalculate_MLE_removing_outliers_for_basin(Outlier_counter, DataDirectory, fname_prefix, basin_number, start_movern=0.2, d_movern=0.1, n_movern=7, parallel=False):
+def Iteratively_recalculate_MLE_removing_outliers_for_basin(Outlier_counter, DataDirectory, fname_prefix, basin_number, start_movern=0.2, d_movern=0.1, n_movern=7, parallel=False, StatsStore=None):
     """
     This function drives the calculations for removing outliers incrementally
     from the MLE calculations. This is specific to a basin.
@@ -576,6 +626,7 @@ def Iteratively_recalculate_MLE_removing_outliers_for_basin(Outlier_counter, Dat
         start_movern (float): the starting m/n value. Default is 0.2
         d_movern (float): the increment between the m/n values. Default is 0.1
         n_movern (float): the number of m/n values analysed. Default is 7.
+        StatsStore (MOverNStatsStore): If given, the MLE values are taken from this rather than read from the files
 
     Returns:
         remove_list_index (list of list): This is the sequence of tributaries that will be removed
@@ -665,7 +716,8 @@ def Iteratively_recalculate_MLE_removing_outliers_for_basin(Outlier_counter, Dat
                                                                              DataDirectory,
                                                                              fname_prefix,
                                                                              basin_number,
-                                                                             remove_list_index, parallel)
+                                                                             remove_list_index, parallel,
+                                                                             StatsStore)
 
     # Returns the remove_list_index, which is a list where each element
     # is a list of tributaries removed in an iteration,
@@ -676,7 +728,8 @@ def Iteratively_recalculate_MLE_removing_outliers_for_basin(Outlier_counter, Dat
 
 def Calculate_movern_after_iteratively_removing_outliers(movern_list, DataDirectory,
                                                          fname_prefix, basin_number,
-                                                         remove_list_index, parallel=False):
+                                                         remove_list_index, parallel=False,
+                                                         StatsStore=None):
     """
     This function takes the remove list index, which contains information about
     the sequence of tributaries to be removed, and then recalculates MLE by incrementally
@@ -688,6 +741,7 @@ def Calculate_movern_after_iteratively_removing_outliers(movern_list, DataDirect
         fname_prefix (str): The prefix for the m/n csv files
         basin_number (int): The basin you want
         remove_list_index (list of lists): This contains information about what tributaries to remove
+        StatsStore (MOverNStatsStore): If given, the MLE values are taken from this rather than read from the files
 
     Returns:
         movern_of_max_MLE (list): A list containing the m/n values of the basin after outlying
@@ -700,14 +754,9 @@ def Calculate_movern_after_iteratively_removing_outliers(movern_list, DataDirect
     """
     # Loop through m over n values and recalculate MLE values after removing
     # the outlying data
-    All_MLE = []
-    for m_over_n in movern_list:
-        MLE_vals = RecalculateTotalMLEWithRemoveList(DataDirectory, fname_prefix,
-                                                     m_over_n,basin_number, remove_list_index, parallel)
-        All_MLE.append(MLE_vals)
-
-
-    MLEs = np.asarray(All_MLE)
+    if StatsStore is None:
+        StatsStore = MOverNStatsStore(DataDirectory, fname_prefix, movern_list, parallel)
+    MLEs = StatsStore.RecalculateMLEWithRemoveList(basin_number, remove_list_index)
     index_of_maximums = np.argmax(MLEs,0)
 
     movern_of_max_MLE = []
@@ -725,7 +774,8 @@ def Calculate_movern_after_iteratively_removing_outliers(movern_list, DataDirect
     return movern_of_max_MLE, MLEs
 
 def RecalculateTotalMLEWithRemoveList(DataDirectory, fname_prefix,
-                                      movern,basin_number, remove_list_index, parallel=False):
+                                      movern,basin_number, remove_list_index, parallel=False,
+                                      StatsStore=None):
     """
     This function takes the remove list index and then recalculates MLE by incrementally
     removing tributaries
@@ -736,59 +786,304 @@ def RecalculateTotalMLEWithRemoveList(DataDirectory, fname_prefix,
         movern (float): m/n value.
         basin_number (int): The basin you want
         remove_list_index (list of lists): This contains information about what tributaries to remove
+        StatsStore (MOverNStatsStore): If given, the MLE values are taken from this rather than read from the file
 
     Returns:
         MLE_vals (list): The MLE data with incrementally removed tributaries
 
     Author: SMM
     """
-    #load the file
-    if not parallel:
-        FullStatsDF = Helper.ReadFullStatsCSV(DataDirectory,fname_prefix,movern)
+    if StatsStore is None:
+        StatsStore = MOverNStatsStore(DataDirectory, fname_prefix, [movern], parallel)
+        movern_index = 0
     else:
-        FullStatsDF = Helper.AppendFullStatsCSVs(DataDirectory,movern)
+        movern_index = np.argmin(np.abs(StatsStore.m_over_n_values-movern))
 
-    # mask the data so you only get the correct basin
-    FullStatsDF_basin = FullStatsDF[FullStatsDF['basin_key'] == basin_number]
+    MLEs = StatsStore.RecalculateMLEWithRemoveList(basin_number, remove_list_index)
+    MLE_vals = list(MLEs[movern_index])
 
-    # extract the relevant data
-    MLE_values = list(FullStatsDF_basin['MLE'])
-    #trib_values = list(FullStatsDF_basin['test_source_key'])
+    return MLE_vals
+
+#=============================================================================
+# PLOTTING FUNCTIONS
+# Make plots of the m/n analysis
+#=============================================================================
 
-    # get the MLE_values as an array
-    MLE_values = np.asarray(MLE_values)
+def _ChiProfileTemplate(size_format, label_size = 10, gs_right = 1.0, colourbar = True):
+    """
+    This makes the figure that the chi profile plots of each basin and m/n are
+    drawn on. It is made once in each process and reused for every plot.
 
-    #print("The total MLE is: ")
-    #print(np.prod(MLE_values))
+    Args:
+        size_format (str): Can be "big" (16 inches wide), "geomorphology" (6.25 inches wide), or "ESURF" (4.92 inches wide) (defualt esurf).
+        label_size (int): The font size
+        gs_right (float): The right edge of the grid spec
+        colourbar (bool): If true there is a colourbar axis next to the profile
 
-    MLE_vals = []
-    MLE_vals.append(np.prod(MLE_values))
+    Returns:
+        dict with the figure, the axis and the colourbar axis
+    """
+    # Set up fonts for plots
+    rcParams['font.family'] = 'sans-serif'
+    rcParams['font.sans-serif'] = ['arial']
+    rcParams['font.size'] = label_size
 
-    # now loop through the remove list
-    remove_list = []
-    for stuff_to_remove in remove_list_index:
-        this_MLE = MLE_values
+    # make a figure
+    if size_format == "geomorphology":
+        fig = plt.figure(facecolor='white',figsize=(6.25,3.5))
+    elif size_format == "big":
+        fig = plt.figure(facecolor='white',figsize=(16,9))
+    else:
+        fig = plt.figure(facecolor='white',figsize=(4.92126,3.2))
 
-        # need to extend the remove list with these tribs
-        remove_list.extend(stuff_to_remove)
+    gs = plt.GridSpec(100,100,bottom=0.15,left=0.1,right=gs_right,top=1.0)
+    if colourbar:
+        ax = fig.add_subplot(gs[10:95,5:80])
+        #colorbar axis
+        ax2 = fig.add_subplot(gs[10:95,82:85])
+    else:
+        ax = fig.add_subplot(gs[5:100,10:95])
+        ax2 = None
 
-        # now set the MLE of the removed tribs to 1
-        for idx in remove_list:
-            this_MLE[idx] = 1
+    return {"fig": fig, "ax": ax, "ax2": ax2}
 
-        #print("\n REMOVING; The total MLE is: ")
-        #print(np.prod(this_MLE))
-        MLE_vals.append(np.prod(this_MLE))
+def _FinishChiProfileFrame(template, frame):
+    """
+    This formats the axis of a chi profile plot and saves it.
 
-    return MLE_vals
+    Returns:
+        The name of the figure, or the PNG of the figure if the frame is going to a video.
+    """
+    import io
 
-#=============================================================================
-# PLOTTING FUNCTIONS
-# Make plots of the m/n analysis
-#=============================================================================
+    ax = template["ax"]
+
+    # some formatting of the figure
+    ax.spines['top'].set_linewidth(1)
+    ax.spines['left'].set_linewidth(1)
+    ax.spines['right'].set_linewidth(1)
+    ax.spines['bottom'].set_linewidth(1)
+
+    # make the lables
+    ax.set_xlabel("$\chi$ (m)")
+    ax.set_ylabel("Elevation (m)")
+
+    # This gets all the ticks, and pads them away from the axis so that the corners don't overlap
+    ax.tick_params(axis='both', width=1, pad = 2)
+    for tick in ax.xaxis.get_major_ticks():
+        tick.set_pad(2)
+
+    if frame["stream"]:
+        png_buffer = io.BytesIO()
+        template["fig"].savefig(png_buffer,format="png",dpi=300)
+        if frame["save_name"] is not None:
+            template["fig"].savefig(frame["save_name"],format=frame["FigFormat"],dpi=300)
+        return png_buffer.getvalue()
+    else:
+        template["fig"].savefig(frame["save_name"],format=frame["FigFormat"],dpi=300)
+        return frame["save_name"]
+
+def _DrawChiProfileColouredByElevation(template, frame):
+    """
+    This draws the chi profiles of one basin for one m/n coloured by elevation,
+    for MakePlotsWithMLEStats.
+    """
+    ax = template["ax"]
+    ax.cla()
+
+    # now plot the data with a colourmap
+    ax.scatter(frame["X"],frame["Elevation"],s=2.5, c=frame["Elevation"],cmap="terrain",edgecolors='none')
+
+    title_string = "Basin "+str(frame["basin_key"])+", $m/n$ = "+str(frame["m_over_n"])
+    ax.text(0.05, 0.95, title_string,
+            verticalalignment='top', horizontalalignment='left',
+            transform=ax.transAxes,
+            color='black', fontsize=10)
+
+    return _FinishChiProfileFrame(template, frame)
+
+def _DrawChiProfileColouredByValue(template, frame):
+    """
+    This draws the chi profiles of one basin for one m/n where the tributaries
+    are coloured by the MLE (frame["colour_by"] = "MLE") or by a value on every
+    node such as K or lithology (frame["colour_by"] = "value").
+    """
+    from matplotlib.ticker import FormatStrFormatter
+    from LSDPlottingTools import colours
+
+    ax = template["ax"]
+    ax2 = template["ax2"]
+    ax.cla()
+    ax2.cla()
+
+    colour_array = np.asarray(frame["TributariesC"])
+    min_C = np.min(colour_array)
+    max_C = np.max(colour_array)
+
+    if frame["colour_by"] == "MLE":
+        # get the colourmap to colour channels by the MLE value
+        this_cmap = plt.cm.coolwarm
+        cNorm  = colors.Normalize(vmin=min_C, vmax=max_C)
+
+        # now plot the data with a colourmap
+        sc = ax.scatter(frame["TributariesX"],frame["TributariesElevation"],c=frame["TributariesC"],cmap=this_cmap, norm=cNorm, s=2.5, edgecolors='none')
+        ax.plot(frame["MainStemX"],frame["MainStemElevation"],lw=2, c='k')
+    else:
+        this_cmap = plt.cm.Spectral
+        n_colours = 10
+        this_cmap = colours.cmap_discretize(n_colours, this_cmap)
+        cNorm  = colors.Normalize(vmin=min_C, vmax=max_C)
+
+        # now plot the data with a colourmap
+        sc = ax.scatter(frame["TributariesX"],frame["TributariesElevation"],c=frame["TributariesC"],cmap=this_cmap, norm=cNorm, s=2.5, edgecolors='none')
+        sc = ax.scatter(frame["MainStemX"], frame["MainStemElevation"],c=frame["MainStemC"],cmap=this_cmap, norm=cNorm, s=2.5, edgecolors='none')
+
+    # label with the basin and m/n
+    title_string = "Basin "+str(frame["basin_key"])+", $m/n$ = "+str(frame["m_over_n"])
+    if frame["best_fit"]:
+        title_colour = 'red'
+    else:
+        title_colour = 'black'
+    ax.text(0.05, 0.95, title_string,
+            verticalalignment='top', horizontalalignment='left',
+            transform=ax.transAxes,
+            color=title_colour, fontsize=10)
+
+    # add the colorbar
+    colorbarlabel = frame["colourbarlabel"]
+    cbar = plt.colorbar(sc,cmap=this_cmap,spacing='uniform', orientation='vertical',cax=ax2)
+    cbar.set_label(colorbarlabel, fontsize=10)
+    ax2.set_ylabel(colorbarlabel, fontname='Arial', fontsize=10)
+
+    if frame["colour_by"] == "MLE":
+        ax2.yaxis.set_major_formatter(FormatStrFormatter('%.2f'))
+    else:
+        #change labels to scientific notation
+        colours.fix_colourbar_ticks(cbar,n_colours, cbar_type=float, min_value = min_C, max_value = max_C, cbar_label_rotation=0, cbar_orientation='vertical')
+        # we need to get linear values between min and max K
+        these_labels = np.linspace(min_C,max_C,n_colours)
+        # now round these and convert to scientific notation
+        these_labels = [str('{:.2e}'.format(float(x))) for x in these_labels]
+        new_labels = []
+        for label in these_labels:
+            a,b = label.split("e")
+            b = b.replace("0", "")
+            new_labels.append(a+' x 10$^{%s}$' % b)
+
+        ax2.set_yticklabels(new_labels, fontsize=8)
+
+    return _FinishChiProfileFrame(template, frame)
+
+def _GetChiProfileFrames(DataDirectory, fname_prefix, basin_list, m_over_n_values, colour_column = "MLE", parallel = False):
+    """
+    This reads the chi profiles and the MLE of the tributaries and splits them
+    into one frame for each basin and m/n. The profiles are split by basin once and
+    each fullstats file is read and split by basin once.
+
+    Args:
+        DataDirectory (str): the data directory with the m/n csv files
+        fname_prefix (str): The prefix for the m/n csv files
+        basin_list: a list of the basins to make the plots for. If an empty list is passed then
+        all the basins will be used.
+        m_over_n_values (array): the m/n values
+        colour_column (str): "MLE" to colour the tributaries by their MLE, otherwise the column of the profile csv to colour all the channels by
+        parallel (bool): If true the data is read from the parallel basin runs
+
+    Returns:
+        list of frames (dicts), ordered by basin and then m/n
+    """
+    # read in the csv files
+    if not parallel:
+        ProfileDF = Helper.ReadChiProfileCSV(DataDirectory, fname_prefix)
+        BasinStatsDF = Helper.ReadBasinStatsCSV(DataDirectory, fname_prefix)
+    else:
+        ProfileDF = Helper.AppendMovernCSV(DataDirectory)
+        BasinStatsDF = Helper.AppendBasinCSVs(DataDirectory)
+
+    # get the number of basins
+    basin_keys = list(BasinStatsDF['basin_key'])
+    basin_keys = [int(x) for x in basin_keys]
+
+    # get the list of basins
+    if basin_list == []:
+        print("You didn't give me a list of basins, so I'll just run the analysis on all of them!")
+        basin_list = basin_keys
+
+    # best fit moverns
+    best_fit_moverns = SimpleMaxMLECheck(BasinStatsDF)
+
+    # split everything by basin once
+    ProfileDFs = LSDP.PartitionByColumn(ProfileDF, "basin_key")
+    FullStatsDFs = {}
+    for m_over_n in m_over_n_values:
+        print("Reading the stats of m/n: "+str(m_over_n))
+        if not parallel:
+            FullStatsDF = Helper.ReadFullStatsCSV(DataDirectory,fname_prefix,m_over_n)
+        else:
+            FullStatsDF = Helper.AppendFullStatsCSVs(DataDirectory,m_over_n)
+        FullStatsDFs[m_over_n] = LSDP.PartitionByColumn(FullStatsDF, "basin_key")
+
+    frames = []
+    for basin_key in basin_list:
+        if basin_key not in ProfileDFs:
+            print("I can't find the profiles of basin "+str(basin_key)+", skipping it")
+            continue
+        ProfileDF_basin = ProfileDFs[basin_key]
+        source_keys = ProfileDF_basin['source_key'].values
+
+        for m_over_n in m_over_n_values:
+            FullStatsDF_basin = FullStatsDFs[m_over_n][basin_key]
+            reference_source_key = FullStatsDF_basin.iloc[0]['reference_source_key']
+
+            # get the data frames for the main stem and the tributaries with an MLE
+            is_main_stem = source_keys == reference_source_key
+            ProfileDF_MS = ProfileDF_basin[is_main_stem]
+            ProfileDF_tribs = ProfileDF_basin[~is_main_stem]
+            MLE_of_source = pd.Series(FullStatsDF_basin['MLE'].values, index = FullStatsDF_basin['test_source_key'].values)
+            ProfileDF_tribs = ProfileDF_tribs[ProfileDF_tribs['source_key'].isin(MLE_of_source.index)]
+
+            # get the chi and elevation data
+            movern_key = 'm_over_n = %s' %(str(m_over_n))
+            frame = {"basin_key": basin_key, "m_over_n": m_over_n,
+                     "best_fit": best_fit_moverns[basin_key] == m_over_n,
+                     "MainStemX": ProfileDF_MS[movern_key].values,
+                     "MainStemElevation": ProfileDF_MS['elevation'].values,
+                     "TributariesX": ProfileDF_tribs[movern_key].values,
+                     "TributariesElevation": ProfileDF_tribs['elevation'].values}
+            if colour_column == "MLE":
+                frame["colour_by"] = "MLE"
+                frame["MainStemC"] = None
+                frame["TributariesC"] = ProfileDF_tribs['source_key'].map(MLE_of_source).values
+            else:
+                frame["colour_by"] = "value"
+                frame["MainStemC"] = ProfileDF_MS[colour_column].values
+                frame["TributariesC"] = ProfileDF_tribs[colour_column].values
+            frames.append(frame)
+
+    return frames
+
+def _RenderChiProfileFrames(frames, directory, file_prefix, size_format, FigFormat, animate, keep_pngs, gs_right, n_processes):
+    """
+    This names the chi profile frames and renders them, either to figures or
+    streamed to a video (with the figures also kept if keep_pngs is true).
+    """
+    for frame in frames:
+        frame["FigFormat"] = FigFormat
+        frame["stream"] = animate
+        frame["save_name"] = directory+file_prefix+str(frame["basin_key"])+"_"+str(frame["m_over_n"])+"."+str(FigFormat)
+        if animate and not keep_pngs:
+            frame["save_name"] = None
+
+    if animate:
+        video_name = directory+file_prefix.rstrip("_")+".mp4"
+    else:
+        video_name = None
+    LSDP.RenderFigureBatch(_ChiProfileTemplate, _DrawChiProfileColouredByValue, frames,
+                           template_args = (size_format, 10, gs_right, True),
+                           n_processes = n_processes, video_name = video_name)
 
 def MakePlotsWithMLEStats(DataDirectory, fname_prefix, basin_list = [0],
-                  start_movern = 0.2, d_movern = 0.1, n_movern = 7, parallel=False):
+                  start_movern = 0.2, d_movern = 0.1, n_movern = 7, parallel=False, n_processes=None):
     """
     This function makes a chi-elevation plot for each basin and each value of
     m/n and prints the MLE value between the tributaries and the main stem.
@@ -804,6 +1099,7 @@ def MakePlotsWithMLEStats(DataDirectory, fname_prefix, basin_list = [0],
         start_movern (float): the starting m/n value. Default is 0.2
         d_movern (float): the increment between the m/n values. Default is 0.1
         n_movern (float): the number of m/n values analysed. Default is 7.
+        n_processes (int): The number of processes used to make the plots. Default is the number of CPUs.
 
     Returns:
         Plot of each m/n value for each basin.
@@ -816,12 +1112,6 @@ def MakePlotsWithMLEStats(DataDirectory, fname_prefix, basin_list = [0],
     if not os.path.isdir(MLE_directory):
         os.makedirs(MLE_directory)
 
-    profile_suffix = "_movern.csv"
-    basin_stats_suffix = "_movernstats_basinstats.csv"
-
-    movern_profile_file = fname_prefix+profile_suffix
-    movern_basin_stats_file = fname_prefix+basin_stats_suffix
-
     end_movern = start_movern+d_movern*(n_movern-1)
     m_over_n_values = np.linspace(start_movern,end_movern,n_movern)
 
@@ -830,192 +1120,57 @@ def MakePlotsWithMLEStats(DataDirectory, fname_prefix, basin_list = [0],
         pd_DF = Helper.ReadBasinStatsCSV(DataDirectory, fname_prefix)
     else:
         pd_DF = Helper.AppendBasinStatsCSVs(DataDirectory)
-        
-    shp = pd_DF.shape
-    max_MLEs = []
-    max_MLEs_index = []
-    for i in range(0,shp[0]):
-        #print("I is: "+str(i))
-        a = pd_DF.loc[[i]]
-        b = np.asarray(a)
-        c = b[0,2:]
-        max_MLEs.append(max(c))
-        max_MLEs_index.append(np.argmax(c))
-    m_over_n_of_max = []
-
-    for idx in max_MLEs_index:
-        m_over_n_of_max.append(m_over_n_values[idx])
+
+    # the MLE of each basin (row) and m/n (column)
+    MLE_table = np.asarray(pd_DF)[:,2:].astype(float)
+    max_MLEs_index = np.argmax(MLE_table, axis=1)
+    m_over_n_of_max = [m_over_n_values[idx] for idx in max_MLEs_index]
 
     print("The m over n of these max are: ")
     print(m_over_n_of_max)
 
-    n_basins = len(max_MLEs)
-
-    label_size = 12
-
-    # Set up fonts for plots
-    rcParams['font.family'] = 'sans-serif'
-    rcParams['font.sans-serif'] = ['arial']
-    rcParams['font.size'] = label_size
-    size_format = "default"
-    # make a figure,
-    if size_format == "geomorphology":
-        fig = plt.figure(1, facecolor='white',figsize=(6.25,3.5))
-        #l_pad = -40
-    elif size_format == "big":
-        fig = plt.figure(1, facecolor='white',figsize=(16,9))
-        #l_pad = -50
-    else:
-        fig = plt.figure(1, facecolor='white',figsize=(4.92126,3.2))
-        #l_pad = -35
-
-    gs = plt.GridSpec(100,100,bottom=0.15,left=0.1,right=1.0,top=1.0)
-    ax = fig.add_subplot(gs[5:100,10:95])
-
-    # load the m_over_n data file
-    thisPointData = LSDP.LSDMap_PointData(DataDirectory,movern_profile_file,parallel=parallel)
-    allBasinStatsData = LSDP.LSDMap_PointData(DataDirectory+movern_basin_stats_file)
+    n_basins = MLE_table.shape[0]
 
     print("m over n values are: ")
     print(m_over_n_values)
 
-    mn_legends = []
-    for mn in m_over_n_values:
-        mn_legends.append("m_over_n = "+str(mn))
-
-    print("The mn labels are: ")
-    print(mn_legends)
-
-    # get the data form the profiles
-    elevation = thisPointData.QueryData('elevation')
-    elevation = [float(x) for x in elevation]
-    basin = thisPointData.QueryData('basin_key')
-    basin = [int(x) for x in basin]
-    source = thisPointData.QueryData('source_key')
-    source = [int(x) for x in source]
-
-    # get the basin keys
-    allstats_basinkeys = allBasinStatsData.QueryData("basin_key")
-    allstats_basinkeys = [int(x) for x in allstats_basinkeys]
+    # load the m_over_n data file and split it by basin
+    if not parallel:
+        ProfileDF = Helper.ReadChiProfileCSV(DataDirectory, fname_prefix)
+    else:
+        ProfileDF = Helper.AppendMovernCSV(DataDirectory)
+    ProfileDFs = LSDP.PartitionByColumn(ProfileDF, "basin_key")
 
-    # need to convert everything into arrays so we can mask different basins
-    Elevation = np.asarray(elevation)
-    Basin = np.asarray(basin)
-    #Source = np.asarray(source)
-
-    # Loop through m/n values aggregating data
-    for idx,mn in enumerate(m_over_n_values):
-
-        counter = str(idx).zfill(3)
-        print("Counter is: "+counter)
-        # first get the chi values for this m_over_n
-        #print ("mn is: " + str(mn))
-        #print("index is: "+str(idx))
-        mn_legend = "m_over_n = "+str(mn)
-        #print("I am looking for the data element: "+mn_legend)
-        this_chi = thisPointData.QueryData(mn_legend)
-
-        # get the MLE value for this m/n
-        this_MLE = allBasinStatsData.QueryData(mn_legend)
-
-        # convert to a numpy array for masking
-        Chi = np.asarray(this_chi)
-
-        # some info about the chi and elevation values
-        #max_chi = np.amax(Chi)
-        #max_Elevation = np.amax(Elevation)
-        #min_Elevation = np.amin(Elevation)
-
-        #z_axis_min = int(min_Elevation/10)*10
-        #z_axis_max = int(max_Elevation/10)*10+10
-        #chi_axis_max = int(max_chi/5)*5+5
-
-        # Now mask the data. Initially we will do only basin 0
-        if basin_list == []:
-            print("You didn't give me any basins so I assume you want all of them.")
-            basin_list = range(0,n_basins-1)
-
-        for basin_key in basin_list:
-            # now we need to find out if this basin is in the allstats file,
-            # and if so what index it is
-            #this_basin_index = -99
-            #for ii,bk in enumerate(allstats_basinkeys):
-            #    #print("index: "+str(ii)+" and basin_key is: "+str(bk))
-            #    if (bk == basin_key):
-            #        this_basin_index = idx
-
-            #if(this_basin_index != -99):
-            #    MLE = this_MLE[this_basin_index]
-            #else:
-            #    MLE = "NaN"
-            MLE = this_MLE[basin_key]
-            #MLE_str = str(MLE)
-            #short_MLE = str("%03.02e" % round(MLE,2))
+    # Now mask the data. Initially we will do only basin 0
+    if basin_list == []:
+        print("You didn't give me any basins so I assume you want all of them.")
+        basin_list = range(0,n_basins-1)
+
+    frames = []
+    for basin_key in basin_list:
+        if basin_key not in ProfileDFs:
+            print("I can't find the profiles of basin "+str(basin_key)+", skipping it")
+            continue
+
+        for idx,mn in enumerate(m_over_n_values):
+            counter = str(idx).zfill(3)
+            mn_legend = "m_over_n = "+str(mn)
+            MLE = MLE_table[basin_key,idx]
             short_MLE = str(round(MLE,3))
-            print("The short MLE is: "+short_MLE)
-
-            #print("The MLE of this basin for this m over n is: "+short_MLE)
-
-            # this gets the mask (for the chosen basin)
-            m = np.ma.masked_where(Basin!=basin_key, Basin)
-
-            # this is the masked chi value
-            maskX = np.ma.masked_where(np.ma.getmask(m), Chi)
-            maskElevation = np.ma.masked_where(np.ma.getmask(m), Elevation)
-
-            # now plot the data with a colourmap
-            ax.scatter(maskX,maskElevation,s=2.5, c=maskElevation,cmap="terrain",edgecolors='none')
-
-            # some formatting of the figure
-            ax.spines['top'].set_linewidth(1)
-            ax.spines['left'].set_linewidth(1)
-            ax.spines['right'].set_linewidth(1)
-            ax.spines['bottom'].set_linewidth(1)
-
-            # make the lables
-            ax.set_xlabel("$\chi$ (m)")
-            ax.set_ylabel("Elevation (m)")
-
-            # This affects all axes because we set share_all = True.
-            #ax.set_ylim(z_axis_min,z_axis_max)
-            #ax.set_ylim(z_axis_min,z_axis_max)
-            #ax.set_xlim(0,chi_axis_max)
-            #ax.text("Basin = " +mn_legend+", $m/n$ = "+str(mn))
-
-            #newline = "\n"
-            title_string = "Basin "+str(basin_key)+", $m/n$ = "+str(mn)
-            title_string2 = "MLE = "+short_MLE
-            ax.text(0.05, 0.95, title_string,
-                    verticalalignment='top', horizontalalignment='left',
-                    transform=ax.transAxes,
-                    color='black', fontsize=10)
-            # print("The basin index is: "+str(basin_key)+" and the max index is: "+str(max_MLEs_index[basin_key]))
-            # if( idx == max_MLEs_index[basin_key]):
-            #     print("This m/n is: "+str(mn)+" and it is the maximum MLE")
-            #     ax.text(0.05, 0.88, title_string2+", maximum MLE in basin.",
-            #         verticalalignment='top', horizontalalignment='left',
-            #         transform=ax.transAxes,
-            #         color='red', fontsize=10)
-            # else:
-            #     ax.text(0.05, 0.88, title_string2,
-            #         verticalalignment='top', horizontalalignment='left',
-            #         transform=ax.transAxes,
-            #         color='black', fontsize=10)
-
-            #save the plot
-            newFilename = MLE_directory+"Chi_profiles_basin_"+str(basin_key)+"_"+counter+".png"
+            print("Basin "+str(basin_key)+", m/n "+str(mn)+": the short MLE is: "+short_MLE)
 
-            # This gets all the ticks, and pads them away from the axis so that the corners don't overlap
-            ax.tick_params(axis='both', width=1, pad = 2)
-            for tick in ax.xaxis.get_major_ticks():
-                tick.set_pad(2)
+            frames.append({"basin_key": basin_key, "m_over_n": mn,
+                           "X": ProfileDFs[basin_key][mn_legend].values,
+                           "Elevation": ProfileDFs[basin_key]['elevation'].values,
+                           "stream": False, "FigFormat": "png",
+                           "save_name": MLE_directory+"Chi_profiles_basin_"+str(basin_key)+"_"+counter+".png"})
 
-            FigFormat = "png"
-            plt.savefig(newFilename,format=FigFormat,dpi=300)
-            ax.cla()
+    size_format = "default"
+    LSDP.RenderFigureBatch(_ChiProfileTemplate, _DrawChiProfileColouredByElevation, frames,
+                           template_args = (size_format, 12, 1.0, False), n_processes = n_processes)
 
 def MakeChiPlotsMLE(DataDirectory, fname_prefix, basin_list=[0], start_movern=0.2, d_movern=0.1, n_movern=7,
-                    size_format='ESURF', FigFormat='png', animate=False, keep_pngs=False, parallel=False):
+                    size_format='ESURF', FigFormat='png', animate=False, keep_pngs=False, parallel=False, n_processes=None):
     """
     This function makes chi-elevation plots for each basin and each value of m/n
     where the channels are coloured by the MLE value compared to the main stem.
@@ -1033,172 +1188,29 @@ def MakeChiPlotsMLE(DataDirectory, fname_prefix, basin_list=[0], start_movern=0.
         FigFormat (str): The format of the figure. Usually 'png' or 'pdf'. If "show" then it calls the matplotlib show() command.
         animate (bool): If this is true then it creates a movie of the chi-elevation plots coloured by MLE.
         keep_pngs (bool): If this is false and the animation flag is true, then the pngs are deleted and just the video is kept.
+        n_processes (int): The number of processes used to make the plots. Default is the number of CPUs.
 
     Returns:
         Plot of each m/n value for each basin.
 
     Author: FJC
     """
-    from matplotlib.ticker import FormatStrFormatter
-
     # check if a directory exists for the chi plots. If not then make it.
     MLE_directory = DataDirectory+'chi_plots/'
     if not os.path.isdir(MLE_directory):
         os.makedirs(MLE_directory)
 
-    # Set up fonts for plots
-    label_size = 10
-    rcParams['font.family'] = 'sans-serif'
-    rcParams['font.sans-serif'] = ['arial']
-    rcParams['font.size'] = label_size
-
-    # make a figure
-    if size_format == "geomorphology":
-        fig = plt.figure(1, facecolor='white',figsize=(6.25,3.5))
-        #l_pad = -40
-    elif size_format == "big":
-        fig = plt.figure(1, facecolor='white',figsize=(16,9))
-        #l_pad = -50
-    else:
-        fig = plt.figure(1, facecolor='white',figsize=(4.92126,3.2))
-        #l_pad = -35
-
-    gs = plt.GridSpec(100,100,bottom=0.15,left=0.1,right=1.0,top=1.0)
-    ax = fig.add_subplot(gs[10:95,5:80])
-    #colorbar axis
-    ax2 = fig.add_subplot(gs[10:95,82:85])
-
-    # read in the csv files
-    if not parallel:
-        ProfileDF = Helper.ReadChiProfileCSV(DataDirectory, fname_prefix)
-        BasinStatsDF = Helper.ReadBasinStatsCSV(DataDirectory, fname_prefix)
-    else:
-        ProfileDF = Helper.AppendMovernCSV(DataDirectory)
-        BasinStatsDF = Helper.AppendBasinCSVs(DataDirectory)
-
-    # get the number of basins
-    basin_keys = list(BasinStatsDF['basin_key'])
-    basin_keys = [int(x) for x in basin_keys]
-
-    # get the list of basins
-    if basin_list == []:
-        print("You didn't give me a list of basins, so I'll just run the analysis on all of them!")
-        basin_list = basin_keys
-
     # loop through each m over n value
     end_movern = start_movern+d_movern*(n_movern-1)
     m_over_n_values = np.linspace(start_movern,end_movern,n_movern)
 
-    # best fit moverns
-    best_fit_moverns = SimpleMaxMLECheck(BasinStatsDF)
-
-    for m_over_n in m_over_n_values:
-        # read in the full stats file
-        print("This m/n is: "+str(m_over_n))
-        if not parallel:
-            FullStatsDF = Helper.ReadFullStatsCSV(DataDirectory,fname_prefix,m_over_n)
-        else:
-            FullStatsDF = Helper.AppendFullStatsCSVs(DataDirectory,m_over_n)
-
-        # loop through all the basins in the basin list
-        for basin_key in basin_list:
-            print("This basin key is %s") %str(basin_key)
-
-            # mask the data frames for this basin
-            ProfileDF_basin = ProfileDF[ProfileDF['basin_key'] == basin_key]
-            FullStatsDF_basin = FullStatsDF[FullStatsDF['basin_key'] == basin_key]
-
-            #print FullStatsDF_basin
-            print ("Getting the reference_source_key")
-
-            print(FullStatsDF_basin.iloc[0]['reference_source_key'])
-
-            # get the data frame for the main stem
-            ProfileDF_MS = ProfileDF_basin[ProfileDF_basin['source_key'] == FullStatsDF_basin.iloc[0]['reference_source_key']]
-
-            # get the data frame for the tributaries
-            ProfileDF_basin = ProfileDF_basin[ProfileDF_basin['source_key'] != FullStatsDF_basin.iloc[0]['reference_source_key']]
-            # merge with the full data to get the MLE for the tributaries
-            ProfileDF_tribs = ProfileDF_basin.merge(FullStatsDF_basin, left_on = "source_key", right_on = "test_source_key")
-
-            # get the chi and elevation data for the main stem
-            movern_key = 'm_over_n = %s' %(str(m_over_n))
-            MainStemX = list(ProfileDF_MS[movern_key])
-            MainStemElevation = list(ProfileDF_MS['elevation'])
-
-            # get the chi, elevation, and MLE for the tributaries
-            TributariesX = list(ProfileDF_tribs[movern_key])
-            TributariesElevation = list(ProfileDF_tribs['elevation'])
-            TributariesMLE = list(ProfileDF_tribs['MLE'])
-
-            # get the colourmap to colour channels by the MLE value
-            #NUM_COLORS = len(MLE)
-            MLE_array = np.asarray(TributariesMLE)
-            this_cmap = plt.cm.coolwarm
-            cNorm  = colors.Normalize(vmin=np.min(MLE_array), vmax=np.max(MLE_array))
-            plt.cm.ScalarMappable(norm=cNorm, cmap=this_cmap)
-
-            # now plot the data with a colourmap
-            sc = ax.scatter(TributariesX,TributariesElevation,c=TributariesMLE,cmap=this_cmap, norm=cNorm, s=2.5, edgecolors='none')
-            ax.plot(MainStemX,MainStemElevation,lw=2, c='k')
-
-            # some formatting of the figure
-            ax.spines['top'].set_linewidth(1)
-            ax.spines['left'].set_linewidth(1)
-            ax.spines['right'].set_linewidth(1)
-            ax.spines['bottom'].set_linewidth(1)
-
-            # make the lables
-            ax.set_xlabel("$\chi$ (m)")
-            ax.set_ylabel("Elevation (m)")
-
-            # the best fit m/n
-            best_fit_movern = best_fit_moverns[basin_key]
+    frames = _GetChiProfileFrames(DataDirectory, fname_prefix, basin_list, m_over_n_values, colour_column = "MLE", parallel = parallel)
+    for frame in frames:
+        frame["colourbarlabel"] = "$MLE$"
 
-            # label with the basin and m/n
-            title_string = "Basin "+str(basin_key)+", $m/n$ = "+str(m_over_n)
-            if best_fit_movern == m_over_n:
-                ax.text(0.05, 0.95, title_string,
-                        verticalalignment='top', horizontalalignment='left',
-                        transform=ax.transAxes,
-                        color='red', fontsize=10)
-            else:
-                ax.text(0.05, 0.95, title_string,
-                        verticalalignment='top', horizontalalignment='left',
-                        transform=ax.transAxes,
-                        color='black', fontsize=10)
-
-            # add the colorbar
-            colorbarlabel = "$MLE$"
-            cbar = plt.colorbar(sc,cmap=this_cmap,spacing='uniform', orientation='vertical',cax=ax2)
-            cbar.set_label(colorbarlabel, fontsize=10)
-            ax2.set_ylabel(colorbarlabel, fontname='Arial', fontsize=10)
-            ax2.yaxis.set_major_formatter(FormatStrFormatter('%.2f'))
-
-            #save the plot
-            newFilename = MLE_directory+"MLE_profiles"+str(basin_key)+"_"+str(m_over_n)+"."+str(FigFormat)
+    _RenderChiProfileFrames(frames, MLE_directory, "MLE_profiles", size_format, FigFormat, animate, keep_pngs, 1.0, n_processes)
 
-            # This gets all the ticks, and pads them away from the axis so that the corners don't overlap
-            ax.tick_params(axis='both', width=1, pad = 2)
-            for tick in ax.xaxis.get_major_ticks():
-                tick.set_pad(2)
-
-            plt.savefig(newFilename,format=FigFormat,dpi=300)
-            ax.cla()
-            ax2.cla()
-
-    if animate:
-        # animate the pngs using ffmpeg
-        system_call = "ffmpeg -framerate 3 -pattern_type glob -i '"+MLE_directory+"MLE_profiles*.png' -y -vcodec libx264 -s 1230x566 -pix_fmt yuv420p "+MLE_directory+"MLE_profiles.mp4"
-        print system_call
-        subprocess.call(system_call, shell=True)
-        # delete the pngs if you want
-        if not keep_pngs:
-            system_call = "rm "+MLE_directory+"MLE_profiles*.png"
-            subprocess.call(system_call, shell=True)
-    plt.close(fig)
-
-def MakeChiPlotsColouredByK(DataDirectory, fname_prefix, basin_list=[0], start_movern=0.2, d_movern=0.1, n_movern=7,size_format='ESURF', FigFormat='png', animate=False, keep_pngs=False, parallel=False):
+def MakeChiPlotsColouredByK(DataDirectory, fname_prefix, basin_list=[0], start_movern=0.2, d_movern=0.1, n_movern=7,size_format='ESURF', FigFormat='png', animate=False, keep_pngs=False, parallel=False, n_processes=None):
     """
     This function makes chi-elevation plots for each basin and each value of m/n
     where the channels are coloured by the K value (for model runs with spatially varying K).
@@ -1215,193 +1227,30 @@ def MakeChiPlotsColouredByK(DataDirectory, fname_prefix, basin_list=[0], start_m
         FigFormat (str): The format of the figure. Usually 'png' or 'pdf'. If "show" then it calls the matplotlib show() command.
         animate (bool): If this is true then it creates a movie of the chi-elevation plots coloured by MLE.
         keep_pngs (bool): If this is false and the animation flag is true, then the pngs are deleted and just the video is kept.
+        n_processes (int): The number of processes used to make the plots. Default is the number of CPUs.
 
     Returns:
         Plot of each m/n value for each basin.
 
     Author: FJC
     """
-    from LSDPlottingTools import colours
-
     # check if a directory exists for the chi plots. If not then make it.
     K_directory = DataDirectory+'chi_plots_K/'
     if not os.path.isdir(K_directory):
         os.makedirs(K_directory)
 
-    # Set up fonts for plots
-    label_size = 10
-    rcParams['font.family'] = 'sans-serif'
-    rcParams['font.sans-serif'] = ['arial']
-    rcParams['font.size'] = label_size
-
-    # make a figure
-    if size_format == "geomorphology":
-        fig = plt.figure(1, facecolor='white',figsize=(6.25,3.5))
-        #l_pad = -40
-    elif size_format == "big":
-        fig = plt.figure(1, facecolor='white',figsize=(16,9))
-        #l_pad = -50
-    else:
-        fig = plt.figure(1, facecolor='white',figsize=(4.92126,3.2))
-        #l_pad = -35
-
-    gs = plt.GridSpec(100,100,bottom=0.15,left=0.1,right=0.95,top=1.0)
-    ax = fig.add_subplot(gs[10:95,5:80])
-    #colorbar axis
-    ax2 = fig.add_subplot(gs[10:95,82:85])
-
-    # read in the csv files
-    if not parallel:
-        ProfileDF = Helper.ReadChiProfileCSV(DataDirectory, fname_prefix)
-        BasinStatsDF = Helper.ReadBasinStatsCSV(DataDirectory, fname_prefix)
-    else:
-        ProfileDF = Helper.AppendMovernCSV(DataDirectory)
-        BasinStatsDF = Helper.AppendBasinCSVs(DataDirectory)
-
-    # get the number of basins
-    basin_keys = list(BasinStatsDF['basin_key'])
-    basin_keys = [int(x) for x in basin_keys]
-
-    # get the list of basins
-    if basin_list == []:
-        print("You didn't give me a list of basins, so I'll just run the analysis on all of them!")
-        basin_list = basin_keys
-
     # loop through each m over n value
     end_movern = start_movern+d_movern*(n_movern-1)
     m_over_n_values = np.linspace(start_movern,end_movern,n_movern)
 
-    # best fit moverns
-    best_fit_moverns = SimpleMaxMLECheck(BasinStatsDF)
-
-    for m_over_n in m_over_n_values:
-        # read in the full stats file
-        print("This m/n is: "+str(m_over_n))
-        if not parallel:
-            FullStatsDF = Helper.ReadFullStatsCSV(DataDirectory,fname_prefix,m_over_n)
-        else:
-            FullStatsDF = Helper.AppendFullStatsCSVs(DataDirectory,m_over_n)
-
-        # loop through all the basins in the basin list
-        for basin_key in basin_list:
-            print("This basin key is %s") %str(basin_key)
-
-            # mask the data frames for this basin
-            ProfileDF_basin = ProfileDF[ProfileDF['basin_key'] == basin_key]
-            FullStatsDF_basin = FullStatsDF[FullStatsDF['basin_key'] == basin_key]
-
-            #print FullStatsDF_basin
-            print ("Getting the reference_source_key")
-
-            print(FullStatsDF_basin.iloc[0]['reference_source_key'])
-
-            # get the data frame for the main stem
-            ProfileDF_MS = ProfileDF_basin[ProfileDF_basin['source_key'] == FullStatsDF_basin.iloc[0]['reference_source_key']]
-
-            # get the data frame for the tributaries
-            ProfileDF_basin = ProfileDF_basin[ProfileDF_basin['source_key'] != FullStatsDF_basin.iloc[0]['reference_source_key']]
-            # merge with the full data to get the MLE for the tributaries
-            ProfileDF_tribs = ProfileDF_basin.merge(FullStatsDF_basin, left_on = "source_key", right_on = "test_source_key")
-
-            # get the chi and elevation data for the main stem
-            movern_key = 'm_over_n = %s' %(str(m_over_n))
-            MainStemX = list(ProfileDF_MS[movern_key])
-            MainStemElevation = list(ProfileDF_MS['elevation'])
-            MainStemK = list(ProfileDF_MS['K_value'])
-
-            # get the chi, elevation, and MLE for the tributaries
-            TributariesX = list(ProfileDF_tribs[movern_key])
-            TributariesElevation = list(ProfileDF_tribs['elevation'])
-            TributariesK = list(ProfileDF_tribs['K_value'])
-
-            # get the colourmap to colour channels by the MLE value
-            #NUM_COLORS = len(MLE)
-            K_array = np.asarray(TributariesK)
-            min_K = np.min(K_array)
-            max_K = np.max(K_array)
-            this_cmap = plt.cm.Spectral
-            n_colours = 10
-            this_cmap = colours.cmap_discretize(n_colours, this_cmap)
-            cNorm  = colors.Normalize(vmin=min_K, vmax=max_K)
-            plt.cm.ScalarMappable(norm=cNorm, cmap=this_cmap)
+    frames = _GetChiProfileFrames(DataDirectory, fname_prefix, basin_list, m_over_n_values, colour_column = "K_value", parallel = parallel)
+    for frame in frames:
+        frame["colourbarlabel"] = "$K$"
 
-            # now plot the data with a colourmap
-            sc = ax.scatter(TributariesX,TributariesElevation,c=TributariesK,cmap=this_cmap, norm=cNorm, s=2.5, edgecolors='none')
-            sc = ax.scatter(MainStemX, MainStemElevation,c=MainStemK,cmap=this_cmap, norm=cNorm, s=2.5, edgecolors='none')
-
-            # some formatting of the figure
-            ax.spines['top'].set_linewidth(1)
-            ax.spines['left'].set_linewidth(1)
-            ax.spines['right'].set_linewidth(1)
-            ax.spines['bottom'].set_linewidth(1)
-
-            # make the labels
-            ax.set_xlabel("$\chi$ (m)")
-            ax.set_ylabel("Elevation (m)")
-
-            # the best fit m/n
-            best_fit_movern = best_fit_moverns[basin_key]
-            print "BEST FIT M/N IS: "+ str(best_fit_movern)
-            print "THIS M/N IS: "+str(m_over_n)
-
-            # label with the basin and m/n
-            title_string = "Basin "+str(basin_key)+", $m/n$ = "+str(m_over_n)
-            if best_fit_movern == m_over_n:
-                ax.text(0.05, 0.95, title_string,
-                        verticalalignment='top', horizontalalignment='left',
-                        transform=ax.transAxes,
-                        color='red', fontsize=10)
-            else:
-                ax.text(0.05, 0.95, title_string,
-                        verticalalignment='top', horizontalalignment='left',
-                        transform=ax.transAxes,
-                        color='black', fontsize=10)
-
-            # add the colorbar
-            colorbarlabel = "$K$"
-            cbar = plt.colorbar(sc,cmap=this_cmap,spacing='uniform', orientation='vertical',cax=ax2)
-            cbar.set_label(colorbarlabel, fontsize=10)
-            ax2.set_ylabel(colorbarlabel, fontname='Arial', fontsize=10)
-
-            #change labels to scientific notation
-            colours.fix_colourbar_ticks(cbar,n_colours, cbar_type=float, min_value = min_K, max_value = max_K, cbar_label_rotation=0, cbar_orientation='vertical')
-            # we need to get linear values between min and max K
-            these_labels = np.linspace(min_K,max_K,n_colours)
-            # now round these and convert to scientific notation
-            these_labels = [str('{:.2e}'.format(float(x))) for x in these_labels]
-            new_labels = []
-            for label in these_labels:
-                a,b = label.split("e")
-                b = b.replace("0", "")
-                new_labels.append(a+' x 10$^{%s}$' % b)
-
-            ax2.set_yticklabels(new_labels, fontsize=8)
-
-            #save the plot
-            newFilename = K_directory+"Chi_profiles_by_K_"+str(basin_key)+"_"+str(m_over_n)+"."+str(FigFormat)
-
-            # This gets all the ticks, and pads them away from the axis so that the corners don't overlap
-            ax.tick_params(axis='both', width=1, pad = 2)
-            for tick in ax.xaxis.get_major_ticks():
-                tick.set_pad(2)
-
-            plt.savefig(newFilename,format=FigFormat,dpi=300)
-            ax.cla()
-            ax2.cla()
-
-    if animate:
-        # animate the pngs using ffmpeg
-        system_call = "ffmpeg -framerate 3 -pattern_type glob -i '"+K_directory+"Chi_profiles_by_K*.png' -y -vcodec libx264 -s 1230x566 -pix_fmt yuv420p "+K_directory+"Chi_profiles_by_K.mp4"
-        print system_call
-        subprocess.call(system_call, shell=True)
-        # delete the pngs if you want
-        if not keep_pngs:
-            system_call = "rm "+K_directory+"Chi_profiles_by_K*.png"
-            subprocess.call(system_call, shell=True)
-    plt.close(fig)
+    _RenderChiProfileFrames(frames, K_directory, "Chi_profiles_by_K_", size_format, FigFormat, animate, keep_pngs, 0.95, n_processes)
 
 def MakeChiPlotsColouredByLith(DataDirectory, fname_prefix, basin_list=[0], start_movern=0.2, d_movern=0.1, n_movern=7,
-                    size_format='ESURF', FigFormat='png', animate=False, keep_pngs=False, parallel=False):
+                    size_format='ESURF', FigFormat='png', animate=False, keep_pngs=False, parallel=False, n_processes=None):
     """
     This function makes chi-elevation plots for each basin and each value of m/n
     where the channels are coloured by the K value (for model runs with spatially varying K).
@@ -1418,13 +1267,13 @@ def MakeChiPlotsColouredByLith(DataDirectory, fname_prefix, basin_list=[0], star
         FigFormat (str): The format of the figure. Usually 'png' or 'pdf'. If "show" then it calls the matplotlib show() command.
         animate (bool): If this is true then it creates a movie of the chi-elevation plots coloured by MLE.
         keep_pngs (bool): If this is false and the animation flag is true, then the pngs are deleted and just the video is kept.
+        n_processes (int): The number of processes used to make the plots. Default is the number of CPUs.
 
     Returns:
         Plot of each m/n value for each basin.
 
     Author: FJC
     """
-    from LSDPlottingTools import colours
     print("WARNING DEPRECATED FUNCTION, USE THE MakeChiPlotsByLith FROM LSDMapLithoPlotting")
 
     # check if a directory exists for the chi plots. If not then make it.
@@ -1432,179 +1281,15 @@ def MakeChiPlotsColouredByLith(DataDirectory, fname_prefix, basin_list=[0], star
     if not os.path.isdir(K_directory):
         os.makedirs(K_directory)
 
-    # Set up fonts for plots
-    label_size = 10
-    rcParams['font.family'] = 'sans-serif'
-    rcParams['font.sans-serif'] = ['arial']
-    rcParams['font.size'] = label_size
-
-    # make a figure
-    if size_format == "geomorphology":
-        fig = plt.figure(1, facecolor='white',figsize=(6.25,3.5))
-        #l_pad = -40
-    elif size_format == "big":
-        fig = plt.figure(1, facecolor='white',figsize=(16,9))
-        #l_pad = -50
-    else:
-        fig = plt.figure(1, facecolor='white',figsize=(4.92126,3.2))
-        #l_pad = -35
-
-    gs = plt.GridSpec(100,100,bottom=0.15,left=0.1,right=0.95,top=1.0)
-    ax = fig.add_subplot(gs[10:95,5:80])
-    #colorbar axis
-    ax2 = fig.add_subplot(gs[10:95,82:85])
-
-    # read in the csv files
-    if not parallel:
-        ProfileDF = Helper.ReadChiProfileCSV(DataDirectory, fname_prefix)
-        BasinStatsDF = Helper.ReadBasinStatsCSV(DataDirectory, fname_prefix)
-    else:
-        ProfileDF = Helper.AppendMovernCSV(DataDirectory)
-        BasinStatsDF = Helper.AppendBasinCSVs(DataDirectory)
-
-    # get the number of basins
-    basin_keys = list(BasinStatsDF['basin_key'])
-    basin_keys = [int(x) for x in basin_keys]
-
-    # get the list of basins
-    if basin_list == []:
-        print("You didn't give me a list of basins, so I'll just run the analysis on all of them!")
-        basin_list = basin_keys
-
     # loop through each m over n value
     end_movern = start_movern+d_movern*(n_movern-1)
     m_over_n_values = np.linspace(start_movern,end_movern,n_movern)
 
-    # best fit moverns
-    best_fit_moverns = SimpleMaxMLECheck(BasinStatsDF)
-
-    for m_over_n in m_over_n_values:
-        # read in the full stats file
-        print("This m/n is: "+str(m_over_n))
-        if not parallel:
-            FullStatsDF = Helper.ReadFullStatsCSV(DataDirectory,fname_prefix,m_over_n)
-        else:
-            FullStatsDF = Helper.AppendFullStatsCSVs(DataDirectory,m_over_n)
-
-        # loop through all the basins in the basin list
-        for basin_key in basin_list:
-            print("This basin key is %s") %str(basin_key)
+    frames = _GetChiProfileFrames(DataDirectory, fname_prefix, basin_list, m_over_n_values, colour_column = fname_prefix+"_geol", parallel = parallel)
+    for frame in frames:
+        frame["colourbarlabel"] = "$Lith$"
 
-            # mask the data frames for this basin
-            ProfileDF_basin = ProfileDF[ProfileDF['basin_key'] == basin_key]
-            FullStatsDF_basin = FullStatsDF[FullStatsDF['basin_key'] == basin_key]
-
-            #print FullStatsDF_basin
-            print ("Getting the reference_source_key")
-
-            print(FullStatsDF_basin.iloc[0]['reference_source_key'])
-
-            # get the data frame for the main stem
-            ProfileDF_MS = ProfileDF_basin[ProfileDF_basin['source_key'] == FullStatsDF_basin.iloc[0]['reference_source_key']]
-
-            # get the data frame for the tributaries
-            ProfileDF_basin = ProfileDF_basin[ProfileDF_basin['source_key'] != FullStatsDF_basin.iloc[0]['reference_source_key']]
-            # merge with the full data to get the MLE for the tributaries
-            ProfileDF_tribs = ProfileDF_basin.merge(FullStatsDF_basin, left_on = "source_key", right_on = "test_source_key")
-
-            # get the chi and elevation data for the main stem
-            movern_key = 'm_over_n = %s' %(str(m_over_n))
-            MainStemX = list(ProfileDF_MS[movern_key])
-            MainStemElevation = list(ProfileDF_MS['elevation'])
-            MainStemK = list(ProfileDF_MS[fname_prefix+"_geol"])
-
-
-            # get the chi, elevation, and MLE for the tributaries
-            TributariesX = list(ProfileDF_tribs[movern_key])
-            TributariesElevation = list(ProfileDF_tribs['elevation'])
-            TributariesK = list(ProfileDF_tribs[fname_prefix+"_geol"])
-
-
-            # get the colourmap to colour channels by the MLE value
-            #NUM_COLORS = len(MLE)
-            K_array = np.asarray(TributariesK)
-            min_K = np.min(K_array)
-            max_K = np.max(K_array)
-            this_cmap = plt.cm.Spectral
-            n_colours = 10
-            this_cmap = colours.cmap_discretize(n_colours, this_cmap)
-            cNorm  = colors.Normalize(vmin=min_K, vmax=max_K)
-            plt.cm.ScalarMappable(norm=cNorm, cmap=this_cmap)
-
-            # now plot the data with a colourmap
-            sc = ax.scatter(TributariesX,TributariesElevation,c=TributariesK,cmap=this_cmap, norm=cNorm, s=2.5, edgecolors='none')
-            sc = ax.scatter(MainStemX, MainStemElevation,c=MainStemK,cmap=this_cmap, norm=cNorm, s=2.5, edgecolors='none')
-
-            # some formatting of the figure
-            ax.spines['top'].set_linewidth(1)
-            ax.spines['left'].set_linewidth(1)
-            ax.spines['right'].set_linewidth(1)
-            ax.spines['bottom'].set_linewidth(1)
-
-            # make the labels
-            ax.set_xlabel("$\chi$ (m)")
-            ax.set_ylabel("Elevation (m)")
-
-            # the best fit m/n
-            best_fit_movern = best_fit_moverns[basin_key]
-            print "BEST FIT M/N IS: "+ str(best_fit_movern)
-            print "THIS M/N IS: "+str(m_over_n)
-
-            # label with the basin and m/n
-            title_string = "Basin "+str(basin_key)+", $m/n$ = "+str(m_over_n)
-            if best_fit_movern == m_over_n:
-                ax.text(0.05, 0.95, title_string,
-                        verticalalignment='top', horizontalalignment='left',
-                        transform=ax.transAxes,
-                        color='red', fontsize=10)
-            else:
-                ax.text(0.05, 0.95, title_string,
-                        verticalalignment='top', horizontalalignment='left',
-                        transform=ax.transAxes,
-                        color='black', fontsize=10)
-
-            # add the colorbar
-            colorbarlabel = "$Lith$"
-            cbar = plt.colorbar(sc,cmap=this_cmap,spacing='uniform', orientation='vertical',cax=ax2)
-            cbar.set_label(colorbarlabel, fontsize=10)
-            ax2.set_ylabel(colorbarlabel, fontname='Arial', fontsize=10)
-
-            #change labels to scientific notation
-            colours.fix_colourbar_ticks(cbar,n_colours, cbar_type=float, min_value = min_K, max_value = max_K, cbar_label_rotation=0, cbar_orientation='vertical')
-            # we need to get linear values between min and max K
-            these_labels = np.linspace(min_K,max_K,n_colours)
-            # now round these and convert to scientific notation
-            these_labels = [str('{:.2e}'.format(float(x))) for x in these_labels]
-            new_labels = []
-            for label in these_labels:
-                a,b = label.split("e")
-                b = b.replace("0", "")
-                new_labels.append(a+' x 10$^{%s}$' % b)
-
-            ax2.set_yticklabels(new_labels, fontsize=8)
-
-            #save the plot
-            newFilename = K_directory+"Chi_profiles_by_Lith_"+str(basin_key)+"_"+str(m_over_n)+"."+str(FigFormat)
-
-            # This gets all the ticks, and pads them away from the axis so that the corners don't overlap
-            ax.tick_params(axis='both', width=1, pad = 2)
-            for tick in ax.xaxis.get_major_ticks():
-                tick.set_pad(2)
-
-            plt.savefig(newFilename,format=FigFormat,dpi=300)
-            ax.cla()
-            ax2.cla()
-
-    if animate:
-        # animate the pngs using ffmpeg
-        system_call = "ffmpeg -framerate 3 -pattern_type glob -i '"+K_directory+"Chi_profiles_by_Lith*.png' -y -vcodec libx264 -s 1230x566 -pix_fmt yuv420p "+K_directory+"Chi_profiles_by_Lith.mp4"
-        print system_call
-        subprocess.call(system_call, shell=True)
-        # delete the pngs if you want
-        if not keep_pngs:
-            system_call = "rm "+K_directory+"Chi_profiles_by_Lith*.png"
-            subprocess.call(system_call, shell=True)
-    plt.close(fig)
+    _RenderChiProfileFrames(frames, K_directory, "Chi_profiles_by_Lith_", size_format, FigFormat, animate, keep_pngs, 0.95, n_processes)
 
 
 def PlotProfilesRemovingOutliers(DataDirectory, fname_prefix, basin_list=[0], start_movern=0.2, d_movern=0.1, n_movern=7, size_format = "geomorphology", FigFormat="png", parallel=False):
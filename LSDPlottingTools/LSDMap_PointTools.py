@@ -16,6 +16,41 @@ import glob
 import pandas
 import numpy as np
 from pyproj import Proj, transform
+try:
+    from pyproj import Transformer
+except ImportError:
+    # older versions of pyproj don't have Transformer, we fall back to transform
+    Transformer = None
+
+
+# Setting up projections is slow, so the transformers are kept here keyed on
+# the pair of EPSG strings and reused.
+_CoordinateTransformers = {}
+
+#==============================================================================
+def GetCoordinateTransformer(in_EPSG_string, out_EPSG_string):
+    """This gets a function that converts coordinates between two coordinate systems.
+    It is only set up the first time you ask for a pair of coordinate systems.
+
+    Args:
+        in_EPSG_string (str): The EPSG string of the coordinates you have, e.g. 'epsg:4326' for WGS84 latitude and longitude
+        out_EPSG_string (str): The EPSG string of the coordinates you want, e.g. 'epsg:32633'
+
+    Returns:
+        function: f(x,y) that takes arrays of x (easting or longitude) and y (northing or latitude) and returns the transformed x and y arrays
+    """
+    key = (in_EPSG_string.lower(), out_EPSG_string.lower())
+    if key not in _CoordinateTransformers:
+        if Transformer is not None:
+            # always_xy keeps the longitude, latitude order of the old transform function
+            this_transformer = Transformer.from_crs(key[0], key[1], always_xy=True)
+            _CoordinateTransformers[key] = this_transformer.transform
+        else:
+            inProj = Proj(init=key[0])
+            outProj = Proj(init=key[1])
+            _CoordinateTransformers[key] = lambda x, y: transform(inProj, outProj, x, y)
+    return _CoordinateTransformers[key]
+#==============================================================================
 
 
 #==============================================================================
@@ -94,8 +129,13 @@ class LSDMap_PointData(object):
 
         The object can convert to UTM, and it also can print data to other file formats like GeoJSON and shapefiles.
 
+        The data are always held in a pandas dataframe (one numpy array per column), whatever PANDEX is set to,
+        so selecting and thinning the data are vectorised.
+
         Args:
             Filename (str): The name of the csv file (with path and extension) that contains the point data. It should have columns labelled "latitude" and "longitude".
+            data_type (str): "csv" if FileName is a file, or "pandas" if FileName is a dataframe.
+            PANDEX (bool): Kept so older scripts still work. The data are stored the same way either way.
 
         Author: SMM
         """
@@ -108,160 +148,65 @@ class LSDMap_PointData(object):
 
         self.PANDEX = PANDEX
 
-        ######################### THIS PART OF THE CODE IS ONLY USING PANDAS #########################
-        if(self.PANDEX == True):
-            print("Warning, you are using an experimental version of LSDMT that is implementing Pandas dataframe to improve the performance. It is still unstable, switch PANDEX to False in your PointData parameters to use the regular way")
-            print("Loading your file from " + data_type)
-            if(data_type == "csv"):
-                data = pandas.read_csv(FileName, sep=",")
-            else:
-                if(data_type == "pandas"):
-                    data = FileName
-            #Extracting the headers
-            self.VariableList = list(data.columns.values)
-            self.PointData = data
-            self.DataTypes = data.dtypes
-            # now make sure the data has latitude and longitude entries
-            if "latitude" not in self.VariableList:
-                print("Something has gone wrong, latitude is not in the variable list")
-                print("Here is the variable list: ")
-                print(self.VariableList)
-            else:
-               self.Latitude = self.PointData["latitude"].values
-            if "longitude" not in self.VariableList:
-                print("Something has gone wrong, longitude is not in the variable list")
-                print("Here is the variable list: ")
-                print(self.VariableList)
+        print("Loading your file from " + data_type)
+        if(data_type == "pandas"):
+            data = FileName
+        elif os.access(FileName,os.F_OK):
+            data = pandas.read_csv(FileName, sep=",")
+        else:
+            print("Uh oh I could not open that file")
+            data = pandas.DataFrame()
+
+        self._SetPointData(data)
+        print("done")
+
+    def _SetPointData(self,data):
+        """This sets the dataframe holding the points and updates the variable list,
+        types and the latitude and longitude arrays. The latitude and longitude are
+        views on the dataframe columns, not copies.
+
+        Args:
+            data (pandas.DataFrame): the point data
+        """
+        self.PointData = data.reset_index(drop=True)
+        self.VariableList = list(self.PointData.columns.values)
+
+        # Projected coordinates, keyed on the EPSG string and the latitude and longitude columns.
+        # They are thrown away whenever the data change.
+        self._ProjectedCoordinates = {}
+
+        # The python type of each column, used when writing shapefiles and GeoJSON
+        self.DataTypes = []
+        for name in self.VariableList:
+            kind = self.PointData[name].dtype.kind
+            if kind in "iub":
+                self.DataTypes.append(int)
+            elif kind == "f":
+                self.DataTypes.append(float)
             else:
-               self.Longitude = self.PointData["longitude"].values
-            print("done")
+                self.DataTypes.append(str)
 
-        ######################## THIS THE END OF THE PANDEX TEST #######################################
+        # now make sure the data has latitude and longitude entries
+        if "latitude" not in self.VariableList:
+            print("Something has gone wrong, latitude is not in the variable list")
+            print("Here is the variable list: ")
+            print(self.VariableList)
         else:
-            #See if the parameter files exist
-            native_way = False # Switch to TRUE if pandasif creating bugs
-            if (data_type == "pandas"):
-                FileNameCheck = "ok"
-            else:
-                FileNameCheck = FileName
-            if (os.access(FileNameCheck,os.F_OK) or FileNameCheck == "ok"):
-                if(native_way):
-                    this_file = open(FileName, 'r')
-                    lines = this_file.readlines()
-
-                    # get rid of the control characters
-                    this_line = LSDOst.RemoveEscapeCharacters(lines[0])
-
-                    # Now get a list with the names of the parameters
-                    self.VariableList = []
-
-                    TestList = this_line.split(',')
-
-                    for name in TestList:
-                        this_name = LSDOst.RemoveEscapeCharacters(name)
-                        self.VariableList.append(this_name.lower())
-
-
-                    print("Variable list is: ")
-                    print(self.VariableList)
-
-                    # get rid of the names
-                    del lines[0]
-
-                    # now you need to make a dict that contains a list for each varaible name
-                    DataDict = {}
-                    TypeList = []
-                    for name in self.VariableList:
-                        DataDict[name] = []
-
-                    # now get the data into the dict
-                    #firstline = True
-                    for line in lines:
-                        this_line = LSDOst.RemoveEscapeCharacters(line)
-                        split_line = this_line.split(',')
-
-                        for index,name in enumerate(self.VariableList):
-                            this_var = LSDOst.RemoveEscapeCharacters(split_line[index])
-                            #this_variable = LSDOst.ParseStringToType(this_var)
-                            DataDict[name].append(this_var)
-
-                    # now go back and get the correct type
-                    DataDictTyped = {}
-                    for name in self.VariableList:
-                        this_list = DataDict[name]
-                        typed_list = LSDOst.ParseListToType(this_list)
-                        DataDictTyped[name] = typed_list
-
-                        TypeList.append(type(typed_list[0]))
-
-                    self.PointData = DataDictTyped
-                    self.DataTypes = TypeList
-                    print(self.PointData)
-                    print(self.DataTypes)
-                else:
-                    print("I am loading data using pandas, I haven't been widely tested yet, you can switch to the old way if you have troubles by looking for native_way in LSDMap_PointData")
-                    #Loading the file
-                    print("Loading")
-                    if(data_type == "csv"):
-                        data = pandas.read_csv(FileName, sep=",")
-                    else:
-                        if(data_type == "pandas"):
-                            data = FileName
-                    print("Loaded")
-                    #Extracting the headers
-                    self.VariableList = list(data.columns.values)
-                    #Correcting the names
-                    for names in self.VariableList:
-                        names =  LSDOst.RemoveEscapeCharacters(names).lower()
-
-                    print("Your Variable list is : ")
-                    print(self.VariableList)
-                    #ingesting data values
-                    dataPoints = np.array(data.values)
-                    DataDict = {}
-                    #Feeding the dictionnary[header][table of values]
-                    print("I am ingesting the data")
-                    for i in range(len(self.VariableList)):
-                        DataDict[self.VariableList[i]] = dataPoints[:,i]
-                    #dealing with the types
-                    DataDictTyped = {}
-                    TypeList = []
-                    for name in self.VariableList:
-                        this_list = DataDict[name]
-                        typed_list = LSDOst.ParseListToType(this_list)
-                        DataDictTyped[name] = typed_list
-
-                        TypeList.append(type(typed_list[0]))
-
-                    self.PointData = DataDict
-                    self.DataTypes = TypeList
-                    #print(self.PointData)
-                    print("The points data are successfully loaded")
-                    print("DEBUG, pointdata:")
-                    print(self.PointData)
-                    print("DEBUG, DataTypes:")
-                    print(self.DataTypes)
+           self.Latitude = self.PointData["latitude"].values
+        if "longitude" not in self.VariableList:
+            print("Something has gone wrong, longitude is not in the variable list")
+            print("Here is the variable list: ")
+            print(self.VariableList)
+        else:
+           self.Longitude = self.PointData["longitude"].values
 
+    def _KeepRows(self,keep):
+        """This keeps the rows of the point data where keep is true and throws away the rest.
 
-            else:
-                print("Uh oh I could not open that file")
-                self.VariableList = []
-                self.DataTypes = []
-                self.PointData = {}
-
-            # now make sure the data has latitude and longitude entries
-            if "latitude" not in self.VariableList:
-                print("Something has gone wrong, latitude is not in the variable list")
-                print("Here is the variable list: ")
-                print(self.VariableList)
-            else:
-               self.Latitude = self.PointData["latitude"]
-            if "longitude" not in self.VariableList:
-                print("Something has gone wrong, longitude is not in the variable list")
-                print("Here is the variable list: ")
-                print(self.VariableList)
-            else:
-               self.Longitude = self.PointData["longitude"]
+        Args:
+            keep (np.array or pandas.Series): A boolean mask with one element per point
+        """
+        self._SetPointData(self.PointData[np.asarray(keep, dtype=bool)])
 
 
 ##==============================================================================
@@ -352,10 +297,10 @@ class LSDMap_PointData(object):
         Args:
             PrintToScreen (bool): If true, prints to screen.
             data_name (str): The header of the column you want
-            PANDEX (bool): set to true if you got your point data in pandex mode.
+            PANDEX (bool): Ignored. Kept so older scripts still work.
 
         Return:
-            float: A list of the data
+            np.array: The data. This is a view on the column, not a copy, so don't change it in place.
 
         Author: SMM
         """
@@ -364,91 +309,56 @@ class LSDMap_PointData(object):
             empty_list = []
             return empty_list
         else:
-            if PANDEX == False:
-                if PrintToScreen:
-                    print("The " + data_name + "data is: ")
-                    print(self.PointData[data_name])
-                return self.PointData[data_name]
-            else:
-                # get data from the DF to a list
-                if PrintToScreen:
-                    print("The " + data_name + "data is: ")
-                    print(self.PointData[data_name].tolist())
-                this_list = self.PointData[data_name].tolist()
-                return this_list
+            this_data = self.PointData[data_name].values
+            if PrintToScreen:
+                print("The " + data_name + "data is: ")
+                print(this_data)
+            return this_data
 
     def GetUTMEastingNorthing(self,EPSG_string):
-        """Returns two lists: the latitude and longitude converted to northing and easting.
+        """Returns two arrays: the latitude and longitude converted to northing and easting.
+        The conversion is done once for all the points, and remembered, so asking again
+        (e.g. for several layers from the same channel network) costs nothing.
 
         Args:
-            PrintToScreen (bool): If true, prints to screen.
             EPSG_string (str): The EPSG code of the UTM coordinates you want (326XX) with zone XX is for north, 327XX is for south.
 
         Return:
-            float: Two lists containing easting and northing
+            float: Two arrays containing easting and northing. They are copies of the cached projection, so you can change them.
 
         Author: SMM
         """
-        print("Yo, getting this stuff: "+EPSG_string)
-        # The lat long are in epsg 4326 which is WGS84
-        inProj = Proj(init='epsg:4326')
-        outProj = Proj(init=EPSG_string)
-        this_Lat = self.Latitude[0]
-        this_Lon = self.Longitude[0]
-
-        print("Lat-long: ")
-        print(this_Lat)
-        print(this_Lon)
-
-        easting =[]
-        northing = []
-        if(self.PANDEX == True):
-            easting,northing = transform(inProj,outProj,self.Longitude,self.Latitude)
-        else:
-            for idx, Lon in enumerate(self.Longitude):
-                Lat = self.Latitude[idx]
-                ea,no = transform(inProj,outProj,Lon,Lat)
-                easting.append(ea)
-                northing.append(no)
-
-        return easting,northing
+        return self.GetUTMEastingNorthingFromQuery(EPSG_string,"latitude","longitude")
 
     def GetUTMEastingNorthingFromQuery(self,EPSG_string,Latitude_string,Longitude_string):
-        """Returns two lists: the latitude and longitude converted to northing and easting. But you can define the columns if there are more than one latitude and longitude columns.
+        """Returns two arrays: the latitude and longitude converted to northing and easting. But you can define the columns if there are more than one latitude and longitude columns.
 
         Note:
             This is used mainly if there are multple lat-long coordinates in the csv file. For example when you have basin centroids and basin outlets in the same file.
         Args:
-            PrintToScreen (bool): If true, prints to screen.
             EPSG_string (str): The EPSG code of the UTM coordinates you want (326XX) with zone XX is for north, 327XX is for south.
             Latitude_string (str): The name of the latitude column you want
             Longitude_string (str): The name of the longitude column you want.
 
         Return:
-            float: Two lists containing easting and northing
+            float: Two arrays containing easting and northing. Don't change them in place.
 
         Author: SMM
         """
-        print("Yo, getting this stuff: "+EPSG_string)
-        # The lat long are in epsg 4326 which is WGS84
-        inProj = Proj(init='epsg:4326')
-        outProj = Proj(init=EPSG_string)
-
-
-        this_Lat = self.QueryData(Latitude_string)
-        this_Lon = self.QueryData(Longitude_string)
+        key = (EPSG_string.lower(),Latitude_string,Longitude_string)
+        if key not in self._ProjectedCoordinates:
+            print("Yo, getting this stuff: "+EPSG_string)
 
+            # The lat long are in epsg 4326 which is WGS84
+            this_transform = GetCoordinateTransformer('epsg:4326',EPSG_string)
+            this_Lat = np.asarray(self.QueryData(Latitude_string), dtype=float)
+            this_Lon = np.asarray(self.QueryData(Longitude_string), dtype=float)
 
-        easting =[]
-        northing = []
+            easting,northing = this_transform(this_Lon,this_Lat)
+            self._ProjectedCoordinates[key] = (np.asarray(easting),np.asarray(northing))
 
-        for idx, Lon in enumerate(this_Lon):
-            Lat = this_Lat[idx]
-            ea,no = transform(inProj,outProj,Lon,Lat)
-            easting.append(ea)
-            northing.append(no)
-
-        return easting,northing
+        easting,northing = self._ProjectedCoordinates[key]
+        return easting.copy(),northing.copy()
 
 
 
@@ -476,42 +386,8 @@ class LSDMap_PointData(object):
         if data_name not in self.VariableList:
             print("The data " + data_name + " is not one of the data elements in this point data")
         else:
-            if(self.PANDEX == False):
-                this_data = self.PointData[data_name]
-
-        if(self.PANDEX):
-            self.PointData = self.PointData[self.PointData[data_name]<Threshold_value]
-            self.Longitude = self.PointData["longitude"]
-            self.Latitude = self.PointData["latitude"]
-        else:
-            this_data = [float(x) for x in this_data]
-
-
-            # Start a new data dict
-            NewDataDict = {}
-            NewLat = []
-            NewLon = []
-            for name in self.VariableList:
-                NewDataDict[name] = []
-
-
-            # Get all the data to be delelted
-            delete_indices = []
-            for index, data in enumerate(this_data):
-                if data<Threshold_value:
-                    delete_indices.append(index)
-                else:
-                    NewLat.append(self.Latitude[index])
-                    NewLon.append(self.Longitude[index])
-                    for name in self.VariableList:
-                        this_element = self.PointData[name][index]
-                        NewDataDict[name].append(this_element)
-
-
-            # Now reset the data dict
-            self.PointData = NewDataDict
-            self.Latitude = NewLat
-            self.Longitude = NewLon
+            this_data = self.PointData[data_name].values.astype(float)
+            self._KeepRows(this_data >= Threshold_value)
 
 
 ##==============================================================================
@@ -540,51 +416,10 @@ class LSDMap_PointData(object):
         if data_name not in self.VariableList:
             print("The data " + data_name + " is not one of the data elements in this point data")
         else:
-            if(self.PANDEX == False):
-                this_data = self.PointData[data_name]
-        if(self.PANDEX):
-            self.PointData = self.PointData[self.PointData[data_name].isin(data_for_selection_list)]
-            self.Longitude = self.PointData["longitude"]
-            self.Latitude = self.PointData["latitude"]
-        else:
-            this_data = [int(x) for x in this_data]
-            #print("The original data I need to thin is: ")
-            #print(this_data)
-
-
-            # Start a new data dict
-            NewDataDict = {}
-            NewLat = []
-            NewLon = []
-            for name in self.VariableList:
-                NewDataDict[name] = []
-
-
-            # Get all the data to be deleted
             print("The data I am keeping is: ")
             print(data_for_selection_list)
-            delete_indices = []
-            for index, data in enumerate(this_data):
-                #print("Data: "+str(data))
-                if data not in data_for_selection_list:
-                    #print("I'm not keeping it")
-                    delete_indices.append(index)
-                else:
-                    #print("I'll have that one. ")
-                    NewLat.append(self.Latitude[index])
-                    NewLon.append(self.Longitude[index])
-                    for name in self.VariableList:
-                        this_element = self.PointData[name][index]
-                        NewDataDict[name].append(this_element)
-
-
-            # Now reset the data dict
-            self.PointData = NewDataDict
-            self.Latitude = NewLat
-            self.Longitude = NewLon
-
-        #print("The updated data is:")
-        #print(self.PointData[data_name])
+            self._KeepRows(self.PointData[data_name].isin(data_for_selection_list))
+
 ##==============================================================================
 ##==============================================================================
 ## Data manipulation
@@ -592,7 +427,7 @@ class LSDMap_PointData(object):
 ##==============================================================================
     def selectValue(self,data_name,value = 0, operator = "=="):
         """
-        This function masks the dataset to one or several specific value for a column. Only work for PANDEX mode.
+        This function masks the dataset to one or several specific value for a column.
 
         Args:
             data_name (str): The name of the data member to select
@@ -614,34 +449,26 @@ class LSDMap_PointData(object):
         if data_name not in self.VariableList:
             print("The data " + data_name + " is not one of the data elements in this point data")
         else:
-            if(self.PANDEX == False):
-                print("You need to be in PANDEX mode to sort this data as I am trying to get everyone use it, sorry not sorry. To do so, add PANDEX = True when loading the data.")
-        if(self.PANDEX):
+            this_data = self.PointData[data_name]
             if(operator == "=="):
                 if(isinstance(value,list) == False):
                     value = [value]
-                self.PointData = self.PointData[self.PointData[data_name].isin(value)]
+                self._KeepRows(this_data.isin(value))
+            elif(operator ==">" and isinstance(value,list)==False):
+                self._KeepRows(this_data > value)
+            elif(operator =="<" and isinstance(value,list)==False):
+                self._KeepRows(this_data < value)
+            elif(operator == "!="):
+                if(isinstance(value,list) == False):
+                    value = [value]
+                self._KeepRows(~this_data.isin(value))
             else:
-                if(operator ==">" and isinstance(value,list)==False):
-                    self.PointData = self.PointData[self.PointData[data_name]>value]
-                else:
-                    if(operator =="<" and isinstance(value,list)==False):
-                        self.PointData = self.PointData[self.PointData[data_name]<value]
-                    else:
-                        if(operator == "!="):
-                            if(isinstance(value,list) == False):
-                                value = [value]
-                            self.PointData = self.PointData[~self.PointData[data_name].isin(value)]
-                        else:
-                            print("Something wrong happened, are you trying to select your data using < or > with a list rather than a single value??? in this case I cannot do it yet I am so sorry.")
-            self.Longitude = self.PointData["longitude"]
-            self.Latitude = self.PointData["latitude"]
+                print("Something wrong happened, are you trying to select your data using < or > with a list rather than a single value??? in this case I cannot do it yet I am so sorry.")
 
 
     def ThinDataFromKey(self,data_name,data_key):
         """This function takes a key for a value and retains the members in data name corresponding to that selection.
         Similar to ThinDataSelection but just takes one key rather than a list.
-        Not compatible with PANDEX
 
         Args:
             data_name (str): The name of the data member to select
@@ -659,43 +486,8 @@ class LSDMap_PointData(object):
         if data_name not in self.VariableList:
             print("The data " + data_name + " is not one of the data elements in this point data")
         else:
-            this_data = self.PointData[data_name]
-
-        this_data = [int(x) for x in this_data]
-        #print("The original data I need to thin is: ")
-        #print(this_data)
-
-
-        # Start a new data dict
-        NewDataDict = {}
-        NewLat = []
-        NewLon = []
-        for name in self.VariableList:
-            NewDataDict[name] = []
-
-
-        # Get all the data to be deleted
-        print("The data I am keeping is: ")
-        print(data_key)
-        delete_indices = []
-        for index, data in enumerate(this_data):
-            #print("Data: "+str(data))
-            if data != data_key:
-                #print("I'm not keeping it")
-                delete_indices.append(index)
-            else:
-                #print("I'll have that one. ")
-                NewLat.append(self.Latitude[index])
-                NewLon.append(self.Longitude[index])
-                for name in self.VariableList:
-                    this_element = self.PointData[name][index]
-                    NewDataDict[name].append(this_element)
-
-
-        # Now reset the data dict
-        self.PointData = NewDataDict
-        self.Latitude = NewLat
-        self.Longitude = NewLon
+            this_data = self.PointData[data_name].values.astype(int)
+            self._KeepRows(this_data == data_key)
 
 
 
@@ -764,6 +556,11 @@ class LSDMap_PointData(object):
             else:
                 layer.CreateField(ogr.FieldDefn(name, ogr.OFTReal))
 
+        # ogr wants python types rather than numpy types
+        columns = {}
+        for name in self.VariableList:
+            columns[name] = self.PointData[name].tolist()
+
         # Process the text file and add the attributes and features to the shapefile
         for index,lat in enumerate(self.Latitude):
 
@@ -771,7 +568,7 @@ class LSDMap_PointData(object):
             feature = ogr.Feature(layer.GetLayerDefn())
 
             for name in self.VariableList:
-                feature.SetField(name, self.PointData[name][index])
+                feature.SetField(name, columns[name][index])
 
             # create the WKT for the feature using Python string formatting
             wkt = "POINT(%f %f)" %  (float(self.Longitude[index]), float(self.Latitude[index]))
@@ -853,6 +650,11 @@ class LSDMap_PointData(object):
             else:
                 layer.CreateField(ogr.FieldDefn(name, ogr.OFTReal))
 
+        # ogr wants python types rather than numpy types
+        columns = {}
+        for name in self.VariableList:
+            columns[name] = self.PointData[name].tolist()
+
         # Process the text file and add the attributes and features to the shapefile
         for index,lat in enumerate(self.Latitude):
 
@@ -860,7 +662,7 @@ class LSDMap_PointData(object):
             feature = ogr.Feature(layer.GetLayerDefn())
 
             for name in self.VariableList:
-                feature.SetField(name, self.PointData[name][index])
+                feature.SetField(name, columns[name][index])
 
             # create the WKT for the feature using Python string formatting
             wkt = "POINT(%f %f)" %  (float(self.Longitude[index]), float(self.Latitude[index]))
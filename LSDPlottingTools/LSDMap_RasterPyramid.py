@@ -0,0 +1,303 @@
+## LSDMap_RasterPyramid.py
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+## These functions build and read reduced resolution copies (overviews) of
+## rasters so that figures only ever plot about as many pixels as they can show.
+## Each level halves the resolution of the one before. Continuous data are
+## averaged (ignoring nodata) and categorical data (e.g. basins, lithology)
+## take the most common value. The levels are saved as .npy files next to
+## the raster so they are only built once.
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import numpy as np
+import os
+from os.path import exists
+from . import LSDMap_GDALIO as LSDMap_IO
+
+#==============================================================================
+def IsCategoricalRaster(raster_file):
+    """This checks if a raster holds categories (integers) rather than continuous data.
+
+    Args:
+        raster_file (str): The filename (with path and extension) of the raster.
+
+    Returns:
+        bool: True if the data type on disk is an integer type
+    """
+    DataType = LSDMap_IO.GetRasterMetadata(raster_file)["DataType"]
+    return DataType in ["Byte","Int8","Int16","UInt16","Int32","UInt32","Int64","UInt64"]
+#==============================================================================
+
+#==============================================================================
+def DownsampleByTwo(data_array, categorical = False):
+    """This halves the resolution of an array. Each new pixel comes from a 2x2 block
+    of old pixels. NaN is treated as nodata and is ignored unless the whole block is nodata.
+
+    Args:
+        data_array (np.array): A float array with NaN as nodata.
+        categorical (bool): If true the new pixel is the most common value in the block, otherwise it is the mean.
+
+    Returns:
+        np.array: The downsampled array, with ceil(rows/2) rows and ceil(cols/2) cols
+    """
+    n_rows, n_cols = data_array.shape
+
+    # pad with nodata so there is an even number of rows and columns
+    if n_rows % 2 or n_cols % 2:
+        padded = np.empty((n_rows+n_rows%2, n_cols+n_cols%2), dtype = data_array.dtype)
+        padded.fill(np.nan)
+        padded[:n_rows,:n_cols] = data_array
+        data_array = padded
+
+    new_rows = data_array.shape[0]//2
+    new_cols = data_array.shape[1]//2
+    blocks = data_array.reshape(new_rows,2,new_cols,2).swapaxes(1,2).reshape(new_rows,new_cols,4)
+    valid = np.isfinite(blocks)
+
+    if not categorical:
+        n_valid = valid.sum(axis=2)
+        total = np.where(valid, blocks, 0).sum(axis=2)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            downsampled = total/n_valid
+        downsampled[n_valid == 0] = np.nan
+        return downsampled.astype(data_array.dtype)
+    else:
+        # count how many times each of the four values turns up in its block.
+        # NaN never equals anything so nodata gets a count of zero, then -1 so
+        # it only wins if the whole block is nodata.
+        counts = (blocks[:,:,:,np.newaxis] == blocks[:,:,np.newaxis,:]).sum(axis=3)
+        counts[~valid] = -1
+        most_common = counts.argmax(axis=2).ravel()
+        flat_blocks = blocks.reshape(-1,4)
+        return flat_blocks[np.arange(flat_blocks.shape[0]),most_common].reshape(new_rows,new_cols)
+#==============================================================================
+
+#==============================================================================
+def GetPyramidFileName(raster_file, factor, categorical = False):
+    """This gets the name of the .npy file holding one level of the pyramid.
+
+    Args:
+        raster_file (str): The filename (with path and extension) of the raster.
+        factor (int): The reduction factor of the level (2, 4, 8...)
+        categorical (bool): If the level was built with the mode rather than the mean
+
+    Returns:
+        str: the filename of the level
+    """
+    if categorical:
+        method = "mode"
+    else:
+        method = "mean"
+    return raster_file+".ovr"+str(factor)+"."+method+".npy"
+#==============================================================================
+
+#==============================================================================
+def _PyramidLevelIsCurrent(raster_file, level_file):
+    """Checks that a level exists and is newer than the raster and its header.
+    """
+    if not exists(level_file):
+        return False
+    level_time = os.path.getmtime(level_file)
+    if level_time < os.path.getmtime(raster_file):
+        return False
+    header_name = raster_file[:raster_file.rfind('.')]+".hdr"
+    if exists(header_name) and level_time < os.path.getmtime(header_name):
+        return False
+    return True
+#==============================================================================
+
+#==============================================================================
+def _BuildPyramidLevel(read_rows, n_rows, n_cols, categorical, level_file, strip_rows):
+    """Builds one level of the pyramid from the level below, a strip of rows at a time,
+    and writes it to level_file. The level below is never held in memory all at once.
+
+    Args:
+        read_rows (function): read_rows(first_row, n_rows) returns those rows of the level below as a float array with NaN nodata
+        n_rows (int): number of rows of the level below
+        n_cols (int): number of columns of the level below
+        categorical (bool): mode if true, mean if false
+        level_file (str): where to save the level
+        strip_rows (int): the number of rows read at a time. Must be even.
+
+    Returns:
+        np.array: the new level, memory mapped from level_file
+    """
+    if categorical:
+        level_dtype = np.dtype('float64')
+    else:
+        level_dtype = np.dtype('float32')
+
+    # write to a temporary file and then move it so other processes never see half a level
+    temp_file = level_file+".tmp"+str(os.getpid())+".npy"
+    level = np.lib.format.open_memmap(temp_file, mode = 'w+', dtype = level_dtype,
+                                      shape = ((n_rows+1)//2,(n_cols+1)//2))
+    for first_row in range(0, n_rows, strip_rows):
+        this_n_rows = min(strip_rows, n_rows-first_row)
+        strip = np.asarray(read_rows(first_row, this_n_rows), dtype = level_dtype)
+        level[first_row//2:first_row//2+(this_n_rows+1)//2,:] = DownsampleByTwo(strip, categorical)
+    level.flush()
+    del level
+
+    if exists(level_file):
+        os.remove(level_file)
+    os.rename(temp_file, level_file)
+    return np.load(level_file, mmap_mode = 'r')
+#==============================================================================
+
+#==============================================================================
+def BuildRasterPyramid(raster_file, categorical = None, min_cols = 256, strip_rows = 256):
+    """This builds all the levels of the pyramid for a raster and saves them next to it.
+    Each level has half the resolution of the one before; it stops when the levels
+    get narrower than min_cols. The raster is read a strip at a time so this works
+    on rasters too big for memory.
+
+    Args:
+        raster_file (str): The filename (with path and extension) of the raster.
+        categorical (bool): If true, use the mode of each block rather than the mean. If None, integer rasters are treated as categorical.
+        min_cols (int): The smallest level (in columns) that is built
+        strip_rows (int): The number of rows processed at a time
+
+    Returns:
+        list: the factors of the levels that were built
+    """
+    if categorical is None:
+        categorical = IsCategoricalRaster(raster_file)
+    if categorical:
+        read_dtype = "float64"
+    else:
+        read_dtype = "float32"
+    strip_rows = max(2*(int(strip_rows)//2),2)
+
+    metadata = LSDMap_IO.GetRasterMetadata(raster_file)
+    n_rows = metadata["ysize"]
+    n_cols = metadata["xsize"]
+
+    print("I am building the overview pyramid for "+raster_file)
+    def read_raster_rows(first_row, this_n_rows):
+        return LSDMap_IO.ReadRasterWindow(raster_file, window = [0,first_row,n_cols,this_n_rows],
+                                          dtype = read_dtype)
+    read_rows = read_raster_rows
+
+    factors = []
+    factor = 1
+    while (n_cols+1)//2 >= min_cols or factor == 1:
+        factor = factor*2
+        level_file = GetPyramidFileName(raster_file, factor, categorical)
+        level = _BuildPyramidLevel(read_rows, n_rows, n_cols, categorical, level_file, strip_rows)
+        factors.append(factor)
+        n_rows, n_cols = level.shape
+        read_rows = lambda first_row, this_n_rows, level=level: level[first_row:first_row+this_n_rows,:]
+        if n_rows < 2 or n_cols < 2:
+            break
+    print("I built levels with factors: "+str(factors))
+
+    return factors
+#==============================================================================
+
+#==============================================================================
+def ChoosePyramidFactor(n_cols, target_cols):
+    """This picks the coarsest pyramid level that still has at least target_cols columns.
+
+    Args:
+        n_cols (int): The number of columns at full resolution
+        target_cols (int): The number of columns needed, e.g. figure width in inches times the dpi
+
+    Returns:
+        int: the reduction factor. 1 means use the full resolution raster.
+    """
+    factor = 1
+    if target_cols is None or target_cols <= 0:
+        return factor
+    while -(-n_cols//(factor*2)) >= target_cols:
+        factor = factor*2
+    return factor
+#==============================================================================
+
+#==============================================================================
+def GetPyramidLevel(raster_file, factor, categorical = None):
+    """This gets one level of the pyramid, building the pyramid if it doesn't exist
+    or is older than the raster.
+
+    Args:
+        raster_file (str): The filename (with path and extension) of the raster.
+        factor (int): The reduction factor (a power of 2)
+        categorical (bool): mode if true, mean if false. If None, integer rasters are treated as categorical.
+
+    Returns:
+        np.array: the level, memory mapped read only, with NaN as nodata
+    """
+    if categorical is None:
+        categorical = IsCategoricalRaster(raster_file)
+
+    level_file = GetPyramidFileName(raster_file, factor, categorical)
+    if not _PyramidLevelIsCurrent(raster_file, level_file):
+        # make sure the pyramid goes down at least as far as this level
+        n_cols = LSDMap_IO.GetRasterMetadata(raster_file)["xsize"]
+        BuildRasterPyramid(raster_file, categorical, min_cols = min(256,-(-n_cols//factor)))
+        if not exists(level_file):
+            raise Exception("I could not build pyramid level "+str(factor)+" for "+raster_file)
+
+    return np.load(level_file, mmap_mode = 'r')
+#==============================================================================
+
+#==============================================================================
+class PyramidRaster(LSDMap_IO.LazyRaster):
+    """
+    A LazyRaster that reads from a level of the overview pyramid rather than the full
+    resolution raster. The window and extent are those of the pyramid pixels that
+    cover the requested area.
+
+    Args:
+        raster_file (str): The filename (with path and extension) of the raster.
+        factor (int): The reduction factor of the level (a power of 2)
+        window (list): The pixel window, in full resolution pixels, as [x_offset, y_offset, n_cols, n_rows]
+        extent (list): The extent in map units as [XMin,XMax,YMin,YMax]. If given it overrides the window.
+        dtype (str): The dtype policy: "float64", "float32" or "native". See GetPolicyDtype.
+        categorical (bool): mode if true, mean if false. If None, integer rasters are treated as categorical.
+    """
+    def __init__(self, raster_file, factor, window=None, extent=None, dtype="float64", categorical=None):
+
+        LSDMap_IO.LazyRaster.__init__(self, raster_file, window = window, extent = extent, dtype = dtype)
+        self._factor = factor
+        self._categorical = categorical
+
+        # the window in pixels of the pyramid level
+        col_min = self._window[0]//factor
+        row_min = self._window[1]//factor
+        col_max = -(-(self._window[0]+self._window[2])//factor)
+        row_max = -(-(self._window[1]+self._window[3])//factor)
+        self._level_window = [col_min,row_min,col_max-col_min,row_max-row_min]
+
+        NDV, xsize, ysize, GeoT, Projection, DataType = LSDMap_IO.GetGeoInfo(raster_file)
+        x_res = GeoT[1]*factor
+        y_res = abs(GeoT[5])*factor
+        XMin = GeoT[0]+col_min*x_res
+        YMax = GeoT[3]-row_min*y_res
+        self._extent = [XMin, XMin+self._level_window[2]*x_res, YMax-self._level_window[3]*y_res, YMax]
+
+    @property
+    def factor(self):
+        return self._factor
+
+    @property
+    def shape(self):
+        """The (rows, cols) of the array you will get. Doesn't read the data."""
+        return (self._level_window[3],self._level_window[2])
+
+    @property
+    def data(self):
+        """The data array. It is read from the pyramid the first time you ask for it."""
+        if self._data is None:
+            level = GetPyramidLevel(self._raster_file, self._factor, self._categorical)
+            col_min,row_min,n_cols,n_rows = self._level_window
+            data_array = level[row_min:row_min+n_rows,col_min:col_min+n_cols]
+            data_array = np.array(data_array, dtype = LSDMap_IO.GetPolicyDtype(data_array.dtype, self._dtype))
+            if self._dtype == "native":
+                data_array = np.ma.masked_invalid(data_array, copy = False)
+            self._data = data_array
+        return self._data
+
+    @data.setter
+    def data(self, data_array):
+        self._data = data_array
+#==============================================================================
@@ -27,6 +27,73 @@ from LSDMapFigure import PlottingHelpers as Helper
 ##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
 ## Regressions
 ##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+def GroupedLinearRegression(df, group_columns, x_column = "drainage_area", y_column = "slope", log_data = True,
+                            group_order = None):
+    """
+    This function performs a linear regression on every group of the slope-area
+    data (e.g. every basin, source or segment) at once, instead of masking the
+    dataframe for each group.
+
+    Args:
+        df (pandas dataframe): the slope-area data
+        group_columns (list): the columns that define the groups, e.g. ['basin_key','source_key']
+        x_column (str): the column with the x data
+        y_column (str): the column with the y data
+        log_data (bool): If true the regression is done on log10 of the data, and rows where x is 0 are removed
+        group_order (list): The values of the first group column (e.g. the basin list) in the order you want
+            them back. With one group column, values that have no data get a row with NaN and no points.
+
+    Returns:
+        pandas dataframe with the group columns, regression_slope, intercept, std_err, R2, p_value and n_points
+        for each group, in the order of group_order and then in the order the groups first appear in the data.
+        Rows with a missing (NaN) group are left out.
+    """
+    if not isinstance(group_columns, (list, tuple)):
+        group_columns = [group_columns]
+    group_columns = list(group_columns)
+
+    # rows without a group can't be put in one
+    df = df.dropna(subset=group_columns)
+    if log_data:
+        df = df[df[x_column] != 0]
+        x = np.log10(df[x_column].values.astype(float))
+        y = np.log10(df[y_column].values.astype(float))
+    else:
+        x = df[x_column].values.astype(float)
+        y = df[y_column].values.astype(float)
+
+    # number the groups in the order they appear
+    group_index = df.groupby(group_columns, sort=False).ngroup().values
+    OutDF = df[group_columns].drop_duplicates().reset_index(drop=True)
+
+    if group_order is not None:
+        first_column = group_columns[0]
+        if len(group_columns) == 1:
+            # the groups with no data are added at the end, and have no points
+            present = set(OutDF[first_column].tolist())
+            missing = [key for key in group_order if key not in present]
+            OutDF = pd.concat([OutDF, pd.DataFrame({first_column: missing})], ignore_index=True)
+        order_position = dict((key, i) for i, key in enumerate(group_order))
+        position = OutDF[first_column].map(order_position).fillna(len(group_order)).values
+        # the number of each group is its row in OutDF before it is sorted
+        sorted_rows = np.argsort(position, kind="mergesort")
+    else:
+        sorted_rows = np.arange(len(OutDF))
+
+    for column in group_columns:
+        OutDF[column] = OutDF[column].astype(int)
+
+    slope, intercept, r_value, p_value, std_err, n = LSDStats.grouped_linregress(x, y, group_index, len(OutDF))
+
+    OutDF['regression_slope'] = slope
+    OutDF['intercept'] = intercept
+    OutDF['std_err'] = std_err
+    OutDF['R2'] = r_value**2
+    OutDF['p_value'] = p_value
+    OutDF['n_points'] = n.astype(int)
+
+    return OutDF.iloc[sorted_rows].reset_index(drop=True)
+
 def LinearRegressionRawData(DataDirectory, DEM_prefix, basin_list=[],parallel=False):
     """
     This function performs a linear regression on all of the slope-area data.
@@ -51,25 +118,14 @@ def LinearRegressionRawData(DataDirectory, DEM_prefix, basin_list=[],parallel=Fa
     # get a list of the basins if needed
     if basin_list == []:
         print ("You didn't give me a basin list so I will analyse all the basins")
-        basin_list = df['basin_key'].unique()
+    else:
+        df = df[df['basin_key'].isin(basin_list)]
 
     # now do a linear regression for each basin
     columns = ['basin_key', 'regression_slope', 'std_err', 'R2', 'p_value']
-    OutDF = pd.DataFrame(columns=columns)
-
-    for basin_key in basin_list:
-        df_slope = (df[df['basin_key']==basin_key]['slope']).values
-        df_area = (df[df['basin_key']==basin_key]['drainage_area']).values
-
-        logS = np.log10(df_slope[df_area!=0])
-        logA = np.log10(df_area[df_area!=0])
-
-        slope, intercept, r_value, p_value, std_err = stats.linregress(logA,logS)
-
-        #print("Slope: " +str(slope)+ " std_err: "+str(std_err)+ " R2 is: " + str(r_value**2) + " p value is: " + str(p_value))
-        this_key = int(basin_key)
-        this_row = [this_key,abs(slope),std_err,r_value**2,p_value]
-        OutDF.loc[basin_key] = this_row
+    OutDF = GroupedLinearRegression(df, ['basin_key'], group_order = basin_list if len(basin_list) > 0 else None)[columns]
+    OutDF['regression_slope'] = OutDF['regression_slope'].abs()
+    OutDF.index = OutDF['basin_key'].values
 
     return OutDF
 
@@ -100,36 +156,13 @@ def LinearRegressionRawDataByChannel(DataDirectory, DEM_prefix, basin_list=[]):
     # get a list of the basins if needed
     if basin_list == []:
         print ("You didn't give me a basin list so I will analyse all the basins")
-        basin_list = df['basin_key'].unique()
-        print (basin_list)
-
+        print (df['basin_key'].unique())
+    else:
+        df = df[df['basin_key'].isin(basin_list)]
 
-    # now do a linear regression for each basin
+    # now do a linear regression for each channel
     columns = ['basin_key', 'source_key', 'regression_slope', 'std_err', 'R2', 'p_value']
-    OutDF = pd.DataFrame(columns=columns)
-    counter = 0
-
-    for basin_key in basin_list:
-        this_df = df[df['basin_key'] == basin_key]
-        # get the sources for this basin
-        these_sources = this_df['source_key'].unique()
-
-        for source in these_sources:
-            #mask the dataframe for this source
-            df_slope = (df[df['source_key']==source]['slope']).values
-            df_area = (df[df['source_key']==source]['drainage_area']).values
-
-            logS = np.log10(df_slope[df_area!=0])
-            logA = np.log10(df_area[df_area!=0])
-
-            slope, intercept, r_value, p_value, std_err = stats.linregress(logA,logS)
-
-            #print("Slope: " +str(slope)+ " std_err: "+str(std_err)+ " R2 is: " + str(r_value**2) + " p value is: " + str(p_value))
-            this_basin_key = int(basin_key)
-            this_source_key = int(source)
-            this_row = [this_basin_key,this_source_key,slope,std_err,r_value**2,p_value]
-            OutDF.loc[counter] = this_row
-            counter+=1
+    OutDF = GroupedLinearRegression(df, ['basin_key', 'source_key'], group_order = basin_list if len(basin_list) > 0 else None)[columns]
 
     return OutDF
 
@@ -154,33 +187,15 @@ def LinearRegressionSegmentedData(DataDirectory, DEM_prefix, basin_list=[]):
     # get a list of the basins if needed
     if basin_list == []:
         print ("You didn't give me a basin list so I will analyse all the basins")
-        basin_list = df['basin_key'].unique()
+    else:
+        df = df[df['basin_key'].isin(basin_list)]
 
+    # regress the binned data of each segment to get the best fit m/n
     columns = ['basin_key', 'segment_number', 'regression_slope', 'std_err', 'R2', 'p_value']
-    OutDF = pd.DataFrame(columns=columns)
-    counter=0
-
-    # get the segments for each basin
-    for basin_key in basin_list:
-        print ("THIS BASIN IS: "+str(basin_key))
-        SegmentDF = df[df['basin_key'] == basin_key]
-
-        # get the data for each individual segment number
-        segments = SegmentDF['segment_number'].unique()
-
-        for segment_no in segments:
-            print ("Segment number is: "+str(segment_no))
-            ThisDF = SegmentDF[SegmentDF['segment_number']==segment_no]
-            #now regress the data for this segment to get the best fit m/n
-            median_log_S = ThisDF['median_log_S']
-            median_log_A = ThisDF['median_log_A']
-            slope, intercept, r_value, p_value, std_err = stats.linregress(median_log_A,median_log_S)
-            print("Slope: " +str(slope)+ " std_err: "+str(std_err)+ " R2 is: " + str(r_value**2) + " p value is: " + str(p_value) + " intercept is: " +str(intercept))
-
-            this_key = int(basin_key)
-            this_row = [this_key,int(segment_no),slope,std_err,r_value**2,p_value]
-            OutDF.loc[counter] = this_row
-            counter+=1
+    OutDF = GroupedLinearRegression(df, ['basin_key', 'segment_number'],
+                                    x_column = 'median_log_A', y_column = 'median_log_S', log_data = False,
+                                    group_order = basin_list if len(basin_list) > 0 else None)[columns]
+    print ("I regressed "+str(len(OutDF))+" segments in "+str(OutDF['basin_key'].nunique())+" basins")
 
     return OutDF
 
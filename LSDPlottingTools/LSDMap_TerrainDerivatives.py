@@ -0,0 +1,282 @@
+## LSDMap_TerrainDerivatives.py
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+## These functions calculate derivatives of a DEM: slope, aspect, curvature
+## and single or multidirectional hillshades. All of them come from the
+## same 3x3 stencil, so if a figure needs several derivatives of a DEM the
+## DEM is read once and the neighbours and gradients are only worked out once.
+## Big rasters are done in strips of rows.
+##
+## Conventions (the same as the LSDTopoTools rasters):
+##   slope: the gradient in m/m (not degrees)
+##   aspect: degrees clockwise from north, -1 where the surface is flat
+##   curvature: the Laplacian of the surface (negative on hilltops)
+##   hillshade: 0-255 as in LSDMap_Hillshade
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import numpy as np
+import os
+from os.path import exists
+from . import LSDMap_GDALIO as LSDMap_IO
+
+# The derivatives this module knows about, and the suffix of their rasters
+DerivativeSuffixes = {"slope": "_slope", "aspect": "_aspect", "curvature": "_curvature",
+                      "hillshade": "_hs", "multidirectional_hillshade": "_mdhs"}
+
+# The sun azimuths combined in the multidirectional hillshade
+MultidirectionalAzimuths = [225, 270, 315, 360]
+
+# The number of rows read at a time when working on a raster file
+DerivativeTileRows = 2048
+
+#==============================================================================
+def GetNeighbourStencil(terrain_array):
+    """This gets the 8 neighbours of every pixel as arrays the same shape as the
+    terrain. Neighbours that are nodata (NaN) or off the edge of the array are
+    replaced by the centre pixel.
+
+    Args:
+        terrain_array (numpy array): float array of elevations with NaN in the nodata pixels
+
+    Returns:
+        dict: with the keys "c" (the terrain itself), "n", "ne", "e", "se", "s", "sw", "w" and "nw"
+    """
+    nrows, ncols = terrain_array.shape
+    padded = np.pad(terrain_array, 1, mode="constant", constant_values=np.nan)
+
+    stencil = {"c": terrain_array}
+    offsets = {"nw": (-1,-1), "n": (-1,0), "ne": (-1,1), "w": (0,-1),
+               "e": (0,1), "sw": (1,-1), "s": (1,0), "se": (1,1)}
+    for name, (di, dj) in offsets.items():
+        this_neighbour = padded[1+di:1+di+nrows, 1+dj:1+dj+ncols]
+        stencil[name] = np.where(np.isnan(this_neighbour), terrain_array, this_neighbour)
+    return stencil
+#==============================================================================
+
+#==============================================================================
+def GetHornGradients(stencil, DataResolution):
+    """This gets the gradients in the x (east) and y (south) directions with
+    Horn's method, which is what LSDTopoTools uses for hillshades.
+
+    Args:
+        stencil (dict): from GetNeighbourStencil
+        DataResolution (float): The size of the pixels
+
+    Returns:
+        dzdx, dzdy (numpy arrays)
+    """
+    dzdx = ((stencil["ne"] + 2*stencil["e"] + stencil["se"]) -
+            (stencil["nw"] + 2*stencil["w"] + stencil["sw"])) / (8 * DataResolution)
+    dzdy = ((stencil["sw"] + 2*stencil["s"] + stencil["se"]) -
+            (stencil["nw"] + 2*stencil["n"] + stencil["ne"])) / (8 * DataResolution)
+    return dzdx, dzdy
+#==============================================================================
+
+#==============================================================================
+def ShadeFromGradients(dzdx, dzdy, azimuth = 315, angle_altitude = 45, z_factor = 1):
+    """This gets the hillshade from the gradients.
+
+    Args:
+        dzdx, dzdy (numpy arrays): from GetHornGradients
+        azimuth (float): Azimuth of sunlight
+        angle_altitude (float): Angle altitude of sun
+        z_factor (float): z_factor
+
+    Returns:
+        HSArray (numpy.array): The hillshade array (0-255)
+    """
+    zenith_rad = (90 - angle_altitude) * np.pi / 180.0
+    azimuth_math = 360 - azimuth + 90
+    if azimuth_math >= 360.0:
+        azimuth_math = azimuth_math - 360
+    azimuth_rad = azimuth_math * np.pi / 180.0
+
+    slope_rad = np.arctan(z_factor * np.sqrt(dzdx*dzdx + dzdy*dzdy))
+    aspect_rad = np.arctan2(dzdy, -dzdx)
+    aspect_rad[aspect_rad < 0] += 2 * np.pi
+
+    HSarray = 255.0 * ((np.cos(zenith_rad) * np.cos(slope_rad)) +
+                       (np.sin(zenith_rad) * np.sin(slope_rad) *
+                        np.cos(azimuth_rad - aspect_rad)))
+    HSarray[HSarray < 0] = 0
+    return HSarray
+#==============================================================================
+
+#==============================================================================
+def _CompassAspect(dzdx, dzdy):
+    """Aspect in degrees clockwise from north, -1 where flat.
+    """
+    math_aspect = np.degrees(np.arctan2(dzdy, -dzdx))
+    aspect = np.mod(90.0 - math_aspect, 360.0)
+    aspect[(dzdx == 0) & (dzdy == 0)] = -1
+    return aspect
+#==============================================================================
+
+#==============================================================================
+def TerrainDerivativesArray(terrain_array, DataResolution = 1, derivatives = ["slope","aspect","curvature","hillshade"],
+                            azimuth = 315, angle_altitude = 45, z_factor = 1, NoDataValue = None):
+    """This calculates several derivatives of an array of elevations in one pass:
+    the neighbours and gradients are only worked out once.
+
+    Args:
+        terrain_array (numpy array): The elevations. NaN, masked pixels and pixels equal to NoDataValue are nodata.
+        DataResolution (float): The size of the pixels
+        derivatives (list): any of "slope", "aspect", "curvature", "hillshade" and "multidirectional_hillshade"
+        azimuth (float): Azimuth of sunlight for the hillshade
+        angle_altitude (float): Angle altitude of sun for the hillshades
+        z_factor (float): z_factor for the hillshades
+        NoDataValue (float): The nodata value of the array
+
+    Returns:
+        dict: where the key is the derivative and the value is an array, with NaN in the nodata pixels
+    """
+    for derivative in derivatives:
+        if derivative not in DerivativeSuffixes:
+            raise ValueError("I don't know the derivative "+derivative+". Options are "+", ".join(sorted(DerivativeSuffixes)))
+
+    if np.ma.isMaskedArray(terrain_array):
+        terrain_array = np.ma.filled(terrain_array.astype(np.float64), np.nan)
+    terrain_array = np.array(terrain_array, dtype=np.float64)
+    if NoDataValue is not None:
+        terrain_array[terrain_array == NoDataValue] = np.nan
+    terrain_array[np.isinf(terrain_array)] = np.nan
+    nodata = np.isnan(terrain_array)
+
+    stencil = GetNeighbourStencil(terrain_array)
+    dzdx, dzdy = GetHornGradients(stencil, float(DataResolution))
+
+    results = {}
+    if "slope" in derivatives:
+        results["slope"] = np.sqrt(dzdx*dzdx + dzdy*dzdy)
+    if "aspect" in derivatives or "multidirectional_hillshade" in derivatives:
+        aspect = _CompassAspect(dzdx, dzdy)
+        if "aspect" in derivatives:
+            results["aspect"] = aspect
+    if "curvature" in derivatives:
+        d2zdx2 = (stencil["e"] + stencil["w"] - 2*stencil["c"]) / (DataResolution*DataResolution)
+        d2zdy2 = (stencil["n"] + stencil["s"] - 2*stencil["c"]) / (DataResolution*DataResolution)
+        results["curvature"] = d2zdx2 + d2zdy2
+    if "hillshade" in derivatives:
+        results["hillshade"] = ShadeFromGradients(dzdx, dzdy, azimuth, angle_altitude, z_factor)
+    if "multidirectional_hillshade" in derivatives:
+        # Each direction is weighted by sin^2(aspect-azimuth), as in the multidirectional
+        # hillshade of GDAL: a light shining across the slope counts most, and one
+        # shining straight onto it or straight away from it counts least
+        aspect_rad = np.radians(np.where(aspect < 0, 0, aspect))
+        weighted_sum = np.zeros(terrain_array.shape)
+        weight_total = np.zeros(terrain_array.shape)
+        for this_azimuth in MultidirectionalAzimuths:
+            weight = 0.5*(1-np.cos(2*(aspect_rad-np.radians(this_azimuth))))
+            weighted_sum += weight*ShadeFromGradients(dzdx, dzdy, this_azimuth, angle_altitude, z_factor)
+            weight_total += weight
+        results["multidirectional_hillshade"] = weighted_sum/weight_total
+
+    for derivative in results:
+        results[derivative][nodata] = np.nan
+    return results
+#==============================================================================
+
+#==============================================================================
+def TerrainDerivativesRasterFile(raster_file, derivatives = ["slope","aspect","curvature","hillshade"],
+                                 azimuth = 315, angle_altitude = 45, z_factor = 1, tile_rows = None):
+    """This calculates several derivatives of a raster file in one pass. The raster
+    is read in strips of rows (with one row of overlap on each side) and every
+    derivative is calculated from each strip before the next one is read.
+
+    Args:
+        raster_file (str): The filename (with path and extension) of the DEM.
+        derivatives (list): any of "slope", "aspect", "curvature", "hillshade" and "multidirectional_hillshade"
+        azimuth (float): Azimuth of sunlight for the hillshade
+        angle_altitude (float): Angle altitude of sun for the hillshades
+        z_factor (float): z_factor for the hillshades
+        tile_rows (int): The number of rows in each strip. Default is DerivativeTileRows.
+
+    Returns:
+        dict: where the key is the derivative and the value is an array, with NaN in the nodata pixels
+    """
+    if exists(raster_file) is False:
+        raise Exception('[Errno 2] No such file or directory: \'' + raster_file + '\'')
+
+    if tile_rows is None:
+        tile_rows = DerivativeTileRows
+    tile_rows = max(int(tile_rows), 1)
+
+    metadata = LSDMap_IO.GetRasterMetadata(raster_file)
+    ncols = metadata["xsize"]
+    nrows = metadata["ysize"]
+    DataResolution = abs(metadata["GeoT"][1])
+
+    print("Calculating "+", ".join(derivatives)+" of "+raster_file)
+    results = {}
+    for derivative in derivatives:
+        results[derivative] = np.empty((nrows, ncols))
+
+    for row_start in range(0, nrows, tile_rows):
+        row_end = min(row_start+tile_rows, nrows)
+
+        # read one extra row above and below so the strips join up
+        read_start = max(row_start-1, 0)
+        read_end = min(row_end+1, nrows)
+        terrain_tile = LSDMap_IO.ReadRasterWindow(raster_file, window = [0, read_start, ncols, read_end-read_start])
+
+        tile_results = TerrainDerivativesArray(terrain_tile, DataResolution, derivatives,
+                                               azimuth, angle_altitude, z_factor)
+        for derivative in derivatives:
+            results[derivative][row_start:row_end] = tile_results[derivative][row_start-read_start:row_end-read_start]
+
+    return results
+#==============================================================================
+
+#==============================================================================
+def GetDerivativeRasterName(raster_file, derivative):
+    """This returns the name LSDTopoTools gives a derivative of a raster, e.g.
+    the raster name with _slope before the extension.
+
+    Args:
+        raster_file (str): The filename (with path and extension) of the DEM.
+        derivative (str): the derivative
+
+    Returns:
+        str: the name of the derivative raster
+    """
+    split_name = os.path.splitext(raster_file)
+    return split_name[0]+DerivativeSuffixes[derivative]+split_name[1]
+#==============================================================================
+
+#==============================================================================
+def MakeTerrainDerivativeRasters(raster_file, derivatives = ["slope","aspect","curvature","hillshade"],
+                                 azimuth = 315, angle_altitude = 45, z_factor = 1,
+                                 driver_name = "ENVI", NoDataValue = -9999, overwrite = False):
+    """This writes the derivative rasters of a DEM, named as LSDTopoTools names them
+    (e.g. _slope.bil). Derivatives that already have a raster are kept unless
+    overwrite is True; the rest are calculated together in one pass.
+
+    Args:
+        raster_file (str): The filename (with path and extension) of the DEM.
+        derivatives (list): any of "slope", "aspect", "curvature", "hillshade" and "multidirectional_hillshade"
+        azimuth (float): Azimuth of sunlight for the hillshade
+        angle_altitude (float): Angle altitude of sun for the hillshades
+        z_factor (float): z_factor for the hillshades
+        driver_name (str): The raster format (see gdal documentation for options. LSDTopoTools used "ENVI" format.)
+        NoDataValue (float): The nodata value written to the rasters.
+        overwrite (bool): If true all of the rasters are made
+
+    Returns:
+        dict: where the key is the derivative and the value is the filename of its raster
+    """
+    raster_names = {}
+    to_calculate = []
+    for derivative in derivatives:
+        raster_names[derivative] = GetDerivativeRasterName(raster_file, derivative)
+        if overwrite or not exists(raster_names[derivative]):
+            to_calculate.append(derivative)
+
+    if len(to_calculate) > 0:
+        results = TerrainDerivativesRasterFile(raster_file, to_calculate, azimuth, angle_altitude, z_factor)
+        for derivative in to_calculate:
+            this_array = results[derivative]
+            this_array[np.isnan(this_array)] = NoDataValue
+            LSDMap_IO.array2raster(raster_file, raster_names[derivative], this_array, driver_name, NoDataValue)
+
+    return raster_names
+#==============================================================================
@@ -18,6 +18,173 @@ import gdal as gdal
 from osgeo.gdalconst import GA_ReadOnly
 from LSDMapFigure import PlottingHelpers as Helper
 
+#=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+# BASIN GEOMETRY CACHE
+# Polygonising a basin raster is slow and the same raster is polygonised
+# many times when making a set of figures, so the polygons, centroids and
+# representative points are kept in memory and in a binary file next to the
+# raster (the polygons as WKB). Both are keyed on the raster's size and
+# modification time so they are rebuilt if the raster changes.
+#=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+_BasinGeometryCache = {}
+
+def GetBasinGeometryFileName(DataDirectory, basins_fname):
+	"""
+	This returns the name of the file that holds the polygonised basins of a raster
+
+	Args:
+		DataDirectory (str): the data directory with the basin raster
+		basins_fname (str): the basin raster
+
+	Returns:
+		the name of the geometry file
+	"""
+	return DataDirectory+basins_fname+".geom.npz"
+
+def _ReadBasinGeometryFile(geometry_file, stamp):
+	"""
+	This reads the polygons, centroids and representative points of the basins
+	from a geometry file, if it was made from the current version of the raster.
+
+	Args:
+		geometry_file (str): the name of the geometry file
+		stamp (tuple): the stamp of the raster
+
+	Returns:
+		dict with the keys "polygons", "centroids" and "points", or None
+	"""
+	from shapely import wkb
+
+	if not exists(geometry_file):
+		return None
+
+	try:
+		with open(geometry_file, "rb") as f:
+			geom_data = np.load(f)
+			if not np.array_equal(geom_data["stamp"], np.asarray(stamp, dtype=float)):
+				return None
+			keys = geom_data["keys"]
+			offsets = geom_data["offsets"]
+			wkb_bytes = geom_data["wkb"].tobytes()
+			centroids = geom_data["centroids"]
+			points = geom_data["points"]
+	except (IOError, OSError, ValueError, KeyError):
+		return None
+
+	Geometry = {"polygons": {}, "centroids": {}, "points": {}}
+	for i, key in enumerate(keys):
+		key = float(key)
+		Geometry["polygons"][key] = wkb.loads(wkb_bytes[offsets[i]:offsets[i+1]])
+		Geometry["centroids"][key] = Point(centroids[i])
+		Geometry["points"][key] = Point(points[i])
+	return Geometry
+
+def _WriteBasinGeometryFile(geometry_file, stamp, Geometry):
+	"""
+	This writes the polygons, centroids and representative points of the basins
+	to a geometry file. It is written to a temporary file first and then renamed.
+
+	Args:
+		geometry_file (str): the name of the geometry file
+		stamp (tuple): the stamp of the raster
+		Geometry (dict): the dict returned by GetBasinGeometry
+	"""
+	from shapely import wkb
+
+	keys = sorted(Geometry["polygons"].keys())
+	wkb_list = [wkb.dumps(Geometry["polygons"][key]) for key in keys]
+	offsets = np.zeros(len(keys)+1, dtype=np.int64)
+	offsets[1:] = np.cumsum([len(b) for b in wkb_list])
+	centroids = np.array([Geometry["centroids"][key].coords[0] for key in keys], dtype=float).reshape(-1, 2)
+	points = np.array([Geometry["points"][key].coords[0] for key in keys], dtype=float).reshape(-1, 2)
+
+	tmp_file = geometry_file+".tmp%i" % os.getpid()
+	try:
+		with open(tmp_file, "wb") as f:
+			np.savez(f, stamp=np.asarray(stamp, dtype=float), keys=np.asarray(keys, dtype=float),
+			         offsets=offsets, wkb=np.frombuffer(b"".join(wkb_list), dtype=np.uint8),
+			         centroids=centroids, points=points)
+		os.rename(tmp_file, geometry_file)
+	except (IOError, OSError):
+		print("I couldn't write the basin geometry file "+geometry_file)
+
+def _WriteBasinShapefile(DataDirectory, basins_fname, OutputShapefile, Polygons):
+	"""
+	This writes the shapefile of the basins from their polygons, in the same way
+	as LSDMap_GDALIO.PolygoniseRaster, for when the polygons come from the cache.
+
+	Args:
+		DataDirectory (str): the data directory with the basin raster
+		basins_fname (str): the basin raster
+		OutputShapefile (str): the name of the shapefile
+		Polygons (dict): the polygons, where the key is the basin key
+	"""
+	import fiona
+	from shapely.geometry import mapping
+
+	NDV = LSDMap_IO.getNoDataValue(DataDirectory+basins_fname)
+	crs = LSDMap_IO.GetUTMEPSG(DataDirectory+basins_fname)
+	schema = {'geometry': 'Polygon',
+	          'properties': { 'ID': 'float'}}
+	with fiona.open(DataDirectory+OutputShapefile, 'w', crs=crs, driver='ESRI Shapefile', schema=schema) as output:
+		for this_val, this_shape in Polygons.items():
+			if this_val != NDV: # remove no data values
+				output.write({'geometry': mapping(this_shape), 'properties':{'ID': this_val}})
+
+def GetBasinGeometry(DataDirectory, basins_fname, write_shapefile=True):
+	"""
+	This gets the polygons, centroids and representative points of the basins in
+	a basin raster. The raster is only polygonised the first time this is called;
+	after that the geometry comes from memory or from the geometry file next to
+	the raster. If write_shapefile is True and the shapefile isn't there it is
+	written, from the cached polygons if there are any.
+
+	IMPORTANT: In this case the "basin key" is usually the junction number:
+		this function will use the raster values as keys
+
+	Args:
+		DataDirectory (str): the data directory with the basin raster
+		basins_fname (str): the basin raster
+		write_shapefile (bool): If true a shapefile of the basins is written if it doesn't exist
+
+	Returns:
+		dict with the keys "polygons", "centroids" and "points". Each is a dict
+		where the key is the basin key and the value is a shapely geometry.
+	"""
+	raster_file = DataDirectory+basins_fname
+	stamp = LSDMap_IO._GetRasterFileStamp(raster_file)
+	cache_key = os.path.abspath(raster_file)
+	this_fname = basins_fname.split('.')
+	OutputShapefile = this_fname[0]+'.shp'
+
+	if cache_key in _BasinGeometryCache and _BasinGeometryCache[cache_key][0] == stamp:
+		Geometry = _BasinGeometryCache[cache_key][1]
+	else:
+		geometry_file = GetBasinGeometryFileName(DataDirectory, basins_fname)
+		Geometry = _ReadBasinGeometryFile(geometry_file, stamp)
+		if Geometry is None:
+			# polygonise the raster
+			BasinDict = LSDMap_IO.PolygoniseRaster(DataDirectory, basins_fname, OutputShapefile, write_shapefile)
+
+			Geometry = {"polygons": BasinDict, "centroids": {}, "points": {}}
+			for basin_key, basin in BasinDict.items():
+				Geometry["centroids"][basin_key] = Point(basin.centroid)
+				Geometry["points"][basin_key] = Point(basin.representative_point())
+			_WriteBasinGeometryFile(geometry_file, stamp, Geometry)
+
+		_BasinGeometryCache[cache_key] = (stamp, Geometry)
+
+	# if the geometry came from the cache the shapefile may never have been written
+	if write_shapefile and not exists(DataDirectory+OutputShapefile):
+		_WriteBasinShapefile(DataDirectory, basins_fname, OutputShapefile, Geometry["polygons"])
+	return Geometry
+
+def ClearBasinGeometryCache():
+	"""
+	This empties the in memory cache of basin geometry. The geometry files are kept.
+	"""
+	_BasinGeometryCache.clear()
+
 #=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
 # BASIN FUNCTIONS
 # These functions do various operations on basin polygons
@@ -40,13 +207,9 @@ def GetBasinOutlines(DataDirectory, basins_fname):
 
 	Author: FJC
 	"""
-	# read in the basins raster
-	this_fname = basins_fname.split('.')
+	# get the basins polygons, the raster is only polygonised once
 	print(basins_fname)
-	OutputShapefile = this_fname[0]+'.shp'
-
-	# polygonise the raster
-	BasinDict = LSDMap_IO.PolygoniseRaster(DataDirectory, basins_fname, OutputShapefile)
+	BasinDict = dict(GetBasinGeometry(DataDirectory, basins_fname)["polygons"])
 	return BasinDict
 
 def GetMultipleBasinOutlines(DataDirectory):
@@ -66,25 +229,120 @@ def GetMultipleBasinOutlines(DataDirectory):
 
 	Author: MDH
 	"""
-  # get a list of basins and declare the dictionary to populate
-  basin_dict = Helper.MapBasinsToKeys(DataDirectory)
-  BasinsDict = {}
-  
-  #loop across the basins
-  for outlet_jn, basin_key in basin_dict.iteritems():
-    this_fname = "basin"+str(outlet_jn)+"_AllBasins.bil"
-    
-    TempBasins = GetBasinOutlines(DataDirectory,this_fname)
-  
-    for temp_outlet, temp_basin_key in TempBasins.iteritems():
-      if len(TempBasins) > 1:
-        print("WARNING: MULTIPLE BASINS IN basin #", outlet_jn)
-      TempBasins[int(outlet_jn)] = TempBasins.pop(temp_outlet)
-    
-    BasinsDict.update(TempBasins)
-  
+  BasinsDict = dict(GetMultipleBasinGeometry(DataDirectory)["polygons"])
   return BasinsDict
-              
+
+def _PolygoniseBasinRaster(args):
+  """
+  This is the worker used by GetMultipleBasinGeometry. It has to be a module
+  level function so that it can be sent to the processes of the pool.
+
+  Args:
+    args (tuple): the data directory, basin raster name and write_shapefile flag
+
+  Returns:
+    tuple with the basin raster name, the raster stamp and the geometry dict
+  """
+  DataDirectory, basins_fname, write_shapefile = args
+  Geometry = GetBasinGeometry(DataDirectory, basins_fname, write_shapefile)
+  stamp = LSDMap_IO._GetRasterFileStamp(DataDirectory+basins_fname)
+  return basins_fname, stamp, Geometry
+
+def GetMultipleBasinGeometry(DataDirectory, n_processes=None, write_shapefile=False):
+  """
+  This gets the polygons, centroids and representative points from every basin
+  raster of a parallel run (the files basin<jn>_AllBasins.bil) and merges them
+  into one index keyed on the outlet junction taken from the file name.
+
+  Rasters that have not been polygonised yet are done by a pool of processes,
+  many basins at a time; the others are read from the geometry cache. The
+  shapefiles of the individual basins are only written if you ask for them.
+
+  Args:
+    DataDirectory (str): the data directory with the basin rasters
+    n_processes (int): the number of processes. Default (None) is the number of CPUs.
+    write_shapefile (bool): If true a shapefile is written for every basin that is polygonised
+
+  Returns:
+    dict with the keys "polygons", "centroids" and "points". Each is a dict
+    where the key is the outlet junction and the value is a shapely geometry.
+  """
+  import time
+  from multiprocessing import Pool, cpu_count
+
+  start_time = time.time()
+
+  # get a list of basins
+  basin_dict = Helper.MapBasinsToKeys(DataDirectory)
+  basin_fnames = {}
+  for outlet_jn in basin_dict:
+    basin_fnames["basin"+str(outlet_jn)+"_AllBasins.bil"] = outlet_jn
+
+  # the rasters that are not in memory or in a geometry file need polygonising
+  BasinGeometries = {}
+  to_polygonise = []
+  for this_fname in sorted(basin_fnames):
+    raster_file = DataDirectory+this_fname
+    stamp = LSDMap_IO._GetRasterFileStamp(raster_file)
+    cache_key = os.path.abspath(raster_file)
+    if cache_key in _BasinGeometryCache and _BasinGeometryCache[cache_key][0] == stamp:
+      BasinGeometries[this_fname] = _BasinGeometryCache[cache_key][1]
+    else:
+      Geometry = _ReadBasinGeometryFile(GetBasinGeometryFileName(DataDirectory, this_fname), stamp)
+      if Geometry is None:
+        to_polygonise.append(this_fname)
+      else:
+        _BasinGeometryCache[cache_key] = (stamp, Geometry)
+        BasinGeometries[this_fname] = Geometry
+
+  n_total = len(to_polygonise)
+  print("I found "+str(len(basin_fnames))+" basin rasters, "+str(n_total)+" of them need polygonising.")
+
+  if n_total > 0:
+    if n_processes is None:
+      n_processes = cpu_count()
+    n_processes = max(1, min(n_processes, n_total))
+    jobs = [(DataDirectory, this_fname, write_shapefile) for this_fname in to_polygonise]
+    report_every = max(1, n_total//20)
+
+    if n_processes == 1:
+      results = (_PolygoniseBasinRaster(job) for job in jobs)
+      pool = None
+    else:
+      pool = Pool(n_processes)
+      results = pool.imap_unordered(_PolygoniseBasinRaster, jobs, chunksize = max(1, n_total//(4*n_processes)))
+
+    try:
+      for n_done, (this_fname, stamp, Geometry) in enumerate(results, 1):
+        _BasinGeometryCache[os.path.abspath(DataDirectory+this_fname)] = (stamp, Geometry)
+        BasinGeometries[this_fname] = Geometry
+        if n_done % report_every == 0 or n_done == n_total:
+          print("Polygonised "+str(n_done)+" of "+str(n_total)+" basins in "+str(round(time.time()-start_time, 1))+" s")
+    except BaseException:
+      # stop the workers now rather than letting them polygonise the rest
+      if pool is not None:
+        pool.terminate()
+      raise
+    else:
+      if pool is not None:
+        pool.close()
+    finally:
+      if pool is not None:
+        pool.join()
+
+  # now merge them into one index keyed on the outlet junction
+  MergedGeometry = {"polygons": {}, "centroids": {}, "points": {}}
+  for this_fname, Geometry in BasinGeometries.items():
+    outlet_jn = int(basin_fnames[this_fname])
+    if len(Geometry["polygons"]) > 1:
+      print("WARNING: MULTIPLE BASINS IN basin #", outlet_jn)
+    for geometry_type in MergedGeometry:
+      for temp_outlet, temp_geometry in Geometry[geometry_type].items():
+        MergedGeometry[geometry_type][outlet_jn] = temp_geometry
+
+  print("Got the geometry of "+str(len(BasinGeometries))+" basins in "+str(round(time.time()-start_time, 1))+" s")
+  return MergedGeometry
+
 def GetBasinCentroids(DataDirectory, basins_fname):
 	"""
 	This function takes in the raster of basins and returns a dict where the
@@ -103,13 +361,8 @@ def GetBasinCentroids(DataDirectory, basins_fname):
 
 	Author: FJC
 	"""
-	# get the basin polygons
-	BasinDict = GetBasinOutlines(DataDirectory, basins_fname)
-
-	# get the centroids
-	CentroidDict = {}
-	for basin_key, basin in BasinDict.iteritems():
-		CentroidDict[basin_key] = Point(basin.centroid)
+	# get the centroids, these are worked out when the raster is polygonised
+	CentroidDict = dict(GetBasinGeometry(DataDirectory, basins_fname)["centroids"])
 
 	return CentroidDict
 
@@ -132,13 +385,8 @@ def GetPointWithinBasins(DataDirectory,basins_fname):
 
 	Author: FJC
 	"""
-	# get the basin polygons
-	BasinDict = GetBasinOutlines(DataDirectory, basins_fname)
-
-	# get the centroids
-	PointDict = {}
-	for basin_key, basin in BasinDict.iteritems():
-		PointDict[basin_key] = Point(basin.representative_point())
+	# get the points, these are worked out when the raster is polygonised
+	PointDict = dict(GetBasinGeometry(DataDirectory, basins_fname)["points"])
 
 	return PointDict
 
@@ -161,15 +409,8 @@ def GetPointsWithinMultipleBasins(DataDirectory,basins_fname):
 
   Author: FJC
   """
-  # get the basin polygons
-  BasinDict = GetMultipleBasinOutlines(DataDirectory)
-  print("BASIN DICT IS")
-  print(BasinDict)
-  
-  # get the centroids
-  PointDict = {}
-  for basin_key, basin in BasinDict.iteritems():
-    PointDict[basin_key] = Point(basin.representative_point())
+  # get the points, these are worked out when each raster is polygonised
+  PointDict = dict(GetMultipleBasinGeometry(DataDirectory)["points"])
 
   print("POINT DICT IS")
   print(PointDict)
@@ -243,20 +484,10 @@ def readFile(filename):
 	return xsize,ysize,geotransform,geoproj,Z
 
 def writeFile(filename,geotransform,geoprojection,data):
-	(x,y) = data.shape
-	format = "GTiff".encode('utf-8')
-	noDataValue = -9999
-	driver = gdal.GetDriverByName(format)
-	# you can change the dataformat but be sure to be able to store negative values including -9999
-	dst_datatype = gdal.GDT_Float32
-
-	#print(data)
-
-	dst_ds = driver.Create(filename,y,x,1,dst_datatype)
-	dst_ds.GetRasterBand(1).WriteArray(data)
-	dst_ds.GetRasterBand(1).SetNoDataValue( noDataValue )
-	dst_ds.SetGeoTransform(geotransform)
-	dst_ds.SetProjection(geoprojection)
+	# written as a tiled, compressed GeoTIFF with the smallest type that holds the
+	# data and the -9999 nodata value, e.g. Int16 for rasterised geology codes
+	LSDMap_IO.WriteRaster(filename, data, GeoT = geotransform, ProjectionWkt = geoprojection,
+	                      driver_name = "GTiff", NoDataValue = -9999)
 	return 1
 
 
@@ -0,0 +1,316 @@
+## LSDMap_ZonalStatistics.py
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+## These functions get statistics of one or more value rasters (e.g. the
+## rainfall, the slope) for every zone of a label raster (e.g. the basins in
+## _AllBasins.bil) or for polygons in a shapefile.
+##
+## The label raster is read in strips of rows, and the strips are shared out
+## between a pool of processes. Each strip is reduced by zone with np.unique
+## and np.bincount into counts, means and sums of squared deviations, which are
+## then combined for the whole raster. The medians and percentiles need all of
+## the values of a zone, so only if they are asked for the values of each
+## strip are kept (sorted by zone) and sorted once more at the end. That takes
+## memory in proportion to the size of the raster, so they are not computed
+## unless you ask for them.
+##
+## The value rasters must have the same resolution as the label raster and be
+## aligned with it, but they can be bigger (e.g. a label raster of a few basins
+## cut out of a DEM).
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import numpy as np
+import pandas as pd
+import os
+import time
+from os.path import exists
+from . import LSDMap_GDALIO as LSDMap_IO
+
+# The number of rows of the label raster read at a time
+ZonalTileRows = 1024
+
+# The statistics that can be asked for. Percentiles are asked for as "p" and
+# the percentile, e.g. "p10" or "p90". The median is "p50".
+ZonalStatisticsNames = ["count", "sum", "mean", "std", "min", "max", "median"]
+
+#==============================================================================
+def _GetGridOffset(label_metadata, value_metadata, value_raster):
+    """This gets the pixel offset of the label raster within a value raster.
+    They need the same resolution and the label raster has to be inside the
+    value raster.
+    """
+    label_GeoT = label_metadata["GeoT"]
+    value_GeoT = value_metadata["GeoT"]
+    if not (np.isclose(label_GeoT[1], value_GeoT[1]) and np.isclose(label_GeoT[5], value_GeoT[5])):
+        raise Exception("The raster "+value_raster+" doesn't have the same resolution as the label raster")
+
+    col_offset = (label_GeoT[0]-value_GeoT[0])/value_GeoT[1]
+    row_offset = (label_GeoT[3]-value_GeoT[3])/value_GeoT[5]
+    if not (np.isclose(col_offset, round(col_offset)) and np.isclose(row_offset, round(row_offset))):
+        raise Exception("The pixels of "+value_raster+" are not aligned with the label raster")
+
+    col_offset = int(round(col_offset))
+    row_offset = int(round(row_offset))
+    if (col_offset < 0 or row_offset < 0 or col_offset+label_metadata["xsize"] > value_metadata["xsize"]
+            or row_offset+label_metadata["ysize"] > value_metadata["ysize"]):
+        raise Exception("The label raster is not inside the raster "+value_raster)
+
+    return [col_offset, row_offset]
+#==============================================================================
+
+#==============================================================================
+def _ParsePercentiles(statistics):
+    """This gets the percentiles (as numbers) from a list of statistics.
+    """
+    percentiles = []
+    for stat in statistics:
+        if stat == "median":
+            percentiles.append(50.0)
+        elif stat.startswith("p"):
+            try:
+                percentile = float(stat[1:])
+            except ValueError:
+                raise Exception("I don't know the statistic "+stat+". I know "+", ".join(ZonalStatisticsNames)+" and percentiles like p10")
+            if not 0 <= percentile <= 100:
+                raise Exception("The percentile "+stat+" has to be between p0 and p100")
+            percentiles.append(percentile)
+        elif stat not in ZonalStatisticsNames:
+            raise Exception("I don't know the statistic "+stat+". I know "+", ".join(ZonalStatisticsNames)+" and percentiles like p10")
+    return percentiles
+#==============================================================================
+
+#==============================================================================
+def _ZonalStatisticsTile(job):
+    """This reduces one strip of the rasters by zone.
+
+    Returns:
+        a dict with the zones of the strip and, for each value raster, the zones with data and their
+        count, mean, sum of squared deviations, min and max (and the values sorted by zone if keep_values)
+    """
+    label_raster, value_rasters, value_offsets, row_offset, n_rows, n_cols, keep_values = job
+
+    labels = LSDMap_IO.ReadRasterWindow(label_raster, window = [0, row_offset, n_cols, n_rows], dtype = "native")
+    valid = ~np.ma.getmaskarray(labels)
+    if np.issubdtype(labels.dtype, np.floating):
+        valid &= np.isfinite(np.ma.getdata(labels))
+    labels = np.ma.getdata(labels)[valid].astype(np.int64)
+
+    tile = {"zones": np.unique(labels), "values": []}
+    for value_raster, (col_offset, value_row_offset) in zip(value_rasters, value_offsets):
+        values = LSDMap_IO.ReadRasterWindow(value_raster, window = [col_offset, value_row_offset+row_offset, n_cols, n_rows],
+                                            dtype = "float64")[valid]
+        has_value = np.isfinite(values)
+        these_labels = labels[has_value]
+        values = values[has_value]
+
+        zones, zone_index = np.unique(these_labels, return_inverse = True)
+        count = np.bincount(zone_index, minlength = zones.size)
+        mean = np.bincount(zone_index, weights = values, minlength = zones.size)/np.maximum(count, 1)
+        M2 = np.bincount(zone_index, weights = (values-mean[zone_index])**2, minlength = zones.size)
+
+        # sorting by zone then value gives the min and max at the ends of each zone
+        order = np.lexsort((values, zone_index))
+        sorted_values = values[order]
+        ends = np.cumsum(count)
+        this_tile = {"zones": zones, "count": count, "mean": mean, "M2": M2,
+                     "min": sorted_values[ends-count], "max": sorted_values[ends-1]}
+        if keep_values:
+            this_tile["labels"] = these_labels[order]
+            this_tile["sorted_values"] = sorted_values
+        tile["values"].append(this_tile)
+
+    return tile
+#==============================================================================
+
+#==============================================================================
+def _CombineZonalTiles(tiles, percentiles):
+    """This combines the reductions of the strips of one value raster.
+
+    Returns:
+        a dict with the zones and their count, sum, mean, std, min, max and percentiles
+    """
+    all_zones = np.concatenate([tile["zones"] for tile in tiles])
+    zones, zone_index = np.unique(all_zones, return_inverse = True)
+    n_zones = zones.size
+
+    counts = np.concatenate([tile["count"] for tile in tiles]).astype(float)
+    means = np.concatenate([tile["mean"] for tile in tiles])
+    M2s = np.concatenate([tile["M2"] for tile in tiles])
+
+    # combine the means and variances of the strips (Chan et al.)
+    count = np.bincount(zone_index, weights = counts, minlength = n_zones)
+    total = np.bincount(zone_index, weights = counts*means, minlength = n_zones)
+    mean = total/np.maximum(count, 1)
+    M2 = np.bincount(zone_index, weights = M2s+counts*(means-mean[zone_index])**2, minlength = n_zones)
+
+    zone_min = np.full(n_zones, np.inf)
+    zone_max = np.full(n_zones, -np.inf)
+    np.minimum.at(zone_min, zone_index, np.concatenate([tile["min"] for tile in tiles]))
+    np.maximum.at(zone_max, zone_index, np.concatenate([tile["max"] for tile in tiles]))
+
+    result = {"zones": zones, "count": count.astype(np.int64), "sum": total, "mean": mean,
+              "std": np.sqrt(M2/np.maximum(count, 1)), "min": zone_min, "max": zone_max}
+
+    if percentiles:
+        labels = np.concatenate([tile["labels"] for tile in tiles])
+        values = np.concatenate([tile["sorted_values"] for tile in tiles])
+        order = np.lexsort((values, labels))
+        values = values[order]
+        # the same zones in the same order as above, since both come from sorting the labels
+        ends = np.cumsum(result["count"])
+        starts = ends-result["count"]
+        for percentile in percentiles:
+            # linear interpolation between the closest ranks, like np.percentile
+            position = starts+(percentile/100.0)*(result["count"]-1)
+            below = np.floor(position).astype(np.int64)
+            above = np.ceil(position).astype(np.int64)
+            fraction = position-below
+            result[percentile] = values[below]*(1-fraction)+values[above]*fraction
+
+    return result
+#==============================================================================
+
+#==============================================================================
+def ZonalStatistics(label_raster, value_rasters, value_names = None, statistics = ["count", "mean", "std", "min", "max"],
+                    n_processes = None, tile_rows = None):
+    """This gets statistics of one or more value rasters for every zone of a label raster.
+
+    Args:
+        label_raster (str): The filename (with path and extension) of the raster with the zones (integers), e.g. the _AllBasins.bil raster
+        value_rasters (str or list): The filenames of the rasters with the values
+        value_names (list): The names used in the columns for each value raster. Default is the name of the raster without the path and extension
+        statistics (list): Any of "count", "sum", "mean", "std", "min", "max", "median" and percentiles like "p10" or "p90".
+            The median and percentiles keep every value of the raster in memory, so they are not in the default list.
+        n_processes (int): The number of processes. Default is the number of CPUs. If 1 everything is done in this process.
+        tile_rows (int): The number of rows read at a time. Default is ZonalTileRows.
+
+    Returns:
+        pandas dataframe: with a "zone" column and a column called name_statistic for every value raster and
+        statistic. Zones without any data in a value raster have a count of 0 and NaN for the other statistics.
+    """
+    from multiprocessing import Pool, cpu_count
+
+    if not isinstance(value_rasters, (list, tuple)):
+        value_rasters = [value_rasters]
+    if value_names is None:
+        value_names = [os.path.splitext(os.path.basename(value_raster))[0] for value_raster in value_rasters]
+    if len(value_names) != len(value_rasters):
+        raise Exception("You need one name for each value raster")
+    percentiles = _ParsePercentiles(statistics)
+    if tile_rows is None:
+        tile_rows = ZonalTileRows
+
+    label_metadata = LSDMap_IO.GetRasterMetadata(label_raster)
+    value_offsets = [_GetGridOffset(label_metadata, LSDMap_IO.GetRasterMetadata(value_raster), value_raster)
+                     for value_raster in value_rasters]
+
+    n_rows = label_metadata["ysize"]
+    n_cols = label_metadata["xsize"]
+    jobs = [(label_raster, value_rasters, value_offsets, row_offset, min(tile_rows, n_rows-row_offset), n_cols, len(percentiles) > 0)
+            for row_offset in range(0, n_rows, tile_rows)]
+
+    start_time = time.time()
+    if n_processes is None:
+        n_processes = cpu_count()
+    n_processes = max(1, min(n_processes, len(jobs)))
+    if n_processes == 1:
+        tiles = [_ZonalStatisticsTile(job) for job in jobs]
+    else:
+        pool = Pool(n_processes)
+        try:
+            tiles = pool.map(_ZonalStatisticsTile, jobs, chunksize = 1)
+        except BaseException:
+            pool.terminate()
+            raise
+        else:
+            pool.close()
+        finally:
+            pool.join()
+    print("I reduced "+str(len(jobs))+" strips of "+label_raster+" in "+str(round(time.time()-start_time, 1))+" s")
+
+    zones = np.unique(np.concatenate([tile["zones"] for tile in tiles]))
+    df = pd.DataFrame({"zone": zones})
+    for i, value_name in enumerate(value_names):
+        result = _CombineZonalTiles([tile["values"][i] for tile in tiles], percentiles)
+        # line the zones with data up with all the zones
+        position = np.searchsorted(zones, result["zones"])
+        for stat in statistics:
+            if stat == "median":
+                this_stat = result[50.0]
+            elif stat.startswith("p"):
+                this_stat = result[float(stat[1:])]
+            else:
+                this_stat = result[stat]
+            if stat == "count":
+                column = np.zeros(zones.size, dtype = np.int64)
+            else:
+                column = np.full(zones.size, np.nan)
+            column[position] = this_stat
+            df[value_name+"_"+stat] = column
+
+    return df
+#==============================================================================
+
+#==============================================================================
+def ZonalStatisticsFromPolygons(polygon_file, value_rasters, zone_field = None, label_raster_name = None, **kwargs):
+    """This gets statistics of one or more value rasters for the polygons of a shapefile.
+    The polygons are rasterised on the grid of the first value raster, over the
+    extent of the shapefile only, and then ZonalStatistics is used.
+
+    Args:
+        polygon_file (str): The shapefile (or any vector file OGR can read) with the polygons
+        value_rasters (str or list): The filenames of the rasters with the values
+        zone_field (str): The (integer) field of the polygons that gives their zone. If None all the polygons are zone 1.
+        label_raster_name (str): If given, the rasterised polygons are kept in this GeoTIFF. Otherwise a temporary file is used.
+        kwargs: The other arguments of ZonalStatistics (value_names, statistics, n_processes, tile_rows)
+
+    Returns:
+        pandas dataframe: see ZonalStatistics
+    """
+    from osgeo import gdal, ogr
+    import tempfile
+
+    if exists(polygon_file) is False:
+        raise Exception('[Errno 2] No such file or directory: \'' + polygon_file + '\'')
+    if not isinstance(value_rasters, (list, tuple)):
+        value_rasters = [value_rasters]
+
+    shapes = ogr.Open(polygon_file)
+    layer = shapes.GetLayer()
+    XMin, XMax, YMin, YMax = layer.GetExtent()
+
+    # the window of the first value raster that covers the polygons
+    template = LSDMap_IO.GetRasterMetadata(value_rasters[0])
+    window = LSDMap_IO.GetRasterWindowFromExtent(value_rasters[0], [XMin, XMax, YMin, YMax])
+    GeoT = list(LSDMap_IO.GetRasterWindowExtent(value_rasters[0], window))
+    GeoT = (GeoT[0], template["GeoT"][1], 0, GeoT[3], 0, template["GeoT"][5])
+
+    NoDataValue = -9999
+    target_ds = gdal.GetDriverByName('MEM').Create('', window[2], window[3], 1, gdal.GDT_Int32)
+    target_ds.SetGeoTransform(GeoT)
+    target_ds.SetProjection(template["ProjectionWkt"])
+    band = target_ds.GetRasterBand(1)
+    band.SetNoDataValue(NoDataValue)
+    band.Fill(NoDataValue)
+    if zone_field is None:
+        gdal.RasterizeLayer(target_ds, [1], layer, burn_values = [1])
+    else:
+        gdal.RasterizeLayer(target_ds, [1], layer, options = ["ATTRIBUTE="+zone_field])
+    labels = band.ReadAsArray()
+    target_ds = None
+    shapes = None
+
+    keep_labels = label_raster_name is not None
+    if not keep_labels:
+        handle, label_raster_name = tempfile.mkstemp(suffix = ".tif")
+        os.close(handle)
+    try:
+        LSDMap_IO.WriteRaster(label_raster_name, labels, GeoT = GeoT, ProjectionWkt = template["ProjectionWkt"],
+                              driver_name = "GTiff", NoDataValue = NoDataValue, data_type = "Int32")
+        df = ZonalStatistics(label_raster_name, value_rasters, **kwargs)
+    finally:
+        if not keep_labels and exists(label_raster_name):
+            os.remove(label_raster_name)
+
+    return df
+#==============================================================================
@@ -17,6 +17,13 @@ from .LSDMap_Subplots import *
 from .LSDMap_OSystemTools import *
 from .LSDMap_PlottingDriver import *
 from .LSDMap_VectorTools import *
+from .LSDMap_RasterPyramid import *
+from .LSDMap_Hillshade import *
+from .LSDMap_TerrainDerivatives import *
+from .LSDMap_BatchPlotting import *
+from .LSDMap_BuildManifest import *
+from .LSDMap_ZonalStatistics import *
+from .LSDMap_Gridding import *
 from .adjust_text import *
 
 from . import colours as lsdcolours
@@ -1,7 +1,11 @@
 #fast_hillshade.pyx
 """
 This is a cython version of the nicer looking hillshade function in the
-LSDTopoTools core C++ libraries.
+LSDTopoTools core C++ libraries. It is used by LSDMap_Hillshade, which
+falls back to numpy if this hasn't been compiled (see setup_cython.py).
+
+Nodata pixels (NaN or NoDataValue) get NaN in the hillshade. Neighbours that
+are nodata or off the edge of the array are replaced by the centre pixel.
 
 @author dav
 """
@@ -9,7 +13,7 @@ LSDTopoTools core C++ libraries.
 # Cython rule of thumb no 1. If there are equivalent C-libraries for
 # numpy stuff, use them. (E.g. math functions)
 # Let's use the native C-libraries for math functions.
-from libc.math cimport sin, cos, sqrt, M_PI, atan, atan2
+from libc.math cimport sin, cos, sqrt, M_PI, atan, atan2, isnan, NAN
 
 import cython
 cimport cython
@@ -22,13 +26,28 @@ cimport numpy as np
 # Find out how many cores/CPUs we have available
 import multiprocessing
 cdef int num_threads_use = multiprocessing.cpu_count()
-print(num_threads_use)
 
 # Fix a data type for our arrays.
 DTYPE = np.float64
 # Define a compile type to DTYPE_t
 ctypedef np.float64_t DTYPE_t
 
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline DTYPE_t _neighbour(DTYPE_t[:, ::1] terrain, Py_ssize_t i, Py_ssize_t j,
+                               Py_ssize_t nrows, Py_ssize_t ncols, DTYPE_t centre,
+                               DTYPE_t NoDataValue) nogil:
+  # Missing neighbours (off the edge or nodata) take the centre value
+  cdef DTYPE_t value
+  if i < 0 or i >= nrows or j < 0 or j >= ncols:
+    return centre
+  value = terrain[i, j]
+  if isnan(value) or value == NoDataValue:
+    return centre
+  return value
+
+
 # Best to turn off these decorators if you are debugging
 # (Segfaults etc.)
 @cython.boundscheck(False)
@@ -36,18 +55,19 @@ ctypedef np.float64_t DTYPE_t
 @cython.nonecheck(False)
 @cython.cdivision(True)
 def Hillshade(np.ndarray[DTYPE_t, ndim=2] terrain_array,
-              float DataResolution, float azimuth = 315,
-              float angle_altitude = 45,
-              float NoDataValue = -9999, float z_factor = 1):
+              double DataResolution, double azimuth = 315,
+              double angle_altitude = 45,
+              double NoDataValue = -9999, double z_factor = 1):
   """Creates a hillshade raster
 
   Args:
       raster_array (numpy array): A numpy raster of your terrain
           e.g generated by LSDMap_GDALIO.ReadRasterArrayBlocks
+      DataResolution (float): The size of the pixels
       azimuth (float): Azimuth of sunlight
       angle_altitude (float): Angle altitude of sun
+      NoDataValue (float): The nodata value of the raster (NaN is always nodata)
       z_factor (float): z_factor
-      NoDataValue (float): The nodata value of the raster
 
   Returns:
       HSArray (numpy.array): The hillshade array
@@ -56,58 +76,56 @@ def Hillshade(np.ndarray[DTYPE_t, ndim=2] terrain_array,
       DAV, SWDG, SMM
 
   """
-  cdef unsigned int ncols = terrain_array.shape[1]
-  cdef unsigned int nrows = terrain_array.shape[0]
+  cdef DTYPE_t[:, ::1] terrain = np.ascontiguousarray(terrain_array, dtype=DTYPE)
+  cdef Py_ssize_t nrows = terrain.shape[0]
+  cdef Py_ssize_t ncols = terrain.shape[1]
 
-  # Ndarray best choice? Will revisit later...
-  cdef np.ndarray[DTYPE_t, ndim=2] HSarray = np.empty((ncols,nrows))
-  HSarray.fill(np.nan)
+  cdef np.ndarray[DTYPE_t, ndim=2] HSarray_np = np.empty((nrows, ncols), dtype=DTYPE)
+  cdef DTYPE_t[:, ::1] HSarray = HSarray_np
 
-  cdef float zenith_rad = (90 - angle_altitude) * M_PI / 180.0
-  cdef float azimuth_math = 360-azimuth + 90
+  cdef double zenith_rad = (90 - angle_altitude) * M_PI / 180.0
+  cdef double azimuth_math = 360-azimuth + 90
   if (azimuth_math >= 360.0):
     azimuth_math = azimuth_math - 360
-  cdef float azimuth_rad = azimuth_math * M_PI  / 180.0
+  cdef double azimuth_rad = azimuth_math * M_PI  / 180.0
 
-  cdef float slope_rad = 0
-  cdef float aspect_rad = 0
-  cdef float dzdx = 0
-  cdef float dzdy = 0
-  cdef int i = 0, j = 0
+  cdef double slope_rad, aspect_rad, dzdx, dzdy, hs
+  cdef DTYPE_t centre, nw, n, ne, w, e, sw, s, se
+  cdef Py_ssize_t i, j
 
   # We can safely turn off the Python Global Interpreter lock for these for loops
   with nogil, parallel(num_threads=num_threads_use):
     # OpenMP threads created for the outer loop.
-    for i in prange(nrows):
+    for i in prange(nrows, schedule='static'):
       for j in range(ncols):
-          if terrain_array[i, j] != NoDataValue:
-            dzdx = (((terrain_array[i, j+1] + 2*terrain_array[i+1, j] + terrain_array[i+1, j+1]) -
-                    (terrain_array[i-1, j-1] + 2*terrain_array[i-1, j] + terrain_array[i-1, j+1]))
-                    / (8 * DataResolution))
-            dzdy = (((terrain_array[i-1, j+1] + 2*terrain_array[i, j+1] + terrain_array[i+1, j+1]) -
-                    (terrain_array[i-1, j-1] + 2*terrain_array[i, j-1] + terrain_array[i+1, j-1]))
-                    / (8 * DataResolution))
-
-            slope_rad = atan(z_factor * sqrt((dzdx * dzdx) + (dzdy * dzdy)))
-
-            if (dzdx != 0):
-              aspect_rad = atan2(dzdy, (dzdx*-1))
-              if (aspect_rad < 0):
-                aspect_rad = 2 * M_PI + aspect_rad
-
-            else:
-              if (dzdy > 0):
-                aspect_rad = M_PI / 2
-              elif (dzdy < 0):
-                aspect_rad = 2 * M_PI - M_PI / 2
-              else:
-                aspect_rad = aspect_rad
-
-            HSarray[i, j] = 255.0 * ((cos(zenith_rad) * cos(slope_rad)) +
-                            (sin(zenith_rad) * sin(slope_rad) *
-                            cos(azimuth_rad - aspect_rad)))
-            # Necessary?
-            if (HSarray[i, j] < 0):
-              HSarray[i, j] = 0
-
-  return HSarray
+        centre = terrain[i, j]
+        if isnan(centre) or centre == NoDataValue:
+          HSarray[i, j] = NAN
+          continue
+
+        nw = _neighbour(terrain, i-1, j-1, nrows, ncols, centre, NoDataValue)
+        n = _neighbour(terrain, i-1, j, nrows, ncols, centre, NoDataValue)
+        ne = _neighbour(terrain, i-1, j+1, nrows, ncols, centre, NoDataValue)
+        w = _neighbour(terrain, i, j-1, nrows, ncols, centre, NoDataValue)
+        e = _neighbour(terrain, i, j+1, nrows, ncols, centre, NoDataValue)
+        sw = _neighbour(terrain, i+1, j-1, nrows, ncols, centre, NoDataValue)
+        s = _neighbour(terrain, i+1, j, nrows, ncols, centre, NoDataValue)
+        se = _neighbour(terrain, i+1, j+1, nrows, ncols, centre, NoDataValue)
+
+        dzdx = ((ne + 2*e + se) - (nw + 2*w + sw)) / (8 * DataResolution)
+        dzdy = ((sw + 2*s + se) - (nw + 2*n + ne)) / (8 * DataResolution)
+
+        slope_rad = atan(z_factor * sqrt((dzdx * dzdx) + (dzdy * dzdy)))
+
+        aspect_rad = atan2(dzdy, -dzdx)
+        if (aspect_rad < 0):
+          aspect_rad = 2 * M_PI + aspect_rad
+
+        hs = 255.0 * ((cos(zenith_rad) * cos(slope_rad)) +
+                      (sin(zenith_rad) * sin(slope_rad) *
+                      cos(azimuth_rad - aspect_rad)))
+        if (hs < 0):
+          hs = 0
+        HSarray[i, j] = hs
+
+  return HSarray_np
@@ -1,11 +1,13 @@
 from distutils.core import setup
 from distutils.extension import Extension
 from Cython.Build import cythonize
+import numpy
 
 ext_modules = [
     Extension(
         "fast_hillshade",
         ["fast_hillshade.pyx"],
+        include_dirs=[numpy.get_include()],
         extra_compile_args=['-fopenmp'],
         extra_link_args=['-fopenmp'],
     )
@@ -16,3 +18,5 @@ setup(
     ext_modules=cythonize(ext_modules),
 )
 # build with python setup_cython.py build_ext --inplace
+# (run it in this directory). LSDMap_Hillshade uses the compiled kernel
+# automatically once it is built.
@@ -51,6 +51,65 @@ def is_outlier(points, thresh=3.5):
 
     return modified_z_score > thresh
 
+def is_outlier_rows(points, thresh=3.5):
+    """
+    This does the same test as is_outlier on every row of a 2D array at once:
+    each row is treated as a separate set of 1D observations.
+
+    Args:
+        points (array): a 2D array where each row is a set of observations
+        thresh (float): The modified z-score to use as a threshold.
+
+    Returns:
+        A boolean array, the same shape as points, that is True for outliers
+    """
+    points = np.atleast_2d(np.asarray(points, dtype=float))
+    median = np.median(points, axis=1)[:, np.newaxis]
+    diff = np.abs(points - median)
+    med_abs_deviation = np.median(diff, axis=1)[:, np.newaxis]
+
+    # If MAD is 0 for a row, then there are no outliers in that row
+    safe_mad = np.where(med_abs_deviation == 0, 1.0, med_abs_deviation)
+    modified_z_score = np.where(med_abs_deviation == 0, 0.0, 0.6745 * diff / safe_mad)
+
+    return modified_z_score > thresh
+
+def grouped_is_outlier(df, data_column_name, group_columns, thresh=3.5):
+    """
+    This does the same test as is_outlier on a 1D column of a dataframe, but
+    separately for every group of the data (e.g. every basin or every source).
+    The medians and median absolute deviations of all the groups are calculated
+    with groupby reductions, so there is no loop over the groups.
+
+    Args:
+        df (pandas dataframe): The dataframe
+        data_column_name (str): The column to test for outliers
+        group_columns (str or list): The column(s) that define the groups
+        thresh (float): The modified z-score to use as a threshold.
+
+    Returns:
+        A boolean array, aligned with the rows of df, that is True for outliers.
+        Rows where the data or the group is NaN are not outliers.
+    """
+    if not isinstance(group_columns, (list, tuple)):
+        group_columns = [group_columns]
+
+    keys = [df[column] for column in group_columns]
+    data = df[data_column_name].astype(float)
+
+    median = data.groupby(keys).transform('median')
+    diff = (data - median).abs()
+    med_abs_deviation = diff.groupby(keys).transform('median')
+
+    # If MAD is 0 for a group, then there are no outliers in that group
+    diff = diff.values
+    med_abs_deviation = med_abs_deviation.values
+    is_outlier_mask = np.zeros(len(df), dtype=bool)
+    valid = med_abs_deviation > 0
+    is_outlier_mask[valid] = 0.6745 * diff[valid] / med_abs_deviation[valid] > thresh
+
+    return is_outlier_mask
+
 def add_outlier_column_to_PD(df, column = "none", threshold = "none"):
 
     """
@@ -267,6 +326,62 @@ def linregress_residuals(xdata,ydata):
         
     return (residuals,m,b,r,pvalue,stderr)
 
+def grouped_linregress(xdata, ydata, group_index, n_groups = None):
+    """
+    This does a least squares linear regression of every group of the data at
+    once. It uses the closed form sums of each group so there is no loop over
+    the groups. The results are the same as scipy.stats.linregress on each group.
+
+    Args:
+        xdata (array-like): The x data
+        ydata (array-like): The y data
+        group_index (array-like): an integer from 0 to n_groups-1 giving the group of each data point
+        n_groups (int): The number of groups. Default is max(group_index)+1
+
+    Returns:
+        slope, intercept, rvalue, pvalue, stderr, n: arrays with one value for each group.
+        Groups with fewer than two points or no spread in x get NaN.
+    """
+    xdata = np.asarray(xdata, dtype=float)
+    ydata = np.asarray(ydata, dtype=float)
+    group_index = np.asarray(group_index, dtype=np.intp)
+    if n_groups is None:
+        n_groups = group_index.max()+1 if group_index.size > 0 else 0
+
+    n = np.bincount(group_index, minlength=n_groups).astype(float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_mean = np.bincount(group_index, weights=xdata, minlength=n_groups)/n
+        y_mean = np.bincount(group_index, weights=ydata, minlength=n_groups)/n
+
+        # use the sums about the mean of each group, which are more accurate
+        dx = xdata - x_mean[group_index]
+        dy = ydata - y_mean[group_index]
+        ssxm = np.bincount(group_index, weights=dx*dx, minlength=n_groups)
+        ssym = np.bincount(group_index, weights=dy*dy, minlength=n_groups)
+        ssxym = np.bincount(group_index, weights=dx*dy, minlength=n_groups)
+
+        valid = (n >= 2) & (ssxm > 0)
+        slope = np.where(valid, ssxym/ssxm, np.nan)
+        intercept = y_mean - slope*x_mean
+
+        rvalue = np.where(ssym == 0, 0.0, ssxym/np.sqrt(ssxm*ssym))
+        rvalue = np.where(valid, np.clip(rvalue, -1.0, 1.0), np.nan)
+
+        # the same as scipy: the t-test for a slope of zero, with n-2 degrees of freedom
+        df = n - 2
+        t = rvalue*np.sqrt(df/((1.0-rvalue)*(1.0+rvalue)))
+        pvalue = 2*ss.t.sf(np.abs(t), np.where(df > 0, df, 1))
+        stderr = np.sqrt((1-rvalue*rvalue)*ssym/ssxm/df)
+
+    # with two points the line goes through both of them
+    two_points = valid & (n == 2)
+    pvalue = np.where(two_points, np.where(ssym == 0, 1.0, 0.0), pvalue)
+    stderr = np.where(two_points, 0.0, stderr)
+    pvalue = np.where(valid, pvalue, np.nan)
+    stderr = np.where(valid, stderr, np.nan)
+
+    return (slope, intercept, rvalue, pvalue, stderr, n)
+
 def remove_outlying_residuals(xdata,ydata,residuals):
     """
     This function removes data with outying residuals
@@ -337,28 +452,11 @@ def extract_outliers_by_header(df, data_column_name = "diff", header_for_group =
 
     ### Let's do it
 
-    # Output dataframe initialized as an integer, you'll see why later 
-    out_df = 0
-    for i in df[header_for_group].unique():
-        # I am grouping the dataset for each value of the header, for example each basins
-        tdf = df[df[header_for_group]==i]
-        tdfpositive = tdf[tdf["sign"] == 1]
-        tdfnegative = tdf[tdf["sign"] == -1]
-
-
-        # masking the outliers
-        maskpositive = is_outlier(tdfpositive[data_column_name].values, thresh = threshold)
-        masknegative = is_outlier(tdfnegative[data_column_name].values, thresh = threshold)
-        # Applying the mask
-        tdfpositive = tdfpositive[maskpositive]
-        tdfnegative = tdfnegative[masknegative]
-        tdf = pd.concat([tdfpositive,tdfnegative])
-        # Feeding the out dataset
-        
-        if(isinstance(out_df, int)):
-            out_df = tdf
-        else:
-            out_df = pd.concat([out_df,tdf])
+    # The positive and negative values of each group (for example each basin)
+    # are tested separately, all at once.
+    mask = grouped_is_outlier(df, data_column_name, [header_for_group, "sign"], thresh = threshold)
+    mask &= df["sign"].isin([1,-1]).values
+    out_df = df[mask]
     print("I selected %s outliers" %(out_df.shape[0]))
 
     return out_df
@@ -33,20 +33,10 @@ def readFile(filename):
     return xsize,ysize,geotransform,geoproj,Z
 
 def writeFile(filename,geotransform,geoprojection,data):
-    (x,y) = data.shape
-    format = "GTiff"
-    noDataValue = -9999
-    driver = gdal.GetDriverByName(format)
-    # you can change the dataformat but be sure to be able to store negative values including -9999
-    dst_datatype = gdal.GDT_Float32
-
-    #print(data)
-
-    dst_ds = driver.Create(filename,y,x,1,dst_datatype)
-    dst_ds.GetRasterBand(1).WriteArray(data)
-    dst_ds.GetRasterBand(1).SetNoDataValue( noDataValue )
-    dst_ds.SetGeoTransform(geotransform)
-    dst_ds.SetProjection(geoprojection)
+    # written as a tiled, compressed GeoTIFF with the smallest type that holds the
+    # data and the -9999 nodata value, e.g. Int16 for rasterised geology codes
+    LSDPT.WriteRaster(filename, data, GeoT = geotransform, ProjectionWkt = geoprojection,
+                      driver_name = "GTiff", NoDataValue = -9999)
     return 1
 
 
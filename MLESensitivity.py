@@ -17,6 +17,7 @@ import os
 from LSDPlottingTools import LSDMap_MOverNPlotting as MN
 from LSDMapFigure import PlottingHelpers as Helper
 from LSDPlottingTools import LSDMap_SAPlotting as SA
+from LSDPlottingTools import LSDMap_BatchPlotting as BP
 
 #=============================================================================
 # This is just a welcome screen that is displayed if no arguments are provided.
@@ -32,6 +33,107 @@ def print_welcome():
     print("   python MLESensitivity.py -h\n")
     print("=======================================================================\n\n ")
 
+#=============================================================================
+# This finds the sub-directories with the sensitivity results (sigma_X),
+# sorted by sigma
+#=============================================================================
+def get_sigma_directories(Directory):
+
+    MLE_str = "sigma_"
+    sigma_dirs = [d for d in os.listdir(Directory) if d.startswith(MLE_str) and os.path.isdir(os.path.join(Directory, d))]
+
+    def sigma_value(d):
+        try:
+            return (0, float(d[len(MLE_str):]))
+        except ValueError:
+            return (1, d)
+
+    return sorted(sigma_dirs, key=sigma_value)
+
+#=============================================================================
+# This gets the plotting calls for one sensitivity run. Each plot is a name
+# and a list of (function, args, kwargs). Every kind of plot is one task, even
+# if it is asked for by more than one flag (e.g. -PR and -ALL), so two tasks
+# never write the same file. The plots that read the m/n summary csv are in
+# the task that writes it, after it is written.
+# The chi plots are made with one process: the runs are already shared out
+# between processes.
+#=============================================================================
+def get_plot_calls(this_dir, args, these_basin_keys, movern, simple_format):
+
+    fname_prefix = args.fname_prefix
+    start_movern = movern["start_movern"]
+    d_movern = movern["d_movern"]
+    n_movern = movern["n_movern"]
+    m_args = dict(basin_list=these_basin_keys, start_movern=start_movern, d_movern=d_movern, n_movern=n_movern)
+
+    plot_names = []
+    plot_calls = {}
+    def add_call(plot_name, function, f_args, f_kwargs):
+        if plot_name not in plot_calls:
+            plot_names.append(plot_name)
+            plot_calls[plot_name] = []
+        # the same call asked for by two flags is only made once
+        if (function, f_args, f_kwargs) not in plot_calls[plot_name]:
+            plot_calls[plot_name].append((function, f_args, f_kwargs))
+
+    # the figure formats of the rasters, chi profiles and S-A plots
+    raster_formats = []
+    chi_profile_options = []
+    SA_options = []
+    if args.plot_rasters:
+        raster_formats.append(simple_format)
+    if args.plot_chi_profiles:
+        chi_profile_options.append(dict(FigFormat=simple_format, animate=args.animate, keep_pngs=args.keep_pngs))
+    if args.plot_SA_data:
+        SA_options.append(dict(FigFormat=simple_format, show_segments=args.show_SA_segments))
+    if args.all_movern_estimates:
+        raster_formats.append(args.FigFormat)
+        chi_profile_options.append(dict(FigFormat=args.FigFormat, animate=True, keep_pngs=True))
+        SA_options.append(dict(FigFormat=args.FigFormat, show_segments=True))
+        SA_options.append(dict(FigFormat=args.FigFormat, show_segments=False))
+
+    for FigFormat in raster_formats:
+        add_call("rasters", MN.MakeRasterPlotsBasins, (this_dir, fname_prefix, args.size_format, FigFormat), {})
+        for movern_method in ["Chi_full", "Chi_points", "SA"]:
+            add_call("rasters", MN.MakeRasterPlotsMOverN, (this_dir, fname_prefix, start_movern, n_movern, d_movern), dict(movern_method=movern_method, size_format=args.size_format, FigFormat=FigFormat))
+    if args.plot_basic_chi:
+        add_call("basic_chi", MN.MakePlotsWithMLEStats, (this_dir, fname_prefix), dict(m_args, n_processes=1))
+    for options in chi_profile_options:
+        add_call("chi_profiles", MN.MakeChiPlotsMLE, (this_dir, fname_prefix), dict(m_args, size_format=args.size_format, n_processes=1, **options))
+    if args.plot_chi_by_K:
+        add_call("chi_by_K", MN.MakeChiPlotsColouredByK, (this_dir, fname_prefix), dict(m_args, size_format=args.size_format, FigFormat=simple_format, animate=args.animate, keep_pngs=args.keep_pngs, n_processes=1))
+    if args.plot_chi_by_lith:
+        add_call("chi_by_lith", MN.MakeChiPlotsColouredByLith, (this_dir, fname_prefix), dict(m_args, size_format=args.size_format, FigFormat=simple_format, animate=args.animate, keep_pngs=args.keep_pngs, n_processes=1))
+    if args.plot_outliers:
+        add_call("outliers", MN.PlotProfilesRemovingOutliers, (this_dir, fname_prefix), dict(m_args))
+    if args.plot_MLE_movern:
+        add_call("MLE_movern", MN.PlotMLEWithMOverN, (this_dir, fname_prefix), dict(m_args, size_format=args.size_format, FigFormat=simple_format))
+    for options in SA_options:
+        add_call("SA", SA.SAPlotDriver, (this_dir, fname_prefix), dict(size_format=args.size_format, show_raw=args.show_SA_raw, basin_keys=these_basin_keys, **options))
+    if args.test_SA_regression:
+        add_call("SA_regression", SA.LinearRegressionRawDataByChannel, (this_dir, fname_prefix), dict(basin_list=these_basin_keys))
+    if args.plot_MCMC:
+        add_call("MCMC", MN.plot_MCMC_analysis, (this_dir, fname_prefix), dict(basin_list=these_basin_keys, FigFormat=simple_format, size_format=args.size_format))
+    if args.point_uncertainty:
+        add_call("point_uncertainty", MN.PlotMCPointsUncertainty, (this_dir, fname_prefix), dict(m_args, FigFormat=simple_format, size_format=args.size_format))
+
+    # the summary csv is written first, then the plots that read it
+    if args.plot_summary or args.all_movern_estimates:
+        add_call("summary", MN.CompareMOverNEstimatesAllMethods, (this_dir, fname_prefix), dict(m_args))
+    if args.plot_summary:
+        add_call("summary", MN.MakeMOverNSummaryPlot, (this_dir, fname_prefix), dict(m_args, FigFormat=simple_format, size_format=args.size_format, show_legend=args.show_legend))
+    if args.all_movern_estimates:
+        add_call("summary", MN.MakeMOverNSummaryPlot, (this_dir, fname_prefix), dict(m_args, FigFormat=args.FigFormat, size_format=args.size_format, show_legend=args.show_legend))
+    if args.plot_summary or args.all_movern_estimates:
+        add_call("summary", MN.MakeMOverNPlotOneMethod, (this_dir, fname_prefix), dict(m_args, FigFormat=args.FigFormat, size_format=args.size_format))
+    if args.plot_histogram:
+        add_call("summary", MN.MakeMOverNSummaryHistogram, (this_dir, fname_prefix), dict(m_args, FigFormat=simple_format, size_format=args.size_format, show_legend=args.show_legend))
+    if args.all_movern_estimates:
+        add_call("summary", MN.MakeMOverNSummaryHistogram, (this_dir, fname_prefix), dict(m_args, FigFormat=args.FigFormat, size_format=args.size_format, show_legend=args.show_legend))
+
+    return [(plot_name, plot_calls[plot_name]) for plot_name in plot_names]
+
 #=============================================================================
 # This is the main function that runs the whole thing
 #=============================================================================
@@ -77,6 +179,10 @@ def main(argv):
     parser.add_argument("-size", "--size_format", type=str, default='ESURF', help="Set the size format for the figure. Can be 'big' (16 inches wide), 'geomorphology' (6.25 inches wide), or 'ESURF' (4.92 inches wide) (defualt esurf).")
     parser.add_argument("-animate", "--animate", type=bool, default=True, help="If this is true I will create an animation of the chi plots. Must be used with the -PC flag set to True.")
     parser.add_argument("-keep_pngs", "--keep_pngs", type=bool, default=False, help="If this is true I will delete the png files when I animate the figures. Must be used with the -animate flag set to True.")
+
+    # These control how the runs are processed
+    parser.add_argument("-n_proc", "--n_processes", type=int, default=None, help="The number of processes used to make the plots. Each plot of each sigma directory is done by one process. Default is the number of CPUs.")
+    parser.add_argument("-report", "--report_name", type=str, default="", help="The name of the json file with the timings and failures of each plot. Default is fname_prefix_sensitivity_run.json in the base directory.")
     args = parser.parse_args()
 
     if not args.fname_prefix:
@@ -101,85 +207,63 @@ def main(argv):
         print("The basins I will plot are:")
         print(these_basin_keys)
 
-    # get the range of moverns, needed for plotting
-    BasinDF = Helper.ReadBasinStatsCSV(Directory+"/sigma_10/", args.fname_prefix)
+    # some formatting for the figures
+    if args.FigFormat == "manuscipt_svg":
+        simple_format = "svg"
+    elif args.FigFormat == "manuscript_png":
+        simple_format = "png"
+    else:
+        simple_format = args.FigFormat
+
+    # find the sub-directories with the sensitivity results
+    sigma_dirs = get_sigma_directories(Directory)
+    if len(sigma_dirs) == 0:
+        print("I didn't find any sigma_ directories in "+Directory)
+        sys.exit()
+    print("The sensitivity runs are: ")
+    print(sigma_dirs)
+
+    # get the range of moverns, needed for plotting. All the runs use the same m/n values
+    BasinDF = Helper.ReadBasinStatsCSV(Directory+"/"+sigma_dirs[0]+"/", args.fname_prefix)
     # we need the column headers
     columns = BasinDF.columns[BasinDF.columns.str.contains('m_over_n')].tolist()
     moverns = [float(x.split("=")[-1]) for x in columns]
     start_movern = moverns[0]
     n_movern = len(moverns)
     d_movern = (moverns[-1] - moverns[0])/(n_movern-1)
+    movern = {"start_movern": start_movern, "d_movern": d_movern, "n_movern": n_movern}
 
-    # loop through each sub-directory with the sensitivity results
-    MLE_str = "sigma_"
-    for subdir, dirs, files in os.walk(Directory):
-        for dir in dirs:
-            if MLE_str in dir:
-                this_dir = Directory+"/"+dir+'/'
-                # make the plots depending on your choices
-                # make the plots depending on your choices
-                if args.plot_rasters:
-                    MN.MakeRasterPlotsBasins(this_dir, args.fname_prefix, args.size_format, simple_format)
-                    MN.MakeRasterPlotsMOverN(this_dir, args.fname_prefix, start_movern, n_movern, d_movern, size_format=args.size_format, FigFormat=simple_format)
-                    MN.MakeRasterPlotsMOverN(this_dir, args.fname_prefix, start_movern, n_movern, d_movern, movern_method="Chi_points", size_format=args.size_format, FigFormat=simple_format)
-                    MN.MakeRasterPlotsMOverN(this_dir, args.fname_prefix, start_movern, n_movern, d_movern, movern_method="SA", size_format=args.size_format, FigFormat=simple_format)
-                if args.plot_basic_chi:
-                    MN.MakePlotsWithMLEStats(this_dir, args.fname_prefix, basin_list=these_basin_keys, start_movern=start_movern, d_movern=d_movern, n_movern=n_movern)
-                if args.plot_chi_profiles:
-                    MN.MakeChiPlotsMLE(this_dir, args.fname_prefix, basin_list=these_basin_keys, start_movern=start_movern, d_movern=d_movern, n_movern=n_movern, size_format=args.size_format, FigFormat = simple_format, animate=args.animate, keep_pngs=args.keep_pngs)
-                if args.plot_chi_by_K:
-                    MN.MakeChiPlotsColouredByK(this_dir, args.fname_prefix, basin_list=these_basin_keys, start_movern=start_movern, d_movern=d_movern, n_movern=n_movern, size_format=args.size_format, FigFormat=simple_format, animate=args.animate, keep_pngs=args.keep_pngs)
-                if args.plot_chi_by_lith:
-                    MN.MakeChiPlotsColouredByLith(this_dir, args.fname_prefix, basin_list=these_basin_keys, start_movern=start_movern, d_movern=d_movern, n_movern=n_movern, size_format=args.size_format, FigFormat=simple_format, animate=args.animate, keep_pngs=args.keep_pngs)
-                if args.plot_outliers:
-                    MN.PlotProfilesRemovingOutliers(this_dir, args.fname_prefix, basin_list=these_basin_keys, start_movern=start_movern, d_movern=d_movern, n_movern=n_movern)
-                if args.plot_MLE_movern:
-                    MN.PlotMLEWithMOverN(this_dir, args.fname_prefix,basin_list=these_basin_keys, start_movern=start_movern, d_movern=d_movern, n_movern=n_movern, size_format=args.size_format, FigFormat =simple_format)
-                if args.plot_SA_data:
-                    SA.SAPlotDriver(this_dir, args.fname_prefix, FigFormat = simple_format,size_format=args.size_format,
-                                    show_raw = args.show_SA_raw, show_segments = args.show_SA_segments,basin_keys = these_basin_keys)
-                if args.test_SA_regression:
-                    #SA.TestSARegression(this_dir, args.fname_prefix)
-                    SA.LinearRegressionRawDataByChannel(this_dir,args.fname_prefix, basin_list=these_basin_keys)
-                    #SA.LinearRegressionSegmentedData(this_dir, args.fname_prefix, basin_list=these_basin_keys)
-                if args.plot_MCMC:
-                    MN.plot_MCMC_analysis(this_dir, args.fname_prefix,basin_list=these_basin_keys, FigFormat= simple_format, size_format=args.size_format)
-                if args.point_uncertainty:
-                    MN.PlotMCPointsUncertainty(this_dir, args.fname_prefix,basin_list=these_basin_keys, FigFormat=simple_format, size_format=args.size_format,start_movern=start_movern, d_movern=d_movern, n_movern=n_movern)
-                if args.plot_histogram:
-                    MN.MakeMOverNSummaryHistogram(this_dir, args.fname_prefix,basin_list=these_basin_keys,start_movern=start_movern, d_movern=d_movern, n_movern=n_movern, FigFormat=simple_format, size_format=args.size_format, show_legend=args.show_legend)
-                if args.plot_summary:
-                    MN.CompareMOverNEstimatesAllMethods(this_dir, args.fname_prefix, basin_list=these_basin_keys, start_movern=start_movern, d_movern=d_movern, n_movern=n_movern)
-                    MN.MakeMOverNSummaryPlot(this_dir, args.fname_prefix, basin_list=these_basin_keys,start_movern=start_movern, d_movern=d_movern, n_movern=n_movern, FigFormat = simple_format,size_format=args.size_format, show_legend=args.show_legend)
-                    MN.MakeMOverNPlotOneMethod(this_dir,args.fname_prefix,basin_list=these_basin_keys,start_movern=start_movern,d_movern=d_movern,n_movern=n_movern,FigFormat=args.FigFormat,size_format=args.size_format)
-                # if args.basin_joyplot:
-                #     MN.CompareMOverNEstimatesAllMethods(this_dir, args.fname_prefix, basin_list=these_basin_keys, start_movern=start_movern, d_movern=d_movern, n_movern=n_movern)
-                #     MN.MakeBasinJoyplot(this_dir, args.fname_prefix, basin_list=these_basin_keys, FigFormat=simple_format, size_format=args.size_format)
-                if args.all_movern_estimates:
-                    # plot the rasters
-                    MN.MakeRasterPlotsBasins(this_dir, args.fname_prefix, args.size_format, args.FigFormat)
-                    MN.MakeRasterPlotsMOverN(this_dir, args.fname_prefix, start_movern, n_movern, d_movern, movern_method="Chi_full", size_format=args.size_format, FigFormat=args.FigFormat)
-                    MN.MakeRasterPlotsMOverN(this_dir, args.fname_prefix, start_movern, n_movern, d_movern, movern_method="Chi_points", size_format=args.size_format, FigFormat=args.FigFormat)
-                    MN.MakeRasterPlotsMOverN(this_dir, args.fname_prefix, start_movern, n_movern, d_movern, movern_method="SA", size_format=args.size_format, FigFormat=args.FigFormat)
-
-                    # make the chi plots
-                    MN.MakeChiPlotsMLE(this_dir, args.fname_prefix, basin_list=these_basin_keys, start_movern=start_movern, d_movern=d_movern, n_movern=n_movern, size_format=args.size_format, FigFormat = args.FigFormat, animate=True, keep_pngs=True)
-
-                    # make the SA plots
-                    SA.SAPlotDriver(this_dir, args.fname_prefix, FigFormat = args.FigFormat,size_format=args.size_format,
-                                    show_raw = args.show_SA_raw, show_segments = True, basin_keys = these_basin_keys)
-                    SA.SAPlotDriver(this_dir, args.fname_prefix, FigFormat = args.FigFormat,size_format=args.size_format,
-                                    show_raw = args.show_SA_raw, show_segments = False, basin_keys = these_basin_keys)
-
-                    #summary plots
-                    MN.CompareMOverNEstimatesAllMethods(this_dir, args.fname_prefix, basin_list=these_basin_keys, start_movern=start_movern, d_movern=d_movern, n_movern=n_movern)
-                    MN.MakeMOverNSummaryPlot(this_dir, args.fname_prefix, basin_list=these_basin_keys,start_movern=start_movern, d_movern=d_movern, n_movern=n_movern, FigFormat = args.FigFormat,size_format=args.size_format, show_legend=args.show_legend)
-                    #joyplot
-                    MN.MakeMOverNPlotOneMethod(this_dir,args.fname_prefix,basin_list=these_basin_keys,start_movern=start_movern,d_movern=d_movern,n_movern=n_movern,FigFormat=args.FigFormat,size_format=args.size_format)
-                    MN.MakeMOverNSummaryHistogram(this_dir, args.fname_prefix,basin_list=these_basin_keys,start_movern=start_movern, d_movern=d_movern, n_movern=n_movern, FigFormat=args.FigFormat, size_format=args.size_format, show_legend=args.show_legend)
+    # First make the binary copies of the csv files, so that the plotting tasks
+    # only ever read them and never write the same copy at once
+    cache_tasks = []
+    for sigma_dir in sigma_dirs:
+        this_dir = Directory+"/"+sigma_dir+"/"
+        for fname in sorted(os.listdir(this_dir)):
+            if fname.startswith(args.fname_prefix) and fname.endswith(".csv"):
+                cache_tasks.append({"name": sigma_dir+"/"+fname, "directory": sigma_dir, "plot": "csv_cache",
+                                    "calls": [(Helper.ReadCSVCached, (this_dir+fname,), {})]})
+    records = BP.RunTaskPool(cache_tasks, n_processes=args.n_processes)
+
+    # Now each plot of each run is a task
+    plot_tasks = []
+    for sigma_dir in sigma_dirs:
+        this_dir = Directory+"/"+sigma_dir+"/"
+        for plot_name, calls in get_plot_calls(this_dir, args, these_basin_keys, movern, simple_format):
+            plot_tasks.append({"name": sigma_dir+"/"+plot_name, "directory": sigma_dir, "plot": plot_name, "calls": calls})
+    records += BP.RunTaskPool(plot_tasks, n_processes=args.n_processes)
 
     # collate all the results to get the final figure
-    MN.PlotSensitivityResultsSigma(Directory, args.fname_prefix,FigFormat=args.FigFormat,size_format=args.size_format,movern_method='points')
+    records += BP.RunTaskPool([{"name": "sensitivity_sigma", "directory": "", "plot": "sensitivity_sigma",
+                                "calls": [(MN.PlotSensitivityResultsSigma, (Directory, args.fname_prefix),
+                                           dict(FigFormat=args.FigFormat,size_format=args.size_format,movern_method='points'))]}],
+                              n_processes=1)
+
+    if args.report_name:
+        report_name = args.report_name
+    else:
+        report_name = Directory+"/"+args.fname_prefix+"_sensitivity_run.json"
+    BP.WriteRunReport(report_name, records, base_directory=Directory, fname_prefix=args.fname_prefix,
+                      sigma_directories=sigma_dirs, n_processes=args.n_processes, arguments=vars(args))
 
 #=============================================================================
 if __name__ == "__main__":
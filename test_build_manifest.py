@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of LSDMap_BuildManifest: a data file written by a step is an input of
+the steps after it, so remaking it remakes them, and unchanged steps are
+skipped.
+
+Run with: python -m unittest test_build_manifest
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from LSDPlottingTools import LSDMap_BuildManifest as BM
+
+
+def _Write(file_name, text):
+    with open(file_name, "w") as f:
+        f.write(text)
+
+
+def _Read(file_name):
+    with open(file_name, "r") as f:
+        return f.read()
+
+
+def MakeSummary(DataDirectory, fname_prefix):
+    """A step that writes a summary csv from the data."""
+    data = _Read(os.path.join(DataDirectory, fname_prefix+"_data.csv"))
+    _Write(os.path.join(DataDirectory, fname_prefix+"_summary.csv"), data+"summary\n")
+
+
+def PlotSummary(DataDirectory, fname_prefix):
+    """A step that plots the summary csv."""
+    summary = _Read(os.path.join(DataDirectory, fname_prefix+"_summary.csv"))
+    _Write(os.path.join(DataDirectory, fname_prefix+"_summary.png"), summary)
+
+
+class TestBuildManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.DataDirectory = tempfile.mkdtemp()
+        _Write(os.path.join(self.DataDirectory, "test_data.csv"), "a,b\n1,2\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.DataDirectory)
+
+    def _Build(self):
+        build = BM.BuildManifest(self.DataDirectory, "test")
+        build.Run(MakeSummary, self.DataDirectory, "test")
+        build.Run(PlotSummary, self.DataDirectory, "test")
+        return build
+
+    def test_unchanged_steps_are_skipped(self):
+        build = self._Build()
+        self.assertEqual((build.n_run, build.n_skipped), (2, 0))
+        build = self._Build()
+        self.assertEqual((build.n_run, build.n_skipped), (0, 2))
+
+    def test_remade_output_remakes_later_steps(self):
+        self._Build()
+        _Write(os.path.join(self.DataDirectory, "test_data.csv"), "a,b\n1,2\n3,4\n")
+        build = self._Build()
+        self.assertEqual((build.n_run, build.n_skipped), (2, 0))
+        self.assertEqual(_Read(os.path.join(self.DataDirectory, "test_summary.png")),
+                         "a,b\n1,2\n3,4\nsummary\n")
+
+    def test_summary_is_an_input_of_the_plot(self):
+        build = self._Build()
+        plot_step = [step for step in build.steps.values() if step["name"] == "PlotSummary"][0]
+        summary_step = [step for step in build.steps.values() if step["name"] == "MakeSummary"][0]
+        summary_file = os.path.join(self.DataDirectory, "test_summary.csv")
+        self.assertIn(summary_file, plot_step["inputs"])
+        self.assertNotIn(summary_file, summary_step["inputs"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the lattice detection in LSDMap_Gridding: points that fill a regular
+lattice go straight into their pixels, points on a lattice with missing nodes
+are gridded with the method you ask for.
+
+Run with: python -m unittest test_gridding
+"""
+import unittest
+import numpy as np
+from LSDPlottingTools import LSDMap_Gridding as Grid
+
+
+def _Lattice(nrows, ncols, spacing):
+    """The x, y of the nodes of a lattice and a plane z = x + 2y on them."""
+    cols, rows = np.meshgrid(np.arange(ncols), np.arange(nrows))
+    x = (cols+0.5)*spacing
+    y = (nrows-rows-0.5)*spacing
+    return rows, cols, x, y, x+2*y
+
+
+class TestLatticeGridding(unittest.TestCase):
+
+    def test_full_lattice_is_complete(self):
+        rows, cols, x, y, z = _Lattice(6, 5, 10.0)
+        lattice = Grid.DetectRegularLattice(x.ravel(), y.ravel())
+        self.assertIsNotNone(lattice)
+        self.assertTrue(lattice["complete"])
+        self.assertEqual(lattice["shape"], (6, 5))
+
+        grid, GeoT = Grid.GridPoints(x.ravel(), y.ravel(), z.ravel(), method = "linear")
+        self.assertEqual(grid.shape, (6, 5))
+        self.assertTrue(np.allclose(grid, z))
+
+    def test_partial_lattice_uses_the_method(self):
+        # a checkerboard, like the staggered rows of a hexagonal mesh
+        rows, cols, x, y, z = _Lattice(6, 6, 10.0)
+        on_mesh = ((rows+cols) % 2 == 0).ravel()
+        x, y, z = x.ravel(), y.ravel(), z.ravel()
+        lattice = Grid.DetectRegularLattice(x[on_mesh], y[on_mesh])
+        self.assertIsNotNone(lattice)
+        self.assertFalse(lattice["complete"])
+
+        expected = (x+2*y).reshape(6, 6)
+        grid, GeoT = Grid.GridPoints(x[on_mesh], y[on_mesh], z[on_mesh], method = "linear")
+        self.assertEqual(grid.shape, (6, 6))
+        # the nodes with no point are interpolated, not left empty
+        self.assertFalse(np.isnan(grid[1:5, 1:5]).any())
+        self.assertTrue(np.allclose(grid[1:5, 1:5], expected[1:5, 1:5]))
+
+        grid, GeoT = Grid.GridPoints(x[on_mesh], y[on_mesh], z[on_mesh], method = "nearest")
+        self.assertFalse(np.isnan(grid).any())
+
+
+if __name__ == '__main__':
+    unittest.main()
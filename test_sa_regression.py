@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the grouped slope-area regression in LSDMap_SAPlotting: the groups
+come back in the order of the basin list, and rows without a basin key are
+left out.
+
+Run with: python -m unittest test_sa_regression
+"""
+import unittest
+import numpy as np
+import pandas as pd
+from LSDPlottingTools import LSDMap_SAPlotting as SA
+
+
+def _SAData(basin_slopes, n_points = 20, seed = 1):
+    """Slope-area data where log S = slope * log A + 1 in every basin, shuffled."""
+    rng = np.random.RandomState(seed)
+    frames = []
+    for basin_key, slope in basin_slopes.items():
+        area = 10**rng.uniform(3, 7, n_points)
+        frames.append(pd.DataFrame({"basin_key": basin_key, "drainage_area": area,
+                                    "slope": 10**(slope*np.log10(area)+1)}))
+    df = pd.concat(frames, ignore_index=True)
+    return df.iloc[rng.permutation(len(df))].reset_index(drop=True)
+
+
+class TestGroupedLinearRegression(unittest.TestCase):
+
+    def test_basin_order_and_nan_keys(self):
+        basin_slopes = {0: -0.3, 1: -0.45, 2: -0.6, 3: -0.5}
+        df = _SAData(basin_slopes)
+        # some rows without a basin key
+        df["basin_key"] = df["basin_key"].astype(float)
+        df.loc[::7, "basin_key"] = np.nan
+
+        basin_list = [2, 0, 3, 1, 7]
+        OutDF = SA.GroupedLinearRegression(df, "basin_key", group_order = basin_list)
+
+        self.assertEqual(OutDF["basin_key"].tolist(), basin_list)
+        for basin_key, slope, n_points in zip(basin_list, OutDF["regression_slope"], OutDF["n_points"]):
+            if basin_key in basin_slopes:
+                self.assertAlmostEqual(slope, basin_slopes[basin_key])
+                self.assertEqual(n_points, np.sum(df["basin_key"] == basin_key))
+            else:
+                # a basin with no data
+                self.assertTrue(np.isnan(slope))
+                self.assertEqual(n_points, 0)
+
+    def test_several_group_columns(self):
+        df = _SAData({0: -0.3, 1: -0.45})
+        df["source_key"] = (np.arange(len(df)) % 2)+10*df["basin_key"]
+        OutDF = SA.GroupedLinearRegression(df, ["basin_key", "source_key"], group_order = [1, 0])
+        self.assertEqual(OutDF["basin_key"].tolist(), [1, 1, 0, 0])
+        self.assertTrue(np.allclose(OutDF["regression_slope"], [-0.45, -0.45, -0.3, -0.3]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the multidirectional hillshade in LSDMap_TerrainDerivatives: each sun
+is weighted by sin^2(aspect-azimuth), as in GDAL.
+
+Run with: python -m unittest test_terrain_derivatives
+"""
+import unittest
+import numpy as np
+from LSDPlottingTools import LSDMap_TerrainDerivatives as TD
+
+
+def _PlaneShade(slope, aspect, azimuth, angle_altitude):
+    """The hillshade of a plane, worked out from the angle between the sun and the slope."""
+    zenith = np.radians(90-angle_altitude)
+    slope_angle = np.arctan(slope)
+    shade = 255.0*(np.cos(zenith)*np.cos(slope_angle) +
+                   np.sin(zenith)*np.sin(slope_angle)*np.cos(np.radians(azimuth-aspect)))
+    return max(shade, 0)
+
+
+class TestMultidirectionalHillshade(unittest.TestCase):
+
+    def test_weights_on_a_plane(self):
+        # a plane sloping down to the south at 0.5 m/m
+        resolution = 10.0
+        gradient = 0.5
+        rows, cols = np.mgrid[0:9, 0:9]
+        terrain = 1000.0-rows*resolution*gradient
+
+        results = TD.TerrainDerivativesArray(terrain, resolution, ["aspect", "multidirectional_hillshade"],
+                                             angle_altitude = 45)
+        self.assertTrue(np.allclose(results["aspect"][1:-1, 1:-1], 180))
+
+        weights = [np.sin(np.radians(180-azimuth))**2 for azimuth in TD.MultidirectionalAzimuths]
+        shades = [_PlaneShade(gradient, 180, azimuth, 45) for azimuth in TD.MultidirectionalAzimuths]
+        expected = np.dot(weights, shades)/np.sum(weights)
+
+        # the sun from the north shines straight away from the slope and has no weight
+        self.assertAlmostEqual(weights[-1], 0)
+        self.assertTrue(np.allclose(results["multidirectional_hillshade"][1:-1, 1:-1], expected))
+
+
+if __name__ == '__main__':
+    unittest.main()